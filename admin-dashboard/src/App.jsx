@@ -6,6 +6,7 @@ import Dashboard from '@/components/Dashboard'
 import UsersManagement from '@/components/UsersManagement'
 import SystemStats from '@/components/SystemStats'
 import Settings from '@/components/Settings'
+import { useAdminEvents } from '@/hooks/use-admin-events'
 import './App.css'
 
 function App() {
@@ -22,7 +23,8 @@ function App() {
 
   const loadSystemStats = async () => {
     try {
-      const response = await fetch(`${API_BASE}/admin/stats`)
+      // Resumo agregado (estatísticas + usuários recentes) em uma única requisição
+      const response = await fetch(`${API_BASE}/admin/overview`)
       if (response.ok) {
         const data = await response.json()
         setSystemStats(data)
@@ -34,6 +36,43 @@ function App() {
     }
   }
 
+  // Aplica um delta às estatísticas sem consultar o servidor
+  const updateStats = (apply) => {
+    setSystemStats(prev => {
+      if (!prev) return prev
+      const next = {
+        ...prev,
+        users: { ...prev.users },
+        tokens: { ...prev.tokens },
+        activity: { ...prev.activity }
+      }
+      apply(next)
+      next.tokens.total_remaining = next.tokens.total_distributed - next.tokens.total_used
+      return next
+    })
+  }
+
+  // Eventos ao vivo do proxy (sem polling)
+  useAdminEvents(API_BASE, {
+    'usage.settled': ({ tokens_used }) => updateStats(stats => {
+      stats.tokens.total_used += tokens_used
+      stats.activity.transactions_today += 1
+    }),
+    'user.created': ({ user }) => updateStats(stats => {
+      stats.users.total += 1
+      if (user.is_active) stats.users.active += 1
+      stats.tokens.total_distributed += user.total_tokens
+    }),
+    'user.blocked': () => updateStats(stats => {
+      stats.users.blocked += 1
+    }),
+    'tokens.granted': ({ tokens, unblocked }) => updateStats(stats => {
+      stats.tokens.total_distributed += tokens
+      if (unblocked) stats.users.blocked -= 1
+    }),
+    'stats.resync': () => loadSystemStats()
+  })
+
   const renderCurrentPage = () => {
     switch (currentPage) {
       case 'dashboard':
@@ -14,6 +14,7 @@ import { Button } from '@/components/ui/button'
 import { Badge } from '@/components/ui/badge'
 import { Progress } from '@/components/ui/progress'
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer, BarChart, Bar } from 'recharts'
+import { useAdminEvents } from '@/hooks/use-admin-events'
 
 const Dashboard = ({ apiBase, systemStats, onRefresh }) => {
   const [recentUsers, setRecentUsers] = useState([])
@@ -21,22 +22,26 @@ const Dashboard = ({ apiBase, systemStats, onRefresh }) => {
   const [usageData, setUsageData] = useState([])
 
   useEffect(() => {
-    loadRecentUsers()
     generateMockUsageData()
   }, [])
 
-  const loadRecentUsers = async () => {
-    try {
-      const response = await fetch(`${apiBase}/admin/users?per_page=5`)
-      if (response.ok) {
-        const data = await response.json()
-        setRecentUsers(data.users || [])
-      }
-    } catch (error) {
-      console.error('Erro ao carregar usuários recentes:', error)
-    }
+  // Usuários recentes chegam junto com o resumo (/admin/overview)
+  useEffect(() => {
+    setRecentUsers(systemStats?.recent_users || [])
+  }, [systemStats?.recent_users])
+
+  // Atualiza os usuários exibidos a partir dos eventos ao vivo
+  const updateRecentUser = ({ user }) => {
+    setRecentUsers(prev => prev.map(item => item.id === user.id ? user : item))
   }
 
+  useAdminEvents(apiBase, {
+    'usage.settled': updateRecentUser,
+    'user.blocked': updateRecentUser,
+    'tokens.granted': updateRecentUser,
+    'user.created': ({ user }) => setRecentUsers(prev => [user, ...prev].slice(0, 5))
+  })
+
   const generateMockUsageData = () => {
     // Dados simulados para o gráfico
     const data = []
@@ -59,7 +64,6 @@ const Dashboard = ({ apiBase, systemStats, onRefresh }) => {
   const handleRefresh = async () => {
     setLoading(true)
     await onRefresh()
-    await loadRecentUsers()
     setLoading(false)
   }
 
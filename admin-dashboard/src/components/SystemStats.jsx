@@ -26,41 +26,24 @@ import {
   Cell
 } from 'recharts'
 
+// Cores das linhas por modelo
+const MODEL_COLORS = ['#3b82f6', '#10b981', '#8b5cf6', '#f59e0b', '#ef4444', '#06b6d4']
+
+const RANGE_DAYS = { '7d': 7, '30d': 30, '90d': 90 }
+
 const SystemStats = ({ apiBase, systemStats }) => {
   const [loading, setLoading] = useState(false)
   const [timeRange, setTimeRange] = useState('7d')
   const [chartData, setChartData] = useState([])
+  const [modelSeries, setModelSeries] = useState([])
+  const [totals, setTotals] = useState({ tokens: 0, cost_usd: 0, requests: 0 })
   const [userDistribution, setUserDistribution] = useState([])
 
   useEffect(() => {
-    generateMockData()
+    loadTimeseries()
   }, [timeRange])
 
-  const generateMockData = () => {
-    // Dados simulados para demonstração
-    const days = timeRange === '7d' ? 7 : timeRange === '30d' ? 30 : 90
-    const data = []
-    const today = new Date()
-    
-    for (let i = days - 1; i >= 0; i--) {
-      const date = new Date(today)
-      date.setDate(date.getDate() - i)
-      
-      data.push({
-        date: date.toLocaleDateString('pt-BR', { 
-          day: '2-digit', 
-          month: '2-digit',
-          ...(days > 30 && { year: '2-digit' })
-        }),
-        tokens_used: Math.floor(Math.random() * 5000) + 2000,
-        new_users: Math.floor(Math.random() * 10) + 2,
-        active_users: Math.floor(Math.random() * 50) + 20,
-        revenue: Math.floor(Math.random() * 500) + 200
-      })
-    }
-    
-    setChartData(data)
-
+  useEffect(() => {
     // Distribuição de usuários por status
     if (systemStats) {
       setUserDistribution([
@@ -69,13 +52,51 @@ const SystemStats = ({ apiBase, systemStats }) => {
         { name: 'Inativos', value: systemStats.users.total - systemStats.users.active - systemStats.users.blocked, color: '#6b7280' }
       ])
     }
+  }, [systemStats])
+
+  const formatTimestamp = (timestamp) => {
+    const date = new Date(`${timestamp}Z`)
+    return date.toLocaleString('pt-BR', {
+      day: '2-digit',
+      month: '2-digit',
+      ...(timeRange === '7d' && { hour: '2-digit', minute: '2-digit' })
+    })
+  }
+
+  const loadTimeseries = async () => {
+    // Série já agregada e reduzida no servidor (uma consulta, ~120 pontos)
+    setLoading(true)
+    try {
+      const start = new Date(Date.now() - RANGE_DAYS[timeRange] * 24 * 60 * 60 * 1000)
+      const params = new URLSearchParams({
+        start_date: start.toISOString().slice(0, 19),
+        points: '120'
+      })
+      const response = await fetch(`${apiBase}/admin/usage/timeseries?${params}`)
+      if (response.ok) {
+        const data = await response.json()
+        setChartData(data.total.points.map((point) => ({
+          ...point,
+          date: formatTimestamp(point.timestamp),
+          time: new Date(`${point.timestamp}Z`).getTime()
+        })))
+        setModelSeries(data.models.map((serie) => ({
+          ...serie,
+          points: serie.points.map((point) => ({ ...point, time: new Date(`${point.timestamp}Z`).getTime() }))
+        })))
+        setTotals(data.total.totals)
+      }
+    } catch (error) {
+      console.error('Erro ao carregar série temporal:', error)
+    } finally {
+      setLoading(false)
+    }
   }
 
   const handleExport = () => {
-    // Simula exportação de dados
     const csvContent = "data:text/csv;charset=utf-8," + 
-      "Data,Tokens Usados,Novos Usuários,Usuários Ativos,Receita\n" +
-      chartData.map(row => `${row.date},${row.tokens_used},${row.new_users},${row.active_users},${row.revenue}`).join("\n")
+      "Data,Tokens Usados,Requisições,Custo (USD)\n" +
+      chartData.map(row => `${row.timestamp},${row.tokens},${row.requests},${row.cost_usd}`).join("\n")
     
     const encodedUri = encodeURI(csvContent)
     const link = document.createElement("a")
@@ -93,10 +114,7 @@ const SystemStats = ({ apiBase, systemStats }) => {
     return previous > 0 ? ((current - previous) / previous * 100) : 0
   }
 
-  const totalTokensUsed = chartData.reduce((sum, item) => sum + item.tokens_used, 0)
-  const totalNewUsers = chartData.reduce((sum, item) => sum + item.new_users, 0)
-  const totalRevenue = chartData.reduce((sum, item) => sum + item.revenue, 0)
-  const avgActiveUsers = chartData.length > 0 ? chartData.reduce((sum, item) => sum + item.active_users, 0) / chartData.length : 0
+  const formatTime = (time) => new Date(time).toLocaleDateString('pt-BR', { day: '2-digit', month: '2-digit' })
 
   return (
     <div className="space-y-6">
@@ -118,7 +136,7 @@ const SystemStats = ({ apiBase, systemStats }) => {
           <Button
             variant="outline"
             size="sm"
-            onClick={generateMockData}
+            onClick={loadTimeseries}
             disabled={loading}
           >
             <RefreshCw className={`w-4 h-4 mr-2 ${loading ? 'animate-spin' : ''}`} />
@@ -157,52 +175,51 @@ const SystemStats = ({ apiBase, systemStats }) => {
             <Zap className="h-4 w-4 text-muted-foreground" />
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold">{totalTokensUsed.toLocaleString()}</div>
+            <div className="text-2xl font-bold">{totals.tokens.toLocaleString()}</div>
             <p className="text-xs text-muted-foreground">
-              {calculateGrowth(chartData, 'tokens_used') > 0 ? '+' : ''}
-              {calculateGrowth(chartData, 'tokens_used').toFixed(1)}% vs período anterior
+              {calculateGrowth(chartData, 'tokens') > 0 ? '+' : ''}
+              {calculateGrowth(chartData, 'tokens').toFixed(1)}% no último intervalo
             </p>
           </CardContent>
         </Card>
 
         <Card>
           <CardHeader className="flex flex-row items-center justify-between space-y-0 pb-2">
-            <CardTitle className="text-sm font-medium">Novos Usuários</CardTitle>
-            <Users className="h-4 w-4 text-muted-foreground" />
+            <CardTitle className="text-sm font-medium">Requisições</CardTitle>
+            <TrendingUp className="h-4 w-4 text-muted-foreground" />
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold">{totalNewUsers}</div>
+            <div className="text-2xl font-bold">{totals.requests.toLocaleString()}</div>
             <p className="text-xs text-muted-foreground">
-              {calculateGrowth(chartData, 'new_users') > 0 ? '+' : ''}
-              {calculateGrowth(chartData, 'new_users').toFixed(1)}% vs período anterior
+              {calculateGrowth(chartData, 'requests') > 0 ? '+' : ''}
+              {calculateGrowth(chartData, 'requests').toFixed(1)}% no último intervalo
             </p>
           </CardContent>
         </Card>
 
         <Card>
           <CardHeader className="flex flex-row items-center justify-between space-y-0 pb-2">
-            <CardTitle className="text-sm font-medium">Usuários Ativos (Média)</CardTitle>
-            <TrendingUp className="h-4 w-4 text-muted-foreground" />
+            <CardTitle className="text-sm font-medium">Modelos Utilizados</CardTitle>
+            <Users className="h-4 w-4 text-muted-foreground" />
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold">{Math.round(avgActiveUsers)}</div>
+            <div className="text-2xl font-bold">{modelSeries.length}</div>
             <p className="text-xs text-muted-foreground">
-              {calculateGrowth(chartData, 'active_users') > 0 ? '+' : ''}
-              {calculateGrowth(chartData, 'active_users').toFixed(1)}% vs período anterior
+              {modelSeries[0] ? `Mais usado: ${modelSeries[0].model}` : 'Sem consumo no período'}
             </p>
           </CardContent>
         </Card>
 
         <Card>
           <CardHeader className="flex flex-row items-center justify-between space-y-0 pb-2">
-            <CardTitle className="text-sm font-medium">Receita Estimada</CardTitle>
+            <CardTitle className="text-sm font-medium">Custo Estimado</CardTitle>
             <DollarSign className="h-4 w-4 text-muted-foreground" />
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold">R$ {totalRevenue.toLocaleString()}</div>
+            <div className="text-2xl font-bold">US$ {totals.cost_usd.toLocaleString()}</div>
             <p className="text-xs text-muted-foreground">
-              {calculateGrowth(chartData, 'revenue') > 0 ? '+' : ''}
-              {calculateGrowth(chartData, 'revenue').toFixed(1)}% vs período anterior
+              {calculateGrowth(chartData, 'cost_usd') > 0 ? '+' : ''}
+              {calculateGrowth(chartData, 'cost_usd').toFixed(1)}% no último intervalo
             </p>
           </CardContent>
         </Card>
@@ -226,10 +243,10 @@ const SystemStats = ({ apiBase, systemStats }) => {
                 />
                 <Line 
                   type="monotone" 
-                  dataKey="tokens_used" 
+                  dataKey="tokens" 
                   stroke="#3b82f6" 
                   strokeWidth={2}
-                  dot={{ fill: '#3b82f6' }}
+                  dot={false}
                 />
               </LineChart>
             </ResponsiveContainer>
@@ -238,28 +255,46 @@ const SystemStats = ({ apiBase, systemStats }) => {
 
         <Card>
           <CardHeader>
-            <CardTitle>Usuários Ativos</CardTitle>
-            <CardDescription>Número de usuários ativos por dia</CardDescription>
+            <CardTitle>Tokens por Modelo</CardTitle>
+            <CardDescription>Consumo de cada modelo no período</CardDescription>
           </CardHeader>
           <CardContent>
             <ResponsiveContainer width="100%" height={300}>
-              <BarChart data={chartData}>
+              <LineChart>
                 <CartesianGrid strokeDasharray="3 3" />
-                <XAxis dataKey="date" />
+                <XAxis
+                  dataKey="time"
+                  type="number"
+                  scale="time"
+                  domain={['dataMin', 'dataMax']}
+                  tickFormatter={formatTime}
+                />
                 <YAxis />
                 <Tooltip 
-                  formatter={(value) => [value, 'Usuários']}
+                  labelFormatter={formatTime}
+                  formatter={(value, name) => [value.toLocaleString(), name]}
                 />
-                <Bar dataKey="active_users" fill="#10b981" />
-              </BarChart>
+                {modelSeries.map((serie, index) => (
+                  <Line
+                    key={serie.model}
+                    data={serie.points}
+                    name={serie.model}
+                    type="monotone"
+                    dataKey="tokens"
+                    stroke={MODEL_COLORS[index % MODEL_COLORS.length]}
+                    strokeWidth={2}
+                    dot={false}
+                  />
+                ))}
+              </LineChart>
             </ResponsiveContainer>
           </CardContent>
         </Card>
 
         <Card>
           <CardHeader>
-            <CardTitle>Novos Usuários</CardTitle>
-            <CardDescription>Crescimento da base de usuários</CardDescription>
+            <CardTitle>Requisições</CardTitle>
+            <CardDescription>Chamadas aos modelos ao longo do tempo</CardDescription>
           </CardHeader>
           <CardContent>
             <ResponsiveContainer width="100%" height={300}>
@@ -268,9 +303,9 @@ const SystemStats = ({ apiBase, systemStats }) => {
                 <XAxis dataKey="date" />
                 <YAxis />
                 <Tooltip 
-                  formatter={(value) => [value, 'Novos Usuários']}
+                  formatter={(value) => [value, 'Requisições']}
                 />
-                <Bar dataKey="new_users" fill="#8b5cf6" />
+                <Bar dataKey="requests" fill="#8b5cf6" />
               </BarChart>
             </ResponsiveContainer>
           </CardContent>
@@ -309,7 +344,7 @@ const SystemStats = ({ apiBase, systemStats }) => {
       <Card>
         <CardHeader>
           <CardTitle>Dados Detalhados</CardTitle>
-          <CardDescription>Estatísticas diárias do período selecionado</CardDescription>
+          <CardDescription>Últimos pontos da série do período selecionado</CardDescription>
         </CardHeader>
         <CardContent>
           <div className="overflow-x-auto">
@@ -318,19 +353,17 @@ const SystemStats = ({ apiBase, systemStats }) => {
                 <tr className="border-b">
                   <th className="text-left p-2">Data</th>
                   <th className="text-right p-2">Tokens Usados</th>
-                  <th className="text-right p-2">Novos Usuários</th>
-                  <th className="text-right p-2">Usuários Ativos</th>
-                  <th className="text-right p-2">Receita (R$)</th>
+                  <th className="text-right p-2">Requisições</th>
+                  <th className="text-right p-2">Custo (US$)</th>
                 </tr>
               </thead>
               <tbody>
                 {chartData.slice(-10).map((row, index) => (
                   <tr key={index} className="border-b hover:bg-gray-50">
                     <td className="p-2 font-medium">{row.date}</td>
-                    <td className="p-2 text-right">{row.tokens_used.toLocaleString()}</td>
-                    <td className="p-2 text-right">{row.new_users}</td>
-                    <td className="p-2 text-right">{row.active_users}</td>
-                    <td className="p-2 text-right">R$ {row.revenue.toLocaleString()}</td>
+                    <td className="p-2 text-right">{row.tokens.toLocaleString()}</td>
+                    <td className="p-2 text-right">{row.requests}</td>
+                    <td className="p-2 text-right">US$ {row.cost_usd.toLocaleString()}</td>
                   </tr>
                 ))}
               </tbody>
@@ -343,4 +376,3 @@ const SystemStats = ({ apiBase, systemStats }) => {
 }
 
 export default SystemStats
-
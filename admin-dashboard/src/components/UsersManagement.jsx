@@ -40,6 +40,7 @@ import {
 } from '@/components/ui/dialog'
 import { Label } from '@/components/ui/label'
 import { useToast } from '@/hooks/use-toast'
+import { useAdminEvents } from '@/hooks/use-admin-events'
 
 const UsersManagement = ({ apiBase, onRefresh }) => {
   const [users, setUsers] = useState([])
@@ -59,11 +60,43 @@ const UsersManagement = ({ apiBase, onRefresh }) => {
 
   const { toast } = useToast()
 
+  // Busca no servidor a partir de 2 caracteres (índices trigram); senão, lista paginada
+  const searching = searchTerm.trim().length >= 2
+
   useEffect(() => {
+    if (searching) return
     loadUsers()
-  }, [pagination.page, filterStatus])
+  }, [pagination.page, filterStatus, searching])
+
+  useEffect(() => {
+    if (!searching) return
+    const timer = setTimeout(() => searchUsers(), 250)
+    return () => clearTimeout(timer)
+  }, [searchTerm, filterStatus])
+
+  const searchUsers = async () => {
+    try {
+      setLoading(true)
+      const params = new URLSearchParams({
+        q: searchTerm.trim(),
+        status: filterStatus,
+        limit: '50'
+      })
+
+      const response = await fetch(`${apiBase}/admin/users/search?${params}`)
+      if (response.ok) {
+        const data = await response.json()
+        setUsers(data.users || [])
+      }
+    } catch (error) {
+      console.error('Erro ao buscar usuários:', error)
+    } finally {
+      setLoading(false)
+    }
+  }
 
   const loadUsers = async () => {
+    if (searching) return searchUsers()
     try {
       setLoading(true)
       const params = new URLSearchParams({
@@ -99,6 +132,18 @@ const UsersManagement = ({ apiBase, onRefresh }) => {
     }
   }
 
+  // Atualiza as linhas da página atual a partir dos eventos ao vivo
+  const updateUserRow = ({ user }) => {
+    setUsers(prev => prev.map(item => item.id === user.id ? user : item))
+  }
+
+  useAdminEvents(apiBase, {
+    'usage.settled': updateUserRow,
+    'user.blocked': updateUserRow,
+    'tokens.granted': updateUserRow,
+    'stats.resync': () => loadUsers()
+  })
+
   const handleAddTokens = async () => {
     if (!selectedUser || !tokensToAdd || parseInt(tokensToAdd) <= 0) {
       toast({
@@ -189,7 +234,8 @@ const UsersManagement = ({ apiBase, onRefresh }) => {
     return 'text-green-600'
   }
 
-  const filteredUsers = users.filter(user => {
+  // Resultados da busca já vêm filtrados e ordenados pelo servidor
+  const filteredUsers = searching ? users : users.filter(user => {
     const matchesSearch = user.name?.toLowerCase().includes(searchTerm.toLowerCase()) ||
                          user.email?.toLowerCase().includes(searchTerm.toLowerCase())
     
@@ -383,7 +429,7 @@ const UsersManagement = ({ apiBase, onRefresh }) => {
       </Card>
 
       {/* Pagination */}
-      {pagination.pages > 1 && (
+      {!searching && pagination.pages > 1 && (
         <div className="flex items-center justify-between">
           <p className="text-sm text-gray-500">
             Página {pagination.page} de {pagination.pages} ({pagination.total} usuários)
@@ -0,0 +1,55 @@
+import * as React from "react"
+
+// Tipos publicados pelo proxy em /v1/admin/events
+export const ADMIN_EVENT_TYPES = [
+  "usage.settled",
+  "user.created",
+  "user.blocked",
+  "alert.raised",
+  "tokens.granted",
+  "stats.resync",
+]
+
+// Uma única conexão SSE por aba, compartilhada pelos componentes
+const subscribers = new Set()
+let source = null
+
+function dispatch(type, message) {
+  let data
+  try {
+    data = JSON.parse(message.data)
+  } catch {
+    return
+  }
+  subscribers.forEach((handlers) => handlers.current[type]?.(data))
+}
+
+function openSource(apiBase) {
+  if (source || typeof EventSource === "undefined") return
+  // O navegador reconecta sozinho e envia Last-Event-ID para recuperar eventos perdidos
+  source = new EventSource(`${apiBase}/admin/events`)
+  ADMIN_EVENT_TYPES.forEach((type) => {
+    source.addEventListener(type, (message) => dispatch(type, message))
+  })
+}
+
+function closeSource() {
+  if (source && subscribers.size === 0) {
+    source.close()
+    source = null
+  }
+}
+
+export function useAdminEvents(apiBase, handlers) {
+  const handlersRef = React.useRef(handlers)
+  handlersRef.current = handlers
+
+  React.useEffect(() => {
+    subscribers.add(handlersRef)
+    openSource(apiBase)
+    return () => {
+      subscribers.delete(handlersRef)
+      closeSource()
+    }
+  }, [apiBase])
+}
@@ -0,0 +1,108 @@
+-- Função de liquidação de consumo IA SOLARIS
+-- Debita tokens, registra a transação, atualiza o bloqueio e retorna os
+-- alertas pendentes em uma única chamada (um único round-trip por requisição)
+
+-- As tabelas user_accounts, token_transactions e user_alerts são criadas pelo
+-- proxy (SQLAlchemy). Como a função é PL/pgSQL, as referências são resolvidas
+-- apenas na execução, então o script pode rodar antes da criação das tabelas.
+
+-- O tipo de retorno mudou (settled_at); CREATE OR REPLACE não troca o tipo
+DROP FUNCTION IF EXISTS ia_solaris.settle_usage(VARCHAR, INTEGER, VARCHAR, VARCHAR, NUMERIC);
+
+CREATE OR REPLACE FUNCTION ia_solaris.settle_usage(
+    p_user_account_id VARCHAR,
+    p_tokens_used INTEGER,
+    p_model_used VARCHAR DEFAULT NULL,
+    p_request_id VARCHAR DEFAULT NULL,
+    p_cost_usd NUMERIC DEFAULT NULL
+)
+RETURNS TABLE (
+    transaction_id VARCHAR,
+    total_tokens INTEGER,
+    used_tokens INTEGER,
+    remaining_tokens INTEGER,
+    is_blocked BOOLEAN,
+    alerts TEXT[],
+    settled_at TIMESTAMP
+) AS $$
+DECLARE
+    v_now TIMESTAMP := timezone('utc', now());
+    v_today TIMESTAMP := date_trunc('day', timezone('utc', now()));
+    v_total INTEGER;
+    v_used INTEGER;
+    v_threshold_80 DOUBLE PRECISION;
+    v_threshold_95 DOUBLE PRECISION;
+    v_blocked BOOLEAN;
+    v_percentage DOUBLE PRECISION;
+    v_alerts TEXT[] := ARRAY[]::TEXT[];
+    v_transaction_id VARCHAR := uuid_generate_v4()::text;
+BEGIN
+    -- Debita tokens apenas de contas ativas, não bloqueadas e com saldo suficiente
+    -- (mesma regra de UserAccount.can_consume_tokens)
+    UPDATE user_accounts ua
+    SET used_tokens = ua.used_tokens + p_tokens_used,
+        is_blocked = (ua.total_tokens - (ua.used_tokens + p_tokens_used)) <= 0,
+        last_activity = v_now,
+        updated_at = v_now
+    WHERE ua.id = p_user_account_id
+      AND ua.is_active
+      AND NOT ua.is_blocked
+      AND (ua.total_tokens - ua.used_tokens) >= p_tokens_used
+    RETURNING ua.total_tokens, ua.used_tokens, ua.alert_threshold_80, ua.alert_threshold_95, ua.is_blocked
+    INTO v_total, v_used, v_threshold_80, v_threshold_95, v_blocked;
+
+    -- Sem linha atualizada: tokens insuficientes ou conta bloqueada
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    -- Registra transação no extrato
+    INSERT INTO token_transactions (id, user_account_id, tokens_used, model_used, request_id, cost_usd, created_at)
+    VALUES (v_transaction_id, p_user_account_id, p_tokens_used, p_model_used, p_request_id, p_cost_usd, v_now);
+
+    -- Alertas pendentes: mesmo critério de ProxyService.check_and_send_alerts
+    -- (limite atingido e nenhum alerta do mesmo tipo desde o início do dia)
+    IF v_total = 0 THEN
+        v_percentage := 100.0;
+    ELSE
+        v_percentage := (v_used::DOUBLE PRECISION / v_total) * 100;
+    END IF;
+
+    IF v_percentage >= v_threshold_80 * 100 AND NOT EXISTS (
+        SELECT 1 FROM user_alerts
+        WHERE user_account_id = p_user_account_id
+          AND alert_type = '80_percent'
+          AND created_at > v_today
+    ) THEN
+        v_alerts := array_append(v_alerts, '80_percent');
+    END IF;
+
+    IF v_percentage >= v_threshold_95 * 100 AND NOT EXISTS (
+        SELECT 1 FROM user_alerts
+        WHERE user_account_id = p_user_account_id
+          AND alert_type = '95_percent'
+          AND created_at > v_today
+    ) THEN
+        v_alerts := array_append(v_alerts, '95_percent');
+    END IF;
+
+    -- A conta só chega aqui desbloqueada, então bloqueio agora é bloqueio novo
+    IF v_blocked THEN
+        v_alerts := array_append(v_alerts, 'blocked');
+    END IF;
+
+    RETURN QUERY SELECT
+        v_transaction_id,
+        v_total,
+        v_used,
+        GREATEST(0, v_total - v_used),
+        v_blocked,
+        v_alerts,
+        v_now;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMENT ON FUNCTION ia_solaris.settle_usage(VARCHAR, INTEGER, VARCHAR, VARCHAR, NUMERIC)
+    IS 'Liquida o consumo de uma requisição: débito, extrato, bloqueio e alertas pendentes em uma chamada';
+
+GRANT EXECUTE ON FUNCTION ia_solaris.settle_usage(VARCHAR, INTEGER, VARCHAR, VARCHAR, NUMERIC) TO ia_solaris_app;
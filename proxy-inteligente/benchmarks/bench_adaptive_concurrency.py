@@ -0,0 +1,190 @@
+"""Limite adaptativo por modelo contra um upstream falso com latência injetada
+
+Sobe um servidor HTTP local no lugar do LiteLLM. Como um provedor com cota
+de concorrência, ele atende até N chamadas de cada vez e responde 429 às que
+passam disso; cada fase muda a cota e a latência:
+  normal     --upstream-capacity vagas, --base-ms
+  lento      --slow-capacity vagas, --slow-ms (provedor degradado)
+  recuperado --upstream-capacity vagas, --base-ms de novo
+--clients clientes em laço fechado chamam LiteLLMService.make_request; uma
+recusa (upstream_busy) ou erro espera --shed-pause-ms antes de tentar de novo.
+O limite reage a 429/5xx, timeouts, erros de conexão e respostas bem mais
+lentas que a referência para o mesmo tamanho; começa na capacidade do
+processo (UPSTREAM_MAX_CONCURRENCY).
+Compara sem limite (o excedente bate no provedor e volta 429) e com o limite
+adaptativo (recusa na hora o excedente e volta a subir na recuperação), e
+confere que:
+  - com o provedor lento o limite cai e as recusas respondem em poucos ms
+  - o provedor devolve menos erros que sem o limite
+  - na recuperação o limite volta a subir
+
+Uso:
+    python benchmarks/bench_adaptive_concurrency.py --phase-seconds 4
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.litellm_service import LiteLLMService
+
+MODEL = 'gpt-4o'
+COMPLETION = json.dumps({
+    'id': 'bench', 'object': 'chat.completion', 'model': MODEL,
+    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'ok'}, 'finish_reason': 'stop'}],
+    'usage': {'prompt_tokens': 10, 'completion_tokens': 5, 'total_tokens': 15}
+}).encode()
+RATE_LIMITED = json.dumps({'error': {'message': 'concurrency quota exceeded', 'type': 'rate_limit_error'}}).encode()
+
+
+class FakeUpstream:
+    """Provedor com cota de concorrência e latência ajustáveis em tempo de execução"""
+
+    def __init__(self, capacity, latency):
+        self.capacity = capacity
+        self.latency = latency
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, body):
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # Cliente desistiu (timeout)
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                with upstream.lock:
+                    admitted = upstream.in_flight < upstream.capacity
+                    if admitted:
+                        upstream.in_flight += 1
+                if not admitted:
+                    self.reply(429, RATE_LIMITED)
+                    return
+                try:
+                    time.sleep(upstream.latency)
+                finally:
+                    with upstream.lock:
+                        upstream.in_flight -= 1
+                self.reply(200, COMPLETION)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def run(label, adaptive, args):
+    upstream = FakeUpstream(args.upstream_capacity, args.base_ms / 1000)
+    os.environ['LITELLM_BASE_URL'] = upstream.url
+    os.environ['UPSTREAM_TIMEOUT_SECONDS'] = str(args.timeout_ms / 1000)
+    os.environ.pop('OPENAI_API_KEY', None)
+    service = LiteLLMService()
+    service.concurrency.enabled = adaptive
+
+    phases = (('normal', args.upstream_capacity, args.base_ms),
+              ('lento', args.slow_capacity, args.slow_ms),
+              ('recuperado', args.upstream_capacity, args.base_ms))
+    results = {name: {'ok': [], 'shed': [], 'error': 0} for name, _, _ in phases}
+    limits = {}
+    state = {'phase': phases[0][0], 'running': True}
+    lock = threading.Lock()
+
+    def client():
+        request = {'model': MODEL, 'messages': [{'role': 'user', 'content': 'oi'}]}
+        while state['running']:
+            phase = state['phase']
+            started = time.monotonic()
+            success, response = service.make_request(request)
+            elapsed = time.monotonic() - started
+            with lock:
+                if success:
+                    results[phase]['ok'].append(elapsed)
+                elif response.get('error') == 'upstream_busy':
+                    results[phase]['shed'].append(elapsed)
+                else:
+                    results[phase]['error'] += 1
+            if not success:
+                time.sleep(args.shed_pause_ms / 1000)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    for name, capacity, latency_ms in phases:
+        state['phase'] = name
+        upstream.capacity = capacity
+        upstream.latency = latency_ms / 1000
+        time.sleep(args.phase_seconds)
+        limits[name] = service.concurrency.limits().get(MODEL, {}).get('limit')
+    state['running'] = False
+    for thread in threads:
+        thread.join()
+    upstream.server.shutdown()
+
+    print(f"\n{label}")
+    for name, capacity, latency_ms in phases:
+        phase = results[name]
+        ok, shed = phase['ok'], phase['shed']
+        line = (f"  {name:<11} {capacity:2d} vagas {latency_ms:5.0f}ms | {len(ok):5d} ok p50 {statistics.median(ok) * 1000 if ok else float('nan'):7.0f}ms "
+                f"p95 {percentile(ok, 0.95) * 1000:7.0f}ms | {len(shed):5d} recusadas")
+        if shed:
+            line += f" (p95 {percentile(shed, 0.95) * 1000:.1f}ms)"
+        if phase['error']:
+            line += f" | {phase['error']} erros"
+        if adaptive:
+            line += f" | limite ao fim {limits[name]}"
+        print(line)
+    return results, limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--phase-seconds', type=float, default=4)
+    parser.add_argument('--clients', type=int, default=24)
+    parser.add_argument('--upstream-capacity', type=int, default=8)
+    parser.add_argument('--base-ms', type=float, default=80)
+    parser.add_argument('--slow-capacity', type=int, default=3)
+    parser.add_argument('--slow-ms', type=float, default=400)
+    parser.add_argument('--timeout-ms', type=float, default=5000)
+    parser.add_argument('--shed-pause-ms', type=float, default=100)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clientes, upstream com {args.upstream_capacity} vagas "
+          f"({args.slow_capacity} no lento), {args.phase_seconds:.0f}s por fase")
+    baseline, _ = run('sem limite', False, args)
+    adaptive, limits = run('limite adaptativo', True, args)
+
+    slow = adaptive['lento']
+    assert slow['shed'], 'nenhuma recusa com o provedor lento'
+    assert percentile(slow['shed'], 0.95) < 0.05, 'recusas deveriam responder na hora'
+    assert limits['lento'] < limits['normal'], 'o limite deveria cair com o provedor lento'
+    assert limits['recuperado'] > limits['lento'], 'o limite deveria subir na recuperação'
+    assert slow['error'] < baseline['lento']['error'], 'o provedor deveria devolver menos erros que sem limite'
+    print("\nverificações ok")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""Micro-benchmark da renderização dos emails (src/templates/email)
+
+Mede a compilação dos templates e quantos emails (HTML + texto) por segundo
+EmailService.build_emails renderiza em lote, com usuários distintos (sem
+cache) e repetindo os mesmos usuários (cache de renderização).
+
+Uso:
+    python benchmarks/bench_email_render.py --emails 10000
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.token_control import UserAccount
+from src.services.email_templates import EmailTemplates
+from src.services import email_service as email_module
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=10000)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    templates = EmailTemplates()
+    print(f"Compilação de {len(templates.names)} emails ({len(templates._templates)} arquivos): "
+          f"{(time.perf_counter() - started) * 1000:.1f}ms")
+
+    email_module.email_templates = templates
+    service = email_module.EmailService()
+    users = [
+        UserAccount(id=str(i), email=f"user{i}@example.com", name=f"Usuário {i}",
+                    total_tokens=10000, used_tokens=8000 + i % 2000)
+        for i in range(args.emails)
+    ]
+
+    for name in templates.names:
+        extra = {'tokens_added': 5000, 'transaction_id': 'tx'} if name == 'credits_confirmation' else {}
+        items = [(user, dict(extra, transaction_id=f"tx-{user.id}") if extra else extra) for user in users]
+
+        templates._cache.clear()
+        started = time.perf_counter()
+        service.build_emails(name, items)
+        cold = time.perf_counter() - started
+
+        # Os últimos contextos de novo (ex.: reenvio após falha SMTP): saem do cache
+        repeat = items[-templates.cache_size:]
+        started = time.perf_counter()
+        service.build_emails(name, repeat)
+        warm = time.perf_counter() - started
+
+        print(f"{name:<22} {args.emails / cold:9.0f} emails/s ({cold / args.emails * 1e6:6.1f}µs cada) | "
+              f"cache: {len(repeat) / warm:9.0f} emails/s")
+
+
+if __name__ == '__main__':
+    main()
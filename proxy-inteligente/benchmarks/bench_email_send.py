@@ -0,0 +1,73 @@
+"""Benchmark do envio de emails: uma sessão SMTP por email x sessões reaproveitadas
+
+Sobe o smtp_sink local com uma latência de handshake simulada (connect + TLS +
+login de um provedor real custam centenas de ms) e envia N confirmações de
+créditos de três formas:
+  por-email   uma sessão nova para cada email (comportamento anterior)
+  pool        send_email em sequência, sessão reaproveitada pelo pool
+  lote        send_credits_purchased_batch (uma chamada, uma sessão)
+
+Uso:
+    python benchmarks/bench_email_send.py --emails 200 --handshake-ms 150
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.models.token_control import UserAccount
+from src.services.smtp_sink import SMTPSink
+from src.services.smtp_pool import SMTPConnectionPool
+
+
+def build_service(sink, max_messages):
+    """EmailService apontando para o sink (pool próprio por cenário)"""
+    os.environ.update(SMTP_SERVER=sink.host, SMTP_PORT=str(sink.port), SMTP_STARTTLS='false',
+                      SMTP_ALLOW_ANONYMOUS='true', EMAIL_DEBUG='false')
+    from src.services.email_service import EmailService
+    service = EmailService()
+    service.smtp_pool = SMTPConnectionPool(sink.host, sink.port, starttls=False, max_messages=max_messages)
+    return service
+
+
+def run(label, sink, send):
+    """Executa um cenário e imprime tempo, vazão e sessões abertas"""
+    sink.messages.clear()
+    sink.connections = 0
+    started = time.perf_counter()
+    results = send()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<10} {elapsed:7.2f}s | {len(results) / elapsed:8.1f} emails/s | "
+          f"{sink.connections:>4} sessões | {sum(results)}/{len(results)} entregues")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--emails', type=int, default=200)
+    parser.add_argument('--handshake-ms', type=float, default=150.0)
+    args = parser.parse_args()
+
+    users = [
+        UserAccount(id=str(i), email=f"user{i}@example.com", name=f"Usuário {i}",
+                    total_tokens=10000, used_tokens=1000)
+        for i in range(args.emails)
+    ]
+    confirmations = [(user, 5000, f"tx-{user.id}") for user in users]
+
+    with SMTPSink(handshake_delay=args.handshake_ms / 1000) as sink:
+        print(f"{args.emails} emails | handshake simulado de {args.handshake_ms:.0f}ms")
+
+        legacy = build_service(sink, max_messages=1)
+        run('por-email', sink, lambda: [legacy.send_credits_purchased_confirmation(*item) for item in confirmations])
+
+        pooled = build_service(sink, max_messages=100)
+        run('pool', sink, lambda: [pooled.send_credits_purchased_confirmation(*item) for item in confirmations])
+
+        batched = build_service(sink, max_messages=100)
+        run('lote', sink, lambda: batched.send_credits_purchased_batch(confirmations))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Simulação da admissão de chamadas ao upstream (FairShareScheduler)
+
+Um worker com --threads threads atende clientes em laço fechado; cada
+chamada ao upstream leva --upstream-ms. Cenários:
+  script pesado   1 usuário com --heavy-clients clientes simultâneos (respeita
+                  Retry-After no 429) e --light-users usuários comuns com
+                  pausa de 200ms entre mensagens; compara a latência dos
+                  usuários comuns sem admissão (fila FIFO do worker) e com ela
+  tiers           2 usuários saturando o upstream, um standard e um priority;
+                  mostra a fatia de cada um
+Não usa Flask nem banco: mede só o agendamento.
+
+Uso:
+    python benchmarks/bench_fair_share.py --seconds 5
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.admission_service import FairShareScheduler, AdmissionRejected
+
+
+def make_scheduler(**settings):
+    scheduler = FairShareScheduler()
+    for name, value in settings.items():
+        setattr(scheduler, name, value)
+    return scheduler
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else float('nan')
+
+
+def run_clients(pool, scheduler, clients, seconds, upstream):
+    """clients: (usuário, tier, pausa); devolve latências (s) e recusas por usuário"""
+    latencies = {}
+    rejected = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def handle(user, tier):
+        if scheduler is None:
+            time.sleep(upstream)
+            return None
+        try:
+            with scheduler.slot(user, tier):
+                time.sleep(upstream)
+        except AdmissionRejected as e:
+            return e.retry_after
+        return None
+
+    def client(user, tier, pause):
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            retry_after = pool.submit(handle, user, tier).result()
+            with lock:
+                if retry_after is None:
+                    latencies.setdefault(user, []).append(time.monotonic() - started)
+                else:
+                    rejected[user] = rejected.get(user, 0) + 1
+            time.sleep(retry_after if retry_after is not None else pause)
+
+    threads = [threading.Thread(target=client, args=spec, daemon=True) for spec in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--upstream-ms', type=float, default=80)
+    parser.add_argument('--heavy-clients', type=int, default=16)
+    parser.add_argument('--light-users', type=int, default=4)
+    args = parser.parse_args()
+    upstream = args.upstream_ms / 1000
+
+    clients = [('script', 'standard', 0)] * args.heavy_clients
+    clients += [(f"usuario{n}", 'standard', 0.2) for n in range(args.light_users)]
+    print(f"worker com {args.threads} threads, upstream {args.upstream_ms:.0f}ms, {args.seconds:.0f}s por cenário")
+    print(f"\nscript pesado ({args.heavy_clients} clientes) + {args.light_users} usuários comuns")
+    for label, scheduler in (
+        ('sem admissão', None),
+        ('com admissão', make_scheduler(capacity=max(args.threads - 2, 1), user_max_in_flight=2, user_max_queued=2)),
+    ):
+        with ThreadPoolExecutor(args.threads) as pool:
+            latencies, rejected = run_clients(pool, scheduler, clients, args.seconds, upstream)
+        light = [value for user, values in latencies.items() if user != 'script' for value in values]
+        print(f"  {label:<13} comuns p50 {statistics.median(light) * 1000:6.0f}ms p95 {percentile(light, 0.95) * 1000:6.0f}ms "
+              f"({len(light)} msgs) | script {len(latencies.get('script', []))} ok, {rejected.get('script', 0)} x 429")
+
+    print("\ntiers: 2 usuários com 12 clientes cada")
+    scheduler = make_scheduler(capacity=4, user_max_in_flight=4, user_max_queued=12,
+                               tier_weights={'standard': 1.0, 'priority': 4.0})
+    clients = [('conta_standard', 'standard', 0)] * 12 + [('conta_priority', 'priority', 0)] * 12
+    with ThreadPoolExecutor(32) as pool:
+        latencies, _ = run_clients(pool, scheduler, clients, args.seconds, upstream)
+    total = sum(len(values) for values in latencies.values())
+    for user in ('conta_standard', 'conta_priority'):
+        done = len(latencies.get(user, []))
+        print(f"  {user:<15} {done:5d} chamadas ({done / max(total, 1):.0%}) | p50 {statistics.median(latencies[user]) * 1000:6.0f}ms")
+
+
+if __name__ == '__main__':
+    main()
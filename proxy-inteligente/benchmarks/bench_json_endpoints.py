@@ -0,0 +1,151 @@
+"""Benchmark das listas JSON da API (/v1/user/usage e /v1/admin/users) com N linhas
+
+Para cada lista compara tempo e pico de memória alocada de:
+  orm+json       objetos ORM + to_dict() + json da stdlib (caminho anterior)
+  linhas+json    tuplas SQL + serializers + json da stdlib
+  linhas+orjson  tuplas SQL + serializers + orjson (FastJSONProvider)
+e mede o endpoint inteiro (test client) com cada provider. Confere antes que
+os serializers geram exatamente o mesmo JSON de to_dict().
+Usa DATABASE_URL se definido (ex.: Postgres local) ou um SQLite temporário.
+
+Uso:
+    python benchmarks/bench_json_endpoints.py --rows 10000
+    DATABASE_URL=postgresql://... python benchmarks/bench_json_endpoints.py
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tracemalloc
+import tempfile
+import statistics
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = f"sqlite:///{tempfile.mkdtemp()}/bench_json.db"
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert, delete
+from src.main import app
+from src.json_provider import FastJSONProvider
+from src.models.database import initialize_database
+from src.models.token_control import db, UserAccount, TokenTransaction
+from src.models.serializers import select_transactions, select_users, transaction_row, user_row
+from src.services.partition_service import PartitionService
+
+BENCH_PREFIX = 'bench-json-'
+HEADERS = {'Authorization': 'Bearer bench', 'X-User-ID': f"{BENCH_PREFIX}0"}
+
+
+def populate(rows):
+    """N contas e N transações (da conta bench-json-0) nos últimos dias"""
+    db.session.execute(delete(TokenTransaction).where(TokenTransaction.request_id.like(f"{BENCH_PREFIX}%")))
+    db.session.execute(delete(UserAccount).where(UserAccount.librechat_user_id.like(f"{BENCH_PREFIX}%")))
+
+    now = datetime.utcnow()
+    users = [{
+        'id': str(uuid.uuid4()), 'librechat_user_id': f"{BENCH_PREFIX}{n}", 'email': f"{BENCH_PREFIX}{n}@example.com",
+        'name': f"Usuário {n}", 'total_tokens': 10000, 'used_tokens': n % 10001, 'alert_threshold_80': 0.8,
+        'alert_threshold_95': 0.95, 'is_active': True, 'is_blocked': False, 'created_at': now - timedelta(seconds=n),
+        'updated_at': now, 'last_activity': now if n % 2 else None
+    } for n in range(rows)]
+    db.session.execute(insert(UserAccount), users)
+
+    owner = users[0]['id']
+    if db.engine.dialect.name == 'postgresql':
+        PartitionService().ensure_partitions(today=now - timedelta(days=2))
+    db.session.execute(insert(TokenTransaction), [{
+        'id': str(uuid.uuid4()), 'user_account_id': owner, 'tokens_used': 100 + n % 900, 'model_used': 'gpt-4o',
+        'request_id': f"{BENCH_PREFIX}{n}", 'cost_usd': (n % 50) / 1000 or None, 'prompt_tokens': 60,
+        'completion_tokens': 40, 'total_tokens': 100, 'created_at': now - timedelta(seconds=n * 10)
+    } for n in range(rows)])
+    db.session.commit()
+    return owner
+
+
+def median_ms(func, repeat):
+    """Mediana (ms) de `repeat` execuções"""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def peak_kib(func):
+    """Pico de memória alocada (KiB) durante uma execução"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=7)
+    args = parser.parse_args()
+
+    stdlib = DefaultJSONProvider(app)
+    fast = FastJSONProvider(app)
+    if not fast.native:
+        print("orjson não instalado: linhas+orjson usa o json da stdlib")
+
+    with app.app_context():
+        initialize_database()
+        owner = populate(args.rows)
+        print(f"{args.rows} linhas por lista | {db.engine.dialect.name}")
+
+        lists = {
+            'transações': (
+                lambda: [t.to_dict() for t in TokenTransaction.query.filter_by(user_account_id=owner)
+                         .order_by(TokenTransaction.created_at.desc()).limit(args.rows)],
+                lambda: [transaction_row(row) for row in db.session.execute(
+                    select_transactions().where(TokenTransaction.user_account_id == owner)
+                    .order_by(TokenTransaction.created_at.desc()).limit(args.rows))],
+            ),
+            'usuários': (
+                lambda: [u.to_dict() for u in UserAccount.query.order_by(UserAccount.id).limit(args.rows)],
+                lambda: [user_row(row) for row in db.session.execute(
+                    select_users().order_by(UserAccount.id).limit(args.rows))],
+            ),
+        }
+
+        for label, (orm_dicts, row_dicts) in lists.items():
+            assert stdlib.dumps(orm_dicts()) == stdlib.dumps(row_dicts()), f"{label}: serializer difere de to_dict()"
+
+            def run(build, provider):
+                def call():
+                    provider.response(build())
+                    db.session.remove()
+                return call
+
+            print(f"\n{label}")
+            for name, build, provider in (('orm+json', orm_dicts, stdlib), ('linhas+json', row_dicts, stdlib),
+                                          ('linhas+orjson', row_dicts, fast)):
+                print(f"  {name:<14} {median_ms(run(build, provider), args.repeat):8.1f}ms | "
+                      f"pico {peak_kib(run(build, provider)):8.0f} KiB")
+
+    client = app.test_client()
+    endpoints = {
+        'GET /v1/user/usage': f"/v1/user/usage?limit={args.rows}",
+        'GET /v1/admin/users': f"/v1/admin/users?per_page={args.rows}",
+    }
+    print("\nendpoint completo")
+    for label, url in endpoints.items():
+        for name, provider in (('json', stdlib), ('orjson', fast)):
+            app.json = provider
+            response = client.get(url, headers=HEADERS)
+            assert response.status_code == 200, response.get_data(as_text=True)[:200]
+            elapsed = median_ms(lambda: client.get(url, headers=HEADERS), args.repeat)
+            print(f"  {label:<20} {name:<7} {elapsed:8.1f}ms ({len(response.data) / 1024:.0f} KiB)")
+
+
+if __name__ == '__main__':
+    main()
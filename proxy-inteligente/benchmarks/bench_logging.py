@@ -0,0 +1,132 @@
+"""Benchmark do custo de logging na thread da requisição
+
+Simula as linhas INFO de um chat (estimativa, chamada ao LiteLLM, sucesso,
+liquidação) e, a cada --error-every chats, um erro do upstream com corpo
+grande. Compara o tempo gasto pela thread que loga com:
+  sync         StreamHandler síncrono + f-strings (configuração anterior)
+  fila         AsyncQueueHandler + %s (mensagem formatada na thread do listener)
+  fila+json    idem, com JSONFormatter
+  fila+amostra idem, com SamplingFilter nos loggers do caminho quente
+A saída vai para um arquivo temporário (--output para outro destino);
+--write-latency-us simula um stderr lento (pipe do container cheio).
+
+Uso:
+    python benchmarks/bench_logging.py --chats 20000
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import tempfile
+from logging.handlers import QueueListener
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.logging_config import TEXT_FORMAT, AsyncQueueHandler, JSONFormatter, SamplingFilter, TextFormatter
+
+UPSTREAM_ERROR = '{"error": {"message": "' + 'x' * 20000 + '"}}'
+
+
+def chats_eager(proxy, litellm, chats, error_every):
+    for n in range(chats):
+        model, tokens = 'gpt-4o', 150 + n % 50
+        proxy.info(f"Tokens estimados para modelo {model}: {tokens}")
+        litellm.info(f"Fazendo requisição LiteLLM para modelo: {model}")
+        litellm.info(f"Requisição LiteLLM bem-sucedida. Tokens: {tokens}")
+        proxy.info(f"Requisição processada para usuário user{n}@example.com. Tokens consumidos: {tokens}")
+        if n % error_every == 0:
+            litellm.error(f"Erro LiteLLM: 502 - {UPSTREAM_ERROR}")
+
+
+def chats_lazy(proxy, litellm, chats, error_every):
+    for n in range(chats):
+        model, tokens = 'gpt-4o', 150 + n % 50
+        proxy.info("Tokens estimados para modelo %s: %s", model, tokens)
+        litellm.info("Fazendo requisição LiteLLM para modelo: %s", model)
+        litellm.info("Requisição LiteLLM bem-sucedida. Tokens: %s", tokens)
+        proxy.info("Requisição processada para usuário %s. Tokens consumidos: %s", f"user{n}@example.com", tokens,
+                   extra={'model': model, 'tokens': tokens})
+        if n % error_every == 0:
+            litellm.error("Erro LiteLLM: %s - %s", 502, UPSTREAM_ERROR)
+
+
+class SlowStream:
+    """Arquivo cuja escrita demora `latency` segundos (leitor lento do outro lado do pipe)"""
+
+    def __init__(self, stream, latency):
+        self.stream = stream
+        self.latency = latency
+
+    def write(self, text):
+        time.sleep(self.latency)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run(label, output, formatter, chats, error_every, use_queue, latency, eager=False, sample_rate=None):
+    """Tempo (ms) da thread que loga e tempo até o listener esvaziar a fila"""
+    root = logging.getLogger()
+    proxy, litellm = logging.getLogger('bench.proxy_service'), logging.getLogger('bench.litellm_service')
+    stream = open(output, 'a', encoding='utf-8')
+    target = logging.StreamHandler(SlowStream(stream, latency) if latency else stream)
+    target.setFormatter(formatter)
+
+    listener = None
+    if use_queue:
+        handler = AsyncQueueHandler(0)
+        listener = QueueListener(handler.queue, target, respect_handler_level=True)
+        listener.start()
+    else:
+        handler = target
+    root.handlers = [handler]
+    filters = []
+    if sample_rate is not None:
+        for logger in (proxy, litellm):
+            filters.append((logger, SamplingFilter(sample_rate)))
+            logger.addFilter(filters[-1][1])
+
+    started = time.perf_counter()
+    (chats_eager if eager else chats_lazy)(proxy, litellm, chats, error_every)
+    caller = time.perf_counter() - started
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - started
+
+    for logger, sampling in filters:
+        logger.removeFilter(sampling)
+    root.handlers = []
+    stream.close()
+    print(f"  {label:<13} requisição {caller * 1000:8.1f}ms ({caller / chats * 1e6:5.1f}µs/chat) | "
+          f"até esvaziar {total * 1000:8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=20000)
+    parser.add_argument('--error-every', type=int, default=500)
+    parser.add_argument('--output')
+    parser.add_argument('--write-latency-us', type=float, default=0)
+    args = parser.parse_args()
+    latency = args.write_latency_us / 1e6
+
+    output = args.output or os.path.join(tempfile.mkdtemp(), 'bench_logging.log')
+    logging.getLogger().setLevel(logging.INFO)
+    print(f"{args.chats} chats (4 linhas INFO cada, 1 erro de {len(UPSTREAM_ERROR)} caracteres a cada "
+          f"{args.error_every}) -> {output}, escrita +{args.write_latency_us:.0f}µs")
+
+    for label, formatter, options in (
+        ('sync', logging.Formatter(TEXT_FORMAT), {'use_queue': False, 'eager': True}),
+        ('fila', TextFormatter(2000), {'use_queue': True}),
+        ('fila+json', JSONFormatter(2000), {'use_queue': True}),
+        ('fila+amostra', JSONFormatter(2000), {'use_queue': True, 'sample_rate': 0.1}),
+    ):
+        run(label, output, formatter, args.chats, args.error_every, latency=latency, **options)
+    if not args.output:
+        print(f"  arquivo final: {os.path.getsize(output) / 1024:.0f} KiB")
+
+
+if __name__ == '__main__':
+    main()
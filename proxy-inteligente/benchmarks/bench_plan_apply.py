@@ -0,0 +1,102 @@
+"""Benchmark da aplicação de planos de cota em massa (flask plans apply)
+
+Cria N contas em um plano, aplica o período (UPDATE + INSERT ... SELECT em
+lotes) e aplica de novo para confirmar a idempotência (nenhuma conta).
+Usa DATABASE_URL se definido (ex.: Postgres local) ou um SQLite temporário.
+
+Uso:
+    python benchmarks/bench_plan_apply.py --accounts 1000000 --chunk-size 5000
+    DATABASE_URL=postgresql://... python benchmarks/bench_plan_apply.py --mode top_up
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from src.models.token_control import db, AllowancePlan
+from src.models.database import init_database
+from src.services.plan_service import PlanService
+from src.services.partition_service import PartitionService
+
+
+def create_app(database_uri):
+    """Aplicação mínima só com o banco"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_database(app)
+    return app
+
+
+def populate(accounts, plan_id):
+    """Insere as contas direto no banco (gerador de linhas do próprio SQL)"""
+    db.session.execute(text("DELETE FROM token_transactions WHERE request_id LIKE 'plan_%'"))
+    db.session.execute(text("DELETE FROM user_accounts WHERE librechat_user_id LIKE 'bench-%'"))
+
+    if db.engine.dialect.name == 'postgresql':
+        series = "SELECT n FROM generate_series(1, :accounts) AS n"
+    else:
+        series = "WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < :accounts) SELECT n FROM s"
+
+    db.session.execute(
+        text(
+            "INSERT INTO user_accounts (id, librechat_user_id, email, total_tokens, used_tokens, "
+            "alert_threshold_80, alert_threshold_95, is_active, is_blocked, plan_id, created_at, updated_at) "
+            "SELECT 'bench-' || n, 'bench-' || n, 'bench' || n || '@bench.local', 1000, n % 1500, "
+            f"0.8, 0.95, :active, n % 1500 >= 1000, :plan_id, :now, :now FROM ({series}) AS series"
+        ),
+        {'accounts': accounts, 'plan_id': plan_id, 'active': True, 'now': datetime.utcnow()}
+    )
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=1000000)
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--mode', choices=('reset', 'top_up'), default='reset')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_uri = os.getenv('DATABASE_URL') or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        app = create_app(database_uri)
+
+        with app.app_context():
+            db.create_all()
+            PartitionService().ensure_partitions()
+
+            plan = AllowancePlan.query.filter_by(name='bench').first() or AllowancePlan(name='bench')
+            plan.tokens, plan.period, plan.mode = 5000, 'monthly', args.mode
+            db.session.add(plan)
+            db.session.commit()
+
+            started = time.perf_counter()
+            populate(args.accounts, plan.id)
+            print(f"Banco: {db.engine.dialect.name} | {args.accounts} contas criadas em {time.perf_counter() - started:.1f}s")
+
+            service = PlanService()
+            first = service.apply_plan(plan, period='2025-01', chunk_size=args.chunk_size)
+            print(f"Aplicação ({args.mode}): {first['accounts']} contas, {first['chunks']} lotes, "
+                  f"{first['seconds']:.1f}s ({first['accounts'] / max(first['seconds'], 1e-9):,.0f} contas/s)")
+
+            again = service.apply_plan(plan, period='2025-01', chunk_size=args.chunk_size)
+            print(f"Reaplicação do mesmo período: {again['accounts']} contas em {again['seconds']:.2f}s")
+
+            ledger = db.session.execute(
+                text("SELECT count(*) FROM token_transactions WHERE request_id = :reason"),
+                {'reason': f"plan_{args.mode}:bench:2025-01"}
+            ).scalar()
+            blocked = db.session.execute(
+                text("SELECT count(*) FROM user_accounts WHERE librechat_user_id LIKE 'bench-%' AND is_blocked")
+            ).scalar()
+            print(f"Lançamentos no extrato: {ledger} | contas ainda bloqueadas: {blocked}")
+
+
+if __name__ == '__main__':
+    main()
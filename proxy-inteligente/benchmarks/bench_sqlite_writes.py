@@ -0,0 +1,130 @@
+"""Benchmark de escritas do extrato em SQLite com vários workers
+
+Simula os workers do gunicorn (processos) liquidando consumo em paralelo:
+SELECT do usuário, UPDATE de used_tokens, INSERT em token_transactions e
+COMMIT. Compara a configuração padrão do SQLite com o modo produção
+(WAL + PRAGMAs + fila única de escrita).
+
+Uso:
+    python benchmarks/bench_sqlite_writes.py --workers 4 --seconds 10
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import tempfile
+import multiprocessing
+from contextlib import nullcontext
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+from src.models.token_control import db
+from src.models.database import get_engine_options, apply_sqlite_pragmas, ledger_write_lock
+
+USERS = 100
+
+
+def build_engine(database_uri, tuned):
+    """Cria engine padrão ou em modo produção"""
+    if not tuned:
+        return create_engine(database_uri)
+
+    engine = create_engine(database_uri, **get_engine_options(database_uri))
+    event.listen(engine, 'connect', apply_sqlite_pragmas)
+    return engine
+
+
+def setup_database(database_uri):
+    """Cria tabelas e usuários de teste"""
+    engine = create_engine(database_uri)
+    db.metadata.create_all(engine)
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(
+            text(
+                "INSERT INTO user_accounts (id, librechat_user_id, email, total_tokens, used_tokens, "
+                "alert_threshold_80, alert_threshold_95, is_active, is_blocked, created_at, updated_at) "
+                "VALUES (:id, :id, :email, 1000000000, 0, 0.8, 0.95, 1, 0, :now, :now)"
+            ),
+            [{'id': f"user-{i}", 'email': f"user{i}@bench.local", 'now': now} for i in range(USERS)]
+        )
+    engine.dispose()
+
+
+def worker(database_uri, tuned, seconds, worker_id, results):
+    """Executa escritas até o tempo acabar"""
+    engine = build_engine(database_uri, tuned)
+    writes = 0
+    errors = 0
+    deadline = time.perf_counter() + seconds
+    i = worker_id
+
+    while time.perf_counter() < deadline:
+        user_id = f"user-{i % USERS}"
+        i += 1
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT used_tokens, total_tokens FROM user_accounts WHERE id = :id"), {'id': user_id}).first()
+                conn.rollback()
+                with ledger_write_lock(engine) if tuned else nullcontext():
+                    with conn.begin():
+                        conn.execute(
+                            text("UPDATE user_accounts SET used_tokens = used_tokens + 10 WHERE id = :id"),
+                            {'id': user_id}
+                        )
+                        conn.execute(
+                            text(
+                                "INSERT INTO token_transactions (id, user_account_id, tokens_used, model_used, created_at) "
+                                "VALUES (:id, :user_id, 10, 'gpt-4o', :now)"
+                            ),
+                            {'id': str(uuid.uuid4()), 'user_id': user_id, 'now': datetime.utcnow()}
+                        )
+            writes += 1
+        except OperationalError:
+            errors += 1
+
+    engine.dispose()
+    results.put((writes, errors))
+
+
+def run(tuned, workers, seconds):
+    """Executa um cenário e retorna (escritas/s, erros)"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_uri = f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        setup_database(database_uri)
+
+        results = multiprocessing.Queue()
+        processes = [
+            multiprocessing.Process(target=worker, args=(database_uri, tuned, seconds, n, results))
+            for n in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    writes = sum(t[0] for t in totals)
+    errors = sum(t[1] for t in totals)
+    return writes / seconds, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f"Workers: {args.workers} | Duração: {args.seconds}s por cenário")
+    for label, tuned in (('padrão (journal DELETE, synchronous FULL)', False),
+                         ('produção (WAL, NORMAL, mmap, fila de escrita)', True)):
+        rate, errors = run(tuned, args.workers, args.seconds)
+        print(f"{label:50s} {rate:10.1f} escritas/s  erros 'database is locked': {errors}")
+
+
+if __name__ == '__main__':
+    main()
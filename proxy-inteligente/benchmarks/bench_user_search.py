@@ -0,0 +1,147 @@
+"""Benchmark da busca de usuários (GET /v1/admin/users/search)
+
+Cria N contas com nomes e emails variados, roda buscas por prefixo, substring
+e com erro de digitação e mede a latência de cada uma (mediana e p95).
+Usa DATABASE_URL se definido (ex.: Postgres local, índices pg_trgm) ou um
+SQLite temporário (fallback com LIKE).
+
+Uso:
+    DATABASE_URL=postgresql://... python benchmarks/bench_user_search.py --accounts 1000000
+    python benchmarks/bench_user_search.py --accounts 100000
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import text
+from src.models.token_control import db
+from src.models.database import init_database
+from src.services.user_search_service import UserSearchService
+
+# Nomes sintéticos por sílabas (distribuição de trigramas parecida com nomes reais)
+SYLLABLES = ['ma', 'ri', 'an', 'na', 'jo', 'ao', 'lu', 'ca', 'pe', 'dro', 'fe', 'li', 'gu', 'bri', 'el',
+             'ra', 'fa', 'te', 'vi', 'ni', 'sa', 'mu', 'to', 'be', 'ti', 'ze', 'lo', 'go', 'mes', 'sil']
+DOMAINS = ['gmail.com', 'gmail.com', 'gmail.com', 'hotmail.com', 'outlook.com', 'yahoo.com.br',
+           'empresa.com.br', 'iasolaris.com.br']
+
+# Sílabas de cada parte do nome: (divisor, multiplicador) sobre o número da conta
+FIRST_PARTS = [(1, 1), (30, 7), (900, 13)]
+LAST_PARTS = [(27000, 1), (7, 11), (210, 17)]
+
+
+def person(n):
+    """Nome, sobrenome e domínio da conta n (mesma regra do INSERT)"""
+    def build(parts):
+        return ''.join(SYLLABLES[(n // divisor * factor) % len(SYLLABLES)] for divisor, factor in parts)
+    return build(FIRST_PARTS), build(LAST_PARTS), DOMAINS[n % len(DOMAINS)]
+
+
+def build_queries(accounts):
+    """(descrição, termo) de contas que existem no banco gerado"""
+    a, b, c = accounts // 3, accounts // 2, accounts - 7
+    first_a, last_a, _ = person(a)
+    first_b, last_b, _ = person(b)
+    first_c, last_c, _ = person(c)
+    typo = first_c[1] + first_c[0] + first_c[2:]
+    return [
+        ('prefixo de email', f"{first_a}.{last_a}"),
+        ('prefixo curto', 'ma'),
+        ('sobrenome', last_b),
+        ('substring de email', f"{last_b}{b}"),
+        ('nome completo', f"{first_c.title()} {last_c.title()}"),
+        ('erro de digitação', f"{typo}.{last_c}{c}"),
+        ('domínio', 'empresa.com.br'),
+        ('sem resultado', 'zzqxw'),
+    ]
+
+
+def create_app(database_uri):
+    """Aplicação mínima só com o banco"""
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    init_database(app)
+    return app
+
+
+def populate(accounts):
+    """Insere as contas direto no banco (nomes combinados a partir do número da conta)"""
+    db.session.execute(text("DELETE FROM user_accounts WHERE librechat_user_id LIKE 'search-%'"))
+
+    if db.engine.dialect.name == 'postgresql':
+        series = "SELECT n FROM generate_series(1, :accounts) AS n"
+    else:
+        series = "WITH RECURSIVE s(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM s WHERE n < :accounts) SELECT n FROM s"
+
+    def sql_build(parts):
+        return ' || '.join(
+            f"CASE (n / {divisor} * {factor}) % {len(SYLLABLES)} "
+            + ' '.join(f"WHEN {i} THEN '{syllable}'" for i, syllable in enumerate(SYLLABLES)) + " END"
+            for divisor, factor in parts
+        )
+
+    domain = f"CASE n % {len(DOMAINS)} " + ' '.join(f"WHEN {i} THEN '{d}'" for i, d in enumerate(DOMAINS)) + " END"
+    db.session.execute(
+        text(
+            "INSERT INTO user_accounts (id, librechat_user_id, email, name, total_tokens, used_tokens, "
+            "alert_threshold_80, alert_threshold_95, is_active, is_blocked, created_at, updated_at) "
+            "SELECT 'search-' || n, 'search-' || n, first || '.' || last || n || '@' || domain, "
+            "upper(substr(first, 1, 1)) || substr(first, 2) || ' ' || upper(substr(last, 1, 1)) || substr(last, 2), "
+            "1000, 0, 0.8, 0.95, :active, false, :now, :now FROM ("
+            f"  SELECT n, {sql_build(FIRST_PARTS)} AS first, {sql_build(LAST_PARTS)} AS last, {domain} AS domain "
+            f"  FROM ({series}) AS series"
+            ") AS people"
+        ),
+        {'accounts': accounts, 'active': True, 'now': datetime.utcnow()}
+    )
+    db.session.commit()
+
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute(text("ANALYZE user_accounts"))
+        db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--accounts', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--limit', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        database_uri = os.getenv('DATABASE_URL') or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+        app = create_app(database_uri)
+
+        with app.app_context():
+            db.create_all()
+
+            started = time.perf_counter()
+            populate(args.accounts)
+            print(f"Banco: {db.engine.dialect.name} | {args.accounts} contas criadas em {time.perf_counter() - started:.1f}s")
+
+            service = UserSearchService()
+            for label, term in build_queries(args.accounts):
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    users = service.search(term, limit=args.limit)
+                    timings.append((time.perf_counter() - started) * 1000)
+                    db.session.rollback()
+
+                timings.sort()
+                top = users[0] if users else None
+                best = f"{top['email']} ({top['match']})" if top else '-'
+                print(f"{label:<20} {term!r:<24} {len(users):>3} resultados | "
+                      f"mediana {statistics.median(timings):7.2f}ms | p95 {timings[int(len(timings) * 0.95) - 1]:7.2f}ms | "
+                      f"1º: {best}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Benchmark do tempo de boot de um worker (import da aplicação até a primeira consulta)
+
+Compara três formas de subir um worker:
+  legado    import + create_all + um SELECT por configuração padrão + commit
+            (o que src/main.py fazia em cada worker e a cada --max-requests)
+  import    import sem tocar no schema (banco preparado por `flask database init`)
+  preload   fork de um master que já importou a aplicação (gunicorn --preload)
+Usa DATABASE_URL se definido (ex.: Postgres local) ou um SQLite temporário.
+
+Uso:
+    python benchmarks/bench_worker_boot.py --workers 8
+    DATABASE_URL=postgresql://... python benchmarks/bench_worker_boot.py
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Worker em processo novo: imprime os segundos do início do interpretador até a primeira consulta
+WORKER_SCRIPT = '''
+import time
+started = time.perf_counter()
+import sys
+sys.path.insert(0, {root!r})
+from sqlalchemy import text
+from src.main import app
+from src.models.token_control import db, SystemConfig, DEFAULT_SYSTEM_CONFIGS
+with app.app_context():
+    if {legacy!r}:
+        db.create_all()
+        for key, value, description in DEFAULT_SYSTEM_CONFIGS:
+            if not SystemConfig.query.filter_by(key=key).first():
+                db.session.add(SystemConfig(key=key, value=value, description=description))
+        db.session.commit()
+    db.session.execute(text('SELECT 1'))
+print(time.perf_counter() - started)
+'''
+
+
+def spawn_worker(legacy):
+    """Sobe um worker em processo novo e retorna o tempo de boot (s)"""
+    output = subprocess.run(
+        [sys.executable, '-c', WORKER_SCRIPT.format(root=ROOT, legacy=legacy)],
+        capture_output=True, text=True, check=True, env=dict(os.environ, DB_INIT_ON_STARTUP='false')
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def fork_workers(app, workers):
+    """Faz fork do processo atual (aplicação já importada) e mede cada filho até a primeira consulta"""
+    from sqlalchemy import text
+    from src.models.token_control import db
+
+    timings = []
+    for _ in range(workers):
+        read_fd, write_fd = os.pipe()
+        started = time.perf_counter()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            with app.app_context():
+                db.session.execute(text('SELECT 1'))
+            os.write(write_fd, str(time.perf_counter() - started).encode())
+            os._exit(0)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as pipe:
+            timings.append(float(pipe.read()))
+        os.waitpid(pid, 0)
+    return timings
+
+
+def report(label, timings):
+    timings = sorted(timings)
+    print(f"{label:<10} mediana {statistics.median(timings) * 1000:8.1f}ms | "
+          f"máx {timings[-1] * 1000:8.1f}ms | total {sum(timings):6.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+        os.environ['DB_INIT_ON_STARTUP'] = 'false'
+
+        from src.main import app
+        from src.models.database import initialize_database
+        with app.app_context():
+            initialize_database()
+
+        print(f"Banco: {os.environ['DATABASE_URL'].split('://')[0]} | {args.workers} workers por cenário")
+        report('legado', [spawn_worker(legacy=True) for _ in range(args.workers)])
+        report('import', [spawn_worker(legacy=False) for _ in range(args.workers)])
+        report('preload', fork_workers(app, args.workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import update
+from src.models.token_control import db, UserAccount, AllowancePlan
+from src.models.database import initialize_database
+from src.services.partition_service import PartitionService
+from src.services.plan_service import PlanService, PERIODS, MODES
+from src.services.stats_service import StatsService
+
+# Preparação do banco (uma vez por deploy, antes de subir os workers):
+#   flask --app src.main database init
+database_cli = AppGroup('database', help='Schema e dados iniciais do banco')
+
+
+@database_cli.command('init')
+def init_database_command():
+    """Cria tabelas, colunas novas, configurações padrão e partições do extrato (idempotente)"""
+    result = initialize_database()
+    columns = ', '.join(result['columns']) or 'nenhuma nova'
+    partitions = ', '.join(result['partitions']) or 'nenhuma nova'
+    click.echo(f"Banco pronto: {result['configs']} configurações padrão criadas, colunas: {columns}, partições: {partitions}")
+    if PartitionService().is_legacy():
+        click.echo(LEGACY_LEDGER_WARNING, err=True)
+
+
+# Comandos de manutenção (executar via cron/agendador):
+#   flask --app src.main ledger ensure-partitions
+#   flask --app src.main ledger retention
+# Bancos criados antes do particionamento têm token_transactions comum (os dois
+# comandos acima não fazem nada nela). Converter uma vez, fora do horário de pico:
+#   flask --app src.main ledger partition-existing
+# e depois de conferir: DROP TABLE token_transactions_legacy
+ledger_cli = AppGroup('ledger', help='Manutenção do extrato de transações (token_transactions)')
+
+LEGACY_LEDGER_WARNING = (
+    'ATENÇÃO: token_transactions é uma tabela comum, criada antes do particionamento. '
+    'Partições e retenção não são aplicadas até converter com: flask --app src.main ledger partition-existing'
+)
+
+
+@ledger_cli.command('ensure-partitions')
+@click.option('--months-ahead', type=int, default=None, help='Meses futuros a criar (padrão: LEDGER_PARTITION_MONTHS_AHEAD)')
+def ensure_partitions_command(months_ahead):
+    """Cria as partições mensais do mês atual e dos próximos meses (e a DEFAULT)"""
+    service = PartitionService()
+    if not service.is_partitioned():
+        if service.is_legacy():
+            click.echo(LEGACY_LEDGER_WARNING, err=True)
+        else:
+            click.echo('token_transactions não é particionada (SQLite), nada a fazer')
+        return
+
+    created = service.ensure_partitions(months_ahead)
+    click.echo(f"Partições criadas: {', '.join(created) if created else 'nenhuma (já existiam)'}")
+
+
+@ledger_cli.command('retention')
+@click.option('--retention-months', type=int, default=None, help='Meses mantidos no banco (padrão: LEDGER_RETENTION_MONTHS)')
+@click.option('--archive-dir', type=click.Path(file_okay=False), default=None, help='Diretório dos arquivos exportados')
+def retention_command(retention_months, archive_dir):
+    """Arquiva (CSV gzip) e remove partições antigas"""
+    service = PartitionService()
+    if not service.is_partitioned():
+        if service.is_legacy():
+            click.echo(LEGACY_LEDGER_WARNING, err=True)
+        else:
+            click.echo('token_transactions não é particionada (SQLite), nada a fazer')
+        return
+
+    archived = service.apply_retention(retention_months, archive_dir)
+    for item in archived:
+        click.echo(f"{item['partition']}: {item['rows']} linhas -> {item['file']}")
+    if not archived:
+        click.echo('Nenhuma partição fora da retenção')
+
+
+@ledger_cli.command('partition-existing')
+def partition_existing_command():
+    """Converte a token_transactions comum (bancos anteriores ao particionamento) em particionada"""
+    service = PartitionService()
+    if not service.is_legacy():
+        click.echo('token_transactions já é particionada (ou o banco é SQLite), nada a fazer')
+        return
+
+    result = service.partition_existing()
+    click.echo(f"token_transactions particionada: {result['rows']} linhas em {result['partitions']} partições; "
+               f"a tabela antiga ficou como {result['legacy_table']} (DROP TABLE depois de conferir)")
+
+
+# Cotas periódicas (agendar diariamente; cada período é aplicado uma única vez):
+#   flask --app src.main plans apply
+plans_cli = AppGroup('plans', help='Planos de cota periódica (mensal/semanal)')
+
+
+@plans_cli.command('create')
+@click.argument('name')
+@click.option('--tokens', type=int, required=True, help='Tokens por período')
+@click.option('--period', type=click.Choice(PERIODS), default='monthly', show_default=True)
+@click.option('--mode', type=click.Choice(MODES), default='reset', show_default=True,
+              help='reset: total = cota e uso zerado | top_up: soma a cota ao total')
+def create_plan_command(name, tokens, period, mode):
+    """Cria ou atualiza um plano"""
+    plan = AllowancePlan.query.filter_by(name=name).first()
+    if plan is None:
+        plan = AllowancePlan(name=name)
+        db.session.add(plan)
+    plan.tokens, plan.period, plan.mode, plan.is_active = tokens, period, mode, True
+    db.session.commit()
+    click.echo(f"Plano {plan.name}: {plan.tokens} tokens, {plan.period}, {plan.mode} (id {plan.id})")
+
+
+@plans_cli.command('list')
+def list_plans_command():
+    """Lista os planos e a quantidade de contas em cada um"""
+    for plan in AllowancePlan.query.order_by(AllowancePlan.name).all():
+        accounts = UserAccount.query.filter_by(plan_id=plan.id).count()
+        status = 'ativo' if plan.is_active else 'inativo'
+        click.echo(f"{plan.name}: {plan.tokens} tokens, {plan.period}, {plan.mode}, {status}, {accounts} contas")
+
+
+@plans_cli.command('assign')
+@click.argument('name')
+@click.argument('librechat_user_ids', nargs=-1)
+@click.option('--unassigned', is_flag=True, help='Atribui a todas as contas sem plano')
+def assign_plan_command(name, librechat_user_ids, unassigned):
+    """Atribui o plano às contas informadas (ou a todas sem plano)"""
+    plan = AllowancePlan.query.filter_by(name=name).first()
+    if plan is None:
+        raise click.ClickException(f"Plano {name} não encontrado")
+    if not librechat_user_ids and not unassigned:
+        raise click.UsageError('Informe os usuários ou use --unassigned')
+
+    query = update(UserAccount).values(plan_id=plan.id)
+    if unassigned:
+        query = query.where(UserAccount.plan_id.is_(None))
+    else:
+        query = query.where(UserAccount.librechat_user_id.in_(librechat_user_ids))
+
+    result = db.session.execute(query)
+    db.session.commit()
+    click.echo(f"{result.rowcount} contas atribuídas ao plano {plan.name}")
+
+
+@plans_cli.command('apply')
+@click.option('--plan', 'name', default=None, help='Aplica apenas este plano')
+@click.option('--period', default=None, help='Período explícito (ex.: 2025-01, 2025-W03); padrão: atual')
+@click.option('--chunk-size', type=int, default=None, help='Contas por transação (padrão: PLAN_APPLY_CHUNK_SIZE)')
+def apply_plans_command(name, period, chunk_size):
+    """Aplica as cotas do período às contas que ainda não o receberam"""
+    service = PlanService()
+    if name:
+        plan = AllowancePlan.query.filter_by(name=name).first()
+        if plan is None:
+            raise click.ClickException(f"Plano {name} não encontrado")
+        results = [service.apply_plan(plan, period=period, chunk_size=chunk_size)]
+    else:
+        if period:
+            raise click.UsageError('--period exige --plan')
+        results = service.apply_all(chunk_size=chunk_size)
+
+    for item in results:
+        click.echo(f"{item['plan']} ({item['period']}): {item['accounts']} contas em {item['chunks']} lotes, {item['seconds']:.1f}s")
+    if not results:
+        click.echo('Nenhum plano ativo')
+
+
+# Rollup de consumo por hora (agendar a cada poucos minutos; o ranking só lê e
+# calcula do extrato o que ainda não foi agregado, então atrasos só custam tempo de consulta):
+#   flask --app src.main stats rollup
+stats_cli = AppGroup('stats', help='Agregados do painel administrativo')
+
+
+@stats_cli.command('rollup')
+def rollup_command():
+    """Atualiza o consumo por usuário e hora (user_usage_hourly)"""
+    result = StatsService().refresh_usage_rollups()
+    click.echo(f"Rollup desde {result['since']}: {result['buckets']} horas/usuário atualizadas, {result['pruned']} removidas")
+
+
+queries_cli = AppGroup('queries', help='Orçamento de consultas SQL por endpoint')
+
+
+@queries_cli.command('check')
+def check_queries_command():
+    """Executa os endpoints de QUERY_BUDGETS e falha se algum passar do máximo (use um banco de teste)"""
+    from flask import current_app
+    from src.services.query_accounting import check_query_budgets
+
+    failures = 0
+    for path, status, count, max_queries in check_query_budgets(current_app._get_current_object()):
+        over = count > max_queries or status >= 500
+        failures += over
+        click.echo(f"{'FALHOU' if over else 'ok':<7} {path:<32} {count:>3}/{max_queries} consultas (HTTP {status})")
+
+    if failures:
+        raise click.ClickException(f"{failures} endpoint(s) acima do orçamento de consultas")
+
+
+def register_cli(app):
+    """Registra comandos de manutenção na aplicação"""
+    app.cli.add_command(database_cli)
+    app.cli.add_command(ledger_cli)
+    app.cli.add_command(plans_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(queries_cli)
@@ -0,0 +1,67 @@
+import os
+import logging
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Sem orjson: provider padrão do Flask (json da stdlib)
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON da API (request.get_json, jsonify) com orjson quando instalado
+
+    A saída é a mesma do provider padrão: chaves ordenadas, datas no formato
+    HTTP e Decimal/UUID como texto (via `default`). Chamadas com argumentos
+    do json da stdlib (indent, cls, ...) e valores que o orjson recusa (ex.:
+    inteiros acima de 64 bits) caem no provider padrão.
+    """
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.native = orjson is not None and os.getenv('JSON_PROVIDER', 'auto').lower() != 'stdlib'
+
+    def _options(self, pretty: bool = False) -> int:
+        """Flags do orjson equivalentes à configuração do provider"""
+        # Datas passam pelo `default` do Flask (http_date), como no provider padrão
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def dumps_bytes(self, obj, pretty: bool = False) -> bytes:
+        """Serializa direto para bytes UTF-8 (sem str intermediária)"""
+        if self.native:
+            try:
+                return orjson.dumps(obj, default=self.default, option=self._options(pretty))
+            except TypeError:
+                pass
+        if pretty:
+            return super().dumps(obj, indent=2).encode('utf-8')
+        return super().dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def dumps(self, obj, **kwargs) -> str:
+        if self.native and not kwargs:
+            return self.dumps_bytes(obj).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if self.native and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        pretty = (self.compact is None and self._app.debug) or self.compact is False
+        return self._app.response_class(self.dumps_bytes(obj, pretty) + b'\n', mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Instala o provider JSON rápido na aplicação"""
+    app.json_provider_class = FastJSONProvider
+    app.json = FastJSONProvider(app)
+    logger.info(f"JSON da API: {'orjson' if app.json.native else 'json (stdlib)'}")
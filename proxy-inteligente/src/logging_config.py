@@ -0,0 +1,179 @@
+"""Logging da aplicação fora do caminho da requisição
+
+O root logger recebe um QueueHandler: a thread da requisição só enfileira o
+LogRecord (sem formatar a mensagem nem escrever em stderr) e uma thread por
+processo (QueueListener) formata e escreve. Fila cheia descarta o registro em
+vez de bloquear a requisição (métrica log_records_dropped_total).
+
+  LOG_FORMAT=json      um objeto JSON por linha (mensagem, logger, nível,
+                       trace_id/span_id do tracing e campos de `extra=`)
+  LOG_SAMPLE_RATES     fração mantida dos registros INFO/DEBUG por logger
+                       (ex.: src.services.litellm_service=0.1); WARNING e
+                       acima passam sempre
+  LOG_MAX_MESSAGE_CHARS  mensagens e campos de texto maiores são cortados
+                       (ex.: corpo de erro do upstream)
+
+Como a mensagem é montada na thread do listener, use argumentos no estilo
+%s (logger.info("... %s", valor)) no caminho quente e não passe objetos que
+a requisição ainda vai alterar.
+"""
+import os
+import sys
+import json
+import queue
+import atexit
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+from src.services.metrics_service import metrics
+from src.services.tracing_service import tracer
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Atributos do próprio LogRecord: o que sobrar veio de `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+records_dropped = metrics.counter('log_records_dropped_total', 'Registros de log descartados com a fila cheia')
+
+_handler: Optional['AsyncQueueHandler'] = None
+_listener: Optional[QueueListener] = None
+
+
+def truncate(value: str, max_chars: int) -> str:
+    """Corta o texto em max_chars (0 = sem limite), indicando quanto foi omitido"""
+    if max_chars and len(value) > max_chars:
+        return f"{value[:max_chars]}… [+{len(value) - max_chars} caracteres]"
+    return value
+
+
+class TextFormatter(logging.Formatter):
+    """Formato texto de sempre, com a mensagem limitada a max_chars"""
+
+    def __init__(self, max_chars: int):
+        super().__init__(TEXT_FORMAT)
+        self.max_chars = max_chars
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        record.message = truncate(record.message, self.max_chars)
+        return super().formatMessage(record)
+
+
+class JSONFormatter(logging.Formatter):
+    """Um objeto JSON por registro: ts, level, logger, message + campos extras"""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': truncate(record.getMessage(), self.max_chars)
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = truncate(value, self.max_chars) if isinstance(value, str) else value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TraceContextFilter(logging.Filter):
+    """Anexa trace_id/span_id do span atual (roda na thread que logou)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        span = tracer.current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Mantém uma fração dos registros abaixo de WARNING de um logger"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class AsyncQueueHandler(QueueHandler):
+    """Enfileira o registro sem formatar e sem bloquear (fila limitada a max_size)"""
+
+    def __init__(self, max_size: int):
+        # SimpleQueue (em C) custa menos por registro que queue.Queue; o limite é checado no qsize()
+        super().__init__(queue.SimpleQueue())
+        self.max_size = max_size
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # A mensagem (record.getMessage) é montada pelo formatter na thread do listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        if self.max_size and self.queue.qsize() >= self.max_size:
+            records_dropped.inc(logger=record.name)
+            return
+        self.queue.put_nowait(record)
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """'logger=taxa,logger=taxa' -> {logger: taxa}"""
+    rates = {}
+    for item in value.split(','):
+        name, _, rate = item.strip().partition('=')
+        if name and rate:
+            rates[name.strip()] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+def _start_listener(output: logging.Handler):
+    global _listener
+    _handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_handler.queue, output, respect_handler_level=True)
+    _listener.start()
+
+
+def _stop_listener():
+    """Escreve o que ainda está na fila ao encerrar o processo"""
+    if _listener is not None:
+        _listener.stop()
+
+
+def configure_logging():
+    """Configura o root logger (uma vez por processo)"""
+    global _handler
+    if _handler is not None:
+        return
+
+    max_chars = int(os.getenv('LOG_MAX_MESSAGE_CHARS', '2000'))
+    output = logging.StreamHandler(sys.stderr)
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        output.setFormatter(JSONFormatter(max_chars))
+    else:
+        output.setFormatter(TextFormatter(max_chars))
+
+    _handler = AsyncQueueHandler(int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    _handler.addFilter(TraceContextFilter())
+    _start_listener(output)
+    atexit.register(_stop_listener)
+    # gunicorn --preload: a thread do listener do master não existe nos workers
+    os.register_at_fork(after_in_child=lambda: _start_listener(output))
+
+    root = logging.getLogger()
+    root.setLevel(os.getenv('LOG_LEVEL', 'INFO').upper())
+    root.addHandler(_handler)
+
+    for name, rate in parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', '')).items():
+        if rate < 1:
+            logging.getLogger(name).addFilter(SamplingFilter(rate))
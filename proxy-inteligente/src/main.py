@@ -5,16 +5,19 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory, jsonify
 from flask_cors import CORS
-from src.models.token_control import db
+from src.models.database import init_database, initialize_database
+from src.cli import register_cli
+from src.json_provider import init_json
+from src.logging_config import configure_logging
+from src.services.profiling_service import init_profiling
+from src.services.query_accounting import init_query_accounting
+from src.services.tracing_service import init_tracing
+from src.services.event_service import init_events
 from src.routes.user import user_bp
 from src.routes.proxy_routes import proxy_bp
-import logging
 
-# Configurar logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configurar logging (fila + thread de escrita; LOG_FORMAT, LOG_SAMPLE_RATES, LOG_MAX_MESSAGE_CHARS)
+configure_logging()
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 
@@ -30,6 +33,9 @@ else:
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+# JSON das requisições e respostas com orjson quando instalado (JSON_PROVIDER=stdlib desativa)
+init_json(app)
+
 # Configurar CORS
 CORS(app, origins="*")
 
@@ -38,34 +44,28 @@ app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(proxy_bp, url_prefix='/v1')  # Compatível com OpenAI API
 
 # Inicializar banco de dados
-db.init_app(app)
+init_database(app)
 
-with app.app_context():
-    db.create_all()
-    
-    # Criar configurações padrão
-    from src.models.token_control import SystemConfig
-    
-    # Configurações padrão do sistema
-    default_configs = [
-        ('default_tokens_per_user', '1000', 'Tokens padrão para novos usuários'),
-        ('conversion_factor', '0.376', 'Fator de conversão de tokens'),
-        ('alert_threshold_80', '0.8', 'Limite para alerta de 80%'),
-        ('alert_threshold_95', '0.95', 'Limite para alerta de 95%'),
-        ('credits_email', 'creditos@iasolaris.com.br', 'Email para compra de créditos'),
-        ('system_name', 'IA SOLARIS', 'Nome do sistema'),
-    ]
-    
-    for key, value, description in default_configs:
-        existing = SystemConfig.query.filter_by(key=key).first()
-        if not existing:
-            config = SystemConfig(key=key, value=value, description=description)
-            db.session.add(config)
-    
-    try:
-        db.session.commit()
-    except:
-        db.session.rollback()
+# Consultas SQL e tempo de banco por requisição (métricas; headers X-DB-* em debug)
+init_query_accounting(app)
+
+# Tracing das requisições /v1 (desligado sem TRACE_EXPORTER=memory|file)
+init_tracing(app)
+
+# Eventos do painel (SSE); com vários workers exige REDIS_URL
+init_events(app)
+
+# Profiling amostrado por requisição (desligado sem PROFILE_SAMPLE_RATE / PROFILE_ADMIN_TOKEN)
+init_profiling(app)
+
+# Comandos de manutenção (flask ledger ...)
+register_cli(app)
+
+# Schema, configurações padrão e partições: `flask --app src.main database init`
+# (uma vez por deploy). Os workers não tocam no banco ao importar a aplicação.
+if os.getenv('DB_INIT_ON_STARTUP', 'false').lower() == 'true':
+    with app.app_context():
+        initialize_database()
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -119,4 +119,8 @@ if __name__ == '__main__':
     print(f"🔗 Health check: http://localhost:{port}/v1/health")
     print(f"💬 Chat endpoint: http://localhost:{port}/v1/chat/completions")
     
+    # Servidor de desenvolvimento: prepara o banco local antes de subir
+    with app.app_context():
+        initialize_database()
+    
     app.run(host='0.0.0.0', port=port, debug=debug)
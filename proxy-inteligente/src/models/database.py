@@ -0,0 +1,385 @@
+import os
+import time
+import weakref
+import logging
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Any, List
+from flask import current_app, g, has_app_context
+from sqlalchemy import create_engine, event, inspect as sa_inspect, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import QueuePool
+from src.models.token_control import db, SystemConfig, DEFAULT_SYSTEM_CONFIGS
+from src.models.session import ROUTE_PRIMARY, ROUTE_REPLICA
+from src.services.metrics_service import metrics
+from src.services.cache_service import set_flag, has_flag, get_redis
+from src.services.partition_service import PartitionService
+
+try:
+    import fcntl
+except ImportError:  # Windows: apenas o lock entre threads do processo
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Lock entre threads do mesmo processo (o flock cobre os demais workers)
+_ledger_thread_lock = threading.Lock()
+
+
+# Pools instrumentados ativos (para exportar métricas de uso)
+_instrumented_pools = weakref.WeakSet()
+
+pool_checkout_wait = metrics.histogram(
+    'db_pool_checkout_wait_seconds',
+    'Tempo de espera para obter conexão do pool'
+)
+pool_invalidations = metrics.counter(
+    'db_pool_invalidations_total',
+    'Conexões invalidadas (queda do banco, falha no pre-ping)'
+)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mede o tempo de espera no checkout"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        _instrumented_pools.add(self)
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_checkout_wait.observe(time.perf_counter() - started, pool=self.logging_name or 'default')
+
+
+def _collect_pool_metrics():
+    """Coleta uso atual dos pools no momento da exportação"""
+    in_use, size, overflow = [], [], []
+    for pool in list(_instrumented_pools):
+        labels = {'pool': pool.logging_name or 'default'}
+        in_use.append((labels, pool.checkedout()))
+        size.append((labels, pool.size()))
+        overflow.append((labels, max(0, pool.overflow())))
+
+    return [
+        ('db_pool_connections_in_use', 'gauge', 'Conexões em uso (checked out)', in_use),
+        ('db_pool_size', 'gauge', 'Tamanho configurado do pool', size),
+        ('db_pool_overflow', 'gauge', 'Conexões abertas além do pool_size', overflow),
+    ]
+
+
+metrics.register_collector(_collect_pool_metrics)
+
+
+def get_pool_settings() -> Dict[str, Any]:
+    """Obtém configurações do pool de conexões (Postgres)"""
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '30')),
+        'pool_recycle': int(os.getenv('DB_POOL_RECYCLE', '1800')),
+        'pool_pre_ping': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        'statement_timeout_ms': int(os.getenv('DB_STATEMENT_TIMEOUT_MS', '0')),
+        'pgbouncer_mode': os.getenv('DB_PGBOUNCER_MODE', 'false').lower() == 'true',
+    }
+
+
+def get_sqlite_settings() -> Dict[str, Any]:
+    """Obtém configurações do modo SQLite de produção"""
+    return {
+        'journal_mode': os.getenv('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        'busy_timeout_ms': int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', '15000')),
+        'cache_size_kb': int(os.getenv('SQLITE_CACHE_SIZE_KB', '20000')),
+        'write_lock': os.getenv('SQLITE_WRITE_LOCK', 'false').lower() == 'true',
+    }
+
+
+def get_engine_options(database_uri: str, name: str = 'primary') -> Dict[str, Any]:
+    """Monta as opções de engine do SQLAlchemy para o banco configurado"""
+    options = {}
+    url = make_url(database_uri)
+
+    if url.get_backend_name() == 'sqlite':
+        settings = get_sqlite_settings()
+        # Timeout do driver igual ao busy_timeout (em segundos)
+        options['connect_args'] = {'timeout': settings['busy_timeout_ms'] / 1000}
+
+        if url.database and url.database != ':memory:':
+            options['poolclass'] = InstrumentedQueuePool
+            options['pool_logging_name'] = name
+
+        return options
+
+    settings = get_pool_settings()
+    options.update({
+        'poolclass': InstrumentedQueuePool,
+        'pool_logging_name': name,
+        'pool_size': settings['pool_size'],
+        'max_overflow': settings['max_overflow'],
+        'pool_timeout': settings['pool_timeout'],
+        'pool_recycle': settings['pool_recycle'],
+        'pool_pre_ping': settings['pool_pre_ping'],
+    })
+
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql':
+        if settings['pgbouncer_mode']:
+            # PgBouncer em transaction pooling: sem prepared statements no servidor
+            # (psycopg2 não usa; psycopg 3 precisa desativar o prepare automático)
+            if url.get_driver_name() == 'psycopg':
+                connect_args['prepare_threshold'] = None
+        elif settings['statement_timeout_ms'] > 0:
+            # Parâmetro de sessão na conexão (PgBouncer rejeita startup options)
+            connect_args['options'] = f"-c statement_timeout={settings['statement_timeout_ms']}"
+
+    if connect_args:
+        options['connect_args'] = connect_args
+
+    return options
+
+
+def _set_local_statement_timeout(conn):
+    """Aplica statement_timeout por transação (compatível com PgBouncer)"""
+    timeout_ms = get_pool_settings()['statement_timeout_ms']
+    conn.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+
+
+def _on_invalidate(dbapi_connection, connection_record, exception):
+    """Conta conexões invalidadas"""
+    pool_invalidations.inc()
+
+
+def configure_engine(engine):
+    """Registra hooks de conexão na engine conforme o dialeto"""
+    if engine.dialect.name == 'sqlite':
+        event.listen(engine, 'connect', apply_sqlite_pragmas)
+        logger.info(f"SQLite em modo produção: {get_sqlite_settings()}")
+        return
+
+    event.listen(engine, 'invalidate', _on_invalidate)
+
+    settings = get_pool_settings()
+    if engine.dialect.name == 'postgresql' and settings['pgbouncer_mode'] and settings['statement_timeout_ms'] > 0:
+        event.listen(engine, 'begin', _set_local_statement_timeout)
+
+    logger.info(
+        f"Pool de conexões: size={settings['pool_size']} overflow={settings['max_overflow']} "
+        f"recycle={settings['pool_recycle']}s pre_ping={settings['pool_pre_ping']} "
+        f"pgbouncer={settings['pgbouncer_mode']}"
+    )
+
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """Aplica os PRAGMAs de produção em cada nova conexão SQLite"""
+    settings = get_sqlite_settings()
+
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+        cursor.execute(f"PRAGMA synchronous={settings['synchronous']}")
+        cursor.execute(f"PRAGMA busy_timeout={settings['busy_timeout_ms']}")
+        cursor.execute(f"PRAGMA mmap_size={settings['mmap_size']}")
+        cursor.execute(f"PRAGMA cache_size=-{settings['cache_size_kb']}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+
+def init_database(app):
+    """Configura a engine e inicializa o SQLAlchemy na aplicação"""
+    database_uri = app.config['SQLALCHEMY_DATABASE_URI']
+
+    engine_options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in get_engine_options(database_uri).items():
+        engine_options.setdefault(key, value)
+
+    db.init_app(app)
+
+    with app.app_context():
+        configure_engine(db.engine)
+
+    # Réplicas de leitura (opcional)
+    replicas = []
+    for i, replica_url in enumerate(get_replica_urls()):
+        engine = create_engine(replica_url, **get_engine_options(replica_url, name=f"replica{i}"))
+        configure_engine(engine)
+        replicas.append(engine)
+
+    app.extensions['db_replicas'] = replicas
+    if replicas:
+        logger.info(f"{len(replicas)} réplica(s) de leitura configurada(s)")
+        if get_redis() is None:
+            logger.warning(
+                "Réplicas sem REDIS_URL: a leitura no primário após uma escrita (DB_REPLICA_PIN_SECONDS) "
+                "vale só para o worker que escreveu; com vários workers configure o Redis"
+            )
+
+    # gunicorn --preload: o master importa a aplicação antes do fork; cada worker
+    # descarta as conexões herdadas (sem fechá-las) e abre as suas
+    if hasattr(os, 'register_at_fork'):
+        with app.app_context():
+            engines = list(db.engines.values()) + replicas
+        os.register_at_fork(after_in_child=lambda: [engine.dispose(close=False) for engine in engines])
+
+
+def seed_default_configs() -> int:
+    """Grava as configurações padrão que ainda não existem (um único INSERT ... ON CONFLICT)"""
+    now = datetime.utcnow()
+    insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+    statement = insert(SystemConfig).values([
+        {'id': str(uuid.uuid4()), 'key': key, 'value': value, 'description': description,
+         'created_at': now, 'updated_at': now}
+        for key, value, description in DEFAULT_SYSTEM_CONFIGS
+    ]).on_conflict_do_nothing(index_elements=['key'])
+    result = db.session.execute(statement)
+    db.session.commit()
+    return result.rowcount
+
+
+def _column_ddl(column, dialect) -> str:
+    """Definição da coluna para ALTER TABLE ... ADD COLUMN (com a FK, se houver)"""
+    ddl = str(CreateColumn(column).compile(dialect=dialect))
+    for foreign_key in column.foreign_keys:
+        target = foreign_key.column
+        ddl += f' REFERENCES "{target.table.name}" ("{target.name}")'
+    return ddl
+
+
+def add_missing_columns() -> List[str]:
+    """Adiciona as colunas novas do modelo às tabelas que já existem (idempotente)
+
+    db.create_all só cria tabelas inexistentes; bancos criados por versões
+    anteriores recebem aqui as colunas novas e os índices que as usam.
+    """
+    engine = db.engine
+    inspector = sa_inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    added = []
+    new_columns = set()
+    with engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                # NOT NULL só com server_default (valor das linhas atuais); sem ele, migração manual
+                if not column.nullable and column.server_default is None:
+                    logger.warning(f"Coluna {table.name}.{column.name} NOT NULL não adicionada automaticamente")
+                    continue
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN {_column_ddl(column, engine.dialect)}'))
+                added.append(f"{table.name}.{column.name}")
+                new_columns.add(column)
+
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                if new_columns.intersection(index.columns):
+                    index.create(conn, checkfirst=True)
+
+    if added:
+        logger.info(f"Colunas adicionadas: {', '.join(added)}")
+    return added
+
+
+def initialize_database() -> Dict[str, Any]:
+    """Cria o schema, as colunas novas, as configurações padrão e as partições do extrato (idempotente)
+
+    Roda uma vez por deploy (`flask database init`), não no import de cada worker.
+    """
+    db.create_all()
+    columns = add_missing_columns()
+    seeded = seed_default_configs()
+    partitions = PartitionService().ensure_partitions()
+    return {'configs': seeded, 'columns': columns, 'partitions': partitions}
+
+
+def get_replica_urls():
+    """Obtém URLs das réplicas de leitura (DATABASE_REPLICA_URLS, separadas por vírgula)"""
+    return [url.strip() for url in os.getenv('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+def _pin_key(user_key: str) -> str:
+    return f"ia_solaris:db_pin:{user_key}"
+
+
+def pin_primary(user_key: str):
+    """Fixa as leituras do usuário no primário por alguns segundos (read-your-writes)"""
+    if not user_key:
+        return
+    ttl = float(os.getenv('DB_REPLICA_PIN_SECONDS', '10'))
+    set_flag(_pin_key(user_key), ttl)
+
+
+def route_reads_to_replica(user_key: str = None) -> bool:
+    """Direciona as leituras da requisição atual para a réplica, se o usuário não estiver fixado"""
+    if not has_app_context() or not current_app.extensions.get('db_replicas'):
+        return False
+
+    # Em caso de erro no Redis assume que há escrita recente (lê do primário)
+    if user_key and has_flag(_pin_key(user_key), default_on_error=True):
+        g.db_route = ROUTE_PRIMARY
+        return False
+
+    g.db_route = ROUTE_REPLICA
+    return True
+
+
+@contextmanager
+def use_primary():
+    """Força leituras no primário dentro do bloco"""
+    previous = g.get('db_route')
+    g.db_route = ROUTE_PRIMARY
+    try:
+        yield
+    finally:
+        g.db_route = previous
+
+
+def is_reading_from_replica() -> bool:
+    """Verifica se as leituras da requisição atual vão para a réplica"""
+    return has_app_context() and g.get('db_route') == ROUTE_REPLICA
+
+
+def _get_lock_path(engine) -> str:
+    """Obtém caminho do arquivo de lock de escrita (None para bancos em memória)"""
+    database = engine.url.database
+    if not database or database == ':memory:' or database.startswith('file::memory:'):
+        return None
+    return f"{database}.write-lock"
+
+
+@contextmanager
+def ledger_write_lock(engine=None):
+    """Serializa as escritas do extrato entre workers (SQLite com SQLITE_WRITE_LOCK=true)
+
+    Os workers aguardam em um flock (fila do kernel) em vez de disputar o
+    lock do SQLite no busy handler. Em Postgres não faz nada.
+    """
+    engine = engine or db.engine
+    lock_path = _get_lock_path(engine) if engine.dialect.name == 'sqlite' else None
+
+    if lock_path is None or not get_sqlite_settings()['write_lock']:
+        yield
+        return
+
+    with _ledger_thread_lock:
+        if fcntl is None:
+            yield
+            return
+
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
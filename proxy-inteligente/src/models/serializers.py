@@ -0,0 +1,123 @@
+"""Modelos de leitura: linhas SQL (tuplas) direto para JSON
+
+Listas (/v1/user/usage, /v1/user/alerts, /v1/user/info, /v1/admin/users e
+rankings do painel) selecionam só as colunas necessárias, com os campos
+calculados (remaining_tokens, usage_percentage) já no SELECT, e montam o
+dicionário a partir da tupla, sem instanciar objetos ORM nem passar pelo
+identity map da sessão. O formato é o mesmo de `to_dict()`.
+"""
+from typing import Any, Dict
+from sqlalchemy import select, case, literal_column
+from src.models.token_control import UserAccount, TokenTransaction, UserAlert, USAGE_RATIO
+
+TRANSACTION_COLUMNS = (
+    'id', 'user_account_id', 'tokens_used', 'model_used', 'request_id', 'cost_usd',
+    'prompt_tokens', 'completion_tokens', 'total_tokens', 'created_at'
+)
+
+USER_COLUMNS = (
+    'id', 'librechat_user_id', 'email', 'name', 'total_tokens', 'used_tokens',
+    'alert_threshold_80', 'alert_threshold_95', 'is_active', 'is_blocked',
+    'plan_id', 'plan_period', 'priority_tier', 'created_at', 'updated_at', 'last_activity'
+)
+
+ALERT_COLUMNS = (
+    'id', 'user_account_id', 'alert_type', 'alert_message', 'is_sent', 'is_resolved',
+    'created_at', 'sent_at', 'resolved_at'
+)
+
+# Propriedades de UserAccount calculadas no banco (mesma aritmética de ponto flutuante)
+REMAINING_TOKENS = case(
+    (UserAccount.total_tokens > UserAccount.used_tokens, UserAccount.total_tokens - UserAccount.used_tokens),
+    else_=literal_column('0')
+)
+USAGE_PERCENTAGE = USAGE_RATIO * literal_column('100')
+
+# Colunas de select_users() antes das extras
+USER_ROW_WIDTH = len(USER_COLUMNS) + 2
+
+
+def select_transactions():
+    """SELECT das colunas de TokenTransaction.to_dict()"""
+    table = TokenTransaction.__table__
+    return select(*[table.c[name] for name in TRANSACTION_COLUMNS])
+
+
+def select_users(*extra):
+    """SELECT de UserAccount.to_dict() com os campos calculados (+ colunas extras no fim)"""
+    table = UserAccount.__table__
+    return select(
+        *[table.c[name] for name in USER_COLUMNS],
+        REMAINING_TOKENS.label('remaining_tokens'),
+        USAGE_PERCENTAGE.label('usage_percentage'),
+        *extra
+    )
+
+
+def select_alerts():
+    """SELECT das colunas de UserAlert.to_dict()"""
+    table = UserAlert.__table__
+    return select(*[table.c[name] for name in ALERT_COLUMNS])
+
+
+def transaction_row(row) -> Dict[str, Any]:
+    """Linha de select_transactions() no formato de TokenTransaction.to_dict()"""
+    (id, user_account_id, tokens_used, model_used, request_id, cost_usd,
+     prompt_tokens, completion_tokens, total_tokens, created_at) = row
+    return {
+        'id': id,
+        'user_account_id': user_account_id,
+        'tokens_used': tokens_used,
+        'model_used': model_used,
+        'request_id': request_id,
+        'cost_usd': float(cost_usd) if cost_usd else None,
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': total_tokens,
+        'created_at': created_at.isoformat()
+    }
+
+
+def user_row(row) -> Dict[str, Any]:
+    """Linha de select_users() no formato de UserAccount.to_dict() (colunas extras ignoradas)"""
+    (id, librechat_user_id, email, name, total_tokens, used_tokens,
+     alert_threshold_80, alert_threshold_95, is_active, is_blocked,
+     plan_id, plan_period, priority_tier, created_at, updated_at, last_activity,
+     remaining_tokens, usage_percentage) = row[:USER_ROW_WIDTH]
+    return {
+        'id': id,
+        'librechat_user_id': librechat_user_id,
+        'email': email,
+        'name': name,
+        'total_tokens': total_tokens,
+        'used_tokens': used_tokens,
+        'remaining_tokens': remaining_tokens,
+        'usage_percentage': round(usage_percentage, 2),
+        'is_active': is_active,
+        'is_blocked': is_blocked,
+        'plan_id': plan_id,
+        'plan_period': plan_period,
+        'priority_tier': priority_tier,
+        'should_alert_80': usage_percentage >= (alert_threshold_80 * 100),
+        'should_alert_95': usage_percentage >= (alert_threshold_95 * 100),
+        'created_at': created_at.isoformat(),
+        'updated_at': updated_at.isoformat(),
+        'last_activity': last_activity.isoformat() if last_activity else None
+    }
+
+
+def alert_row(row) -> Dict[str, Any]:
+    """Linha de select_alerts() no formato de UserAlert.to_dict()"""
+    (id, user_account_id, alert_type, alert_message, is_sent, is_resolved,
+     created_at, sent_at, resolved_at) = row
+    return {
+        'id': id,
+        'user_account_id': user_account_id,
+        'alert_type': alert_type,
+        'alert_message': alert_message,
+        'is_sent': is_sent,
+        'is_resolved': is_resolved,
+        'created_at': created_at.isoformat(),
+        'sent_at': sent_at.isoformat() if sent_at else None,
+        'resolved_at': resolved_at.isoformat() if resolved_at else None
+    }
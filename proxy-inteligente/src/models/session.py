@@ -0,0 +1,40 @@
+import random
+from flask import current_app, g, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy.sql import Select
+
+# Rotas possíveis para as consultas da requisição atual
+ROUTE_PRIMARY = 'primary'
+ROUTE_REPLICA = 'replica'
+
+
+class RoutingSession(Session):
+    """Sessão que envia leituras de endpoints somente leitura para réplicas
+
+    Escritas (flush), SELECT ... FOR UPDATE e qualquer comando fora de um
+    SELECT sempre usam o banco primário. A réplica é sorteada uma vez por
+    requisição: contagem e linhas (e um set_config da transação) saem do
+    mesmo banco, com o mesmo atraso de replicação.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and self._use_replica(clause):
+            replicas = current_app.extensions.get('db_replicas')
+            if replicas:
+                replica = g.get('db_replica')
+                if replica is None:
+                    replica = g.db_replica = random.choice(replicas)
+                return replica
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    @staticmethod
+    def _use_replica(clause) -> bool:
+        """Verifica se a consulta pode ir para a réplica"""
+        if not has_app_context() or g.get('db_route') != ROUTE_REPLICA:
+            return False
+
+        if not isinstance(clause, Select):
+            return False
+
+        return clause._for_update_arg is None
@@ -1,12 +1,35 @@
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import DDL, case, cast, event, func, literal_column, text, update
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.sql.expression import Grouping
 from datetime import datetime
 import uuid
+from src.models.session import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+
+def trigram_available(ddl, target, bind, **kw):
+    """DDL do pg_trgm só no Postgres com a extensão disponível (contrib instalado)"""
+    if bind is None or bind.dialect.name != 'postgresql':
+        return False
+    return bind.execute(text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).first() is not None
 
-db = SQLAlchemy()
 
 class UserAccount(db.Model):
     """Modelo para contas de usuário com controle de tokens"""
     __tablename__ = 'user_accounts'
+    __table_args__ = (
+        # Aplicação de planos percorre as contas do plano em ordem de id (keyset)
+        db.Index('ix_user_accounts_plan_id', 'plan_id', 'id'),
+        # Usuários recentes do painel (/v1/admin/overview)
+        db.Index('ix_user_accounts_created_at', 'created_at'),
+        # Busca por email/nome (prefixo, substring e similaridade) com pg_trgm; só no Postgres
+        db.Index('ix_user_accounts_email_trgm', 'email', postgresql_using='gin',
+                 postgresql_ops={'email': 'gin_trgm_ops'}).ddl_if(callable_=trigram_available),
+        db.Index('ix_user_accounts_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}).ddl_if(callable_=trigram_available),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     librechat_user_id = db.Column(db.String(255), unique=True, nullable=False, index=True)
@@ -25,6 +48,14 @@ class UserAccount(db.Model):
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     is_blocked = db.Column(db.Boolean, default=False, nullable=False)
     
+    # Plano de cota periódica (bancos existentes: `flask database init` adiciona as colunas)
+    plan_id = db.Column(db.String(36), db.ForeignKey('allowance_plans.id'), nullable=True)
+    plan_period = db.Column(db.String(20), nullable=True)  # Último período aplicado (ex.: 2025-01, 2025-W03)
+    
+    # Peso na fila de chamadas ao upstream (ADMISSION_TIER_WEIGHTS); o server_default permite
+    # que `flask database init` adicione a coluna NOT NULL em bancos existentes
+    priority_tier = db.Column(db.String(20), default='standard', server_default='standard', nullable=False)
+    
     # Timestamps
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -74,13 +105,36 @@ class UserAccount(db.Model):
         if not self.can_consume_tokens(tokens_used):
             raise ValueError("Tokens insuficientes ou conta bloqueada")
         
-        # Atualiza contadores
-        self.used_tokens += tokens_used
-        self.last_activity = datetime.utcnow()
+        # Débito no próprio UPDATE (used_tokens = used_tokens + x), com a mesma regra de
+        # can_consume_tokens no WHERE: requisições simultâneas não perdem atualização
+        # por partirem de um saldo lido antes
+        now = datetime.utcnow()
+        account = UserAccount.__table__.c
+        row = db.session.execute(
+            update(UserAccount.__table__)
+            .where(
+                account.id == self.id,
+                account.is_active.is_(True),
+                account.is_blocked.is_(False),
+                account.total_tokens - account.used_tokens >= tokens_used
+            )
+            .values(
+                used_tokens=account.used_tokens + tokens_used,
+                is_blocked=account.total_tokens - (account.used_tokens + tokens_used) <= 0,
+                last_activity=now,
+                updated_at=now
+            )
+            .returning(account.total_tokens, account.used_tokens, account.is_blocked)
+        ).first()
+        if row is None:
+            raise ValueError("Tokens insuficientes ou conta bloqueada")
         
-        # Verifica se deve bloquear
-        if self.should_block:
-            self.is_blocked = True
+        # Instância com o saldo do banco (conta com os débitos concorrentes)
+        set_committed_value(self, 'total_tokens', row.total_tokens)
+        set_committed_value(self, 'used_tokens', row.used_tokens)
+        set_committed_value(self, 'is_blocked', row.is_blocked)
+        set_committed_value(self, 'last_activity', now)
+        set_committed_value(self, 'updated_at', now)
         
         # Registra transação
         transaction = TokenTransaction(
@@ -126,6 +180,9 @@ class UserAccount(db.Model):
             'usage_percentage': round(self.usage_percentage, 2),
             'is_active': self.is_active,
             'is_blocked': self.is_blocked,
+            'plan_id': self.plan_id,
+            'plan_period': self.plan_period,
+            'priority_tier': self.priority_tier,
             'should_alert_80': self.should_alert_80,
             'should_alert_95': self.should_alert_95,
             'created_at': self.created_at.isoformat(),
@@ -134,9 +191,73 @@ class UserAccount(db.Model):
         }
 
 
+# Índices trigram exigem a extensão (bancos existentes: CREATE EXTENSION pg_trgm e
+# CREATE INDEX CONCURRENTLY ix_user_accounts_{email,name}_trgm ... USING gin (... gin_trgm_ops))
+event.listen(
+    UserAccount.__table__,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(callable_=trigram_available)
+)
+
+# Busca por prefixo em B-tree: custo constante mesmo para termos muito comuns (ex.: domínio)
+db.Index('ix_user_accounts_email_prefix', func.lower(UserAccount.email).label('email_lower'),
+         postgresql_ops={'email_lower': 'text_pattern_ops'}).ddl_if(dialect='postgresql')
+db.Index('ix_user_accounts_name_prefix', func.lower(UserAccount.name).label('name_lower'),
+         postgresql_ops={'name_lower': 'text_pattern_ops'}).ddl_if(dialect='postgresql')
+
+# Fração de uso (mesma regra de usage_percentage / 100). Constantes literais, não parâmetros:
+# a consulta precisa gerar exatamente a expressão do índice para usá-lo (Postgres e SQLite)
+USAGE_RATIO = case(
+    (UserAccount.total_tokens > literal_column('0'),
+     cast(UserAccount.used_tokens, db.Float) / cast(UserAccount.total_tokens, db.Float)),
+    else_=literal_column('1.0')
+)
+# Expressão com CASE não associa o índice à tabela sozinha; o Postgres exige parênteses
+UserAccount.__table__.append_constraint(db.Index('ix_user_accounts_usage_ratio', Grouping(USAGE_RATIO)))
+
+
+class AllowancePlan(db.Model):
+    """Modelo para planos de cota periódica (mensal ou semanal)"""
+    __tablename__ = 'allowance_plans'
+    
+    id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    
+    # Cota do período
+    tokens = db.Column(db.Integer, nullable=False)
+    period = db.Column(db.String(20), default='monthly', nullable=False)  # 'monthly', 'weekly'
+    mode = db.Column(db.String(20), default='reset', nullable=False)  # 'reset' (zera o uso) ou 'top_up' (soma)
+    
+    is_active = db.Column(db.Boolean, default=True, nullable=False)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    
+    def to_dict(self):
+        """Converte para dicionário"""
+        return {
+            'id': self.id,
+            'name': self.name,
+            'tokens': self.tokens,
+            'period': self.period,
+            'mode': self.mode,
+            'is_active': self.is_active,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat()
+        }
+
+
 class TokenTransaction(db.Model):
     """Modelo para transações de tokens"""
     __tablename__ = 'token_transactions'
+    __table_args__ = (
+        db.Index('ix_token_transactions_user_created', 'user_account_id', 'created_at'),
+        # Exportação em ordem (created_at, id) e retomada por cursor
+        db.Index('ix_token_transactions_created_id', 'created_at', 'id'),
+        # Postgres: particionamento mensal por created_at (ver partition_service)
+        {'postgresql_partition_by': 'RANGE (created_at)'}
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_account_id = db.Column(db.String(36), db.ForeignKey('user_accounts.id'), nullable=False, index=True)
@@ -152,8 +273,8 @@ class TokenTransaction(db.Model):
     completion_tokens = db.Column(db.Integer, nullable=True)
     total_tokens = db.Column(db.Integer, nullable=True)
     
-    # Timestamp
-    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    # Timestamp (faz parte da chave primária por ser a chave de partição)
+    created_at = db.Column(db.DateTime, primary_key=True, default=datetime.utcnow, nullable=False)
     
     def to_dict(self):
         """Converte para dicionário"""
@@ -171,9 +292,26 @@ class TokenTransaction(db.Model):
         }
 
 
+class UserUsageHourly(db.Model):
+    """Consumo agregado por usuário e hora (rollup de token_transactions)"""
+    __tablename__ = 'user_usage_hourly'
+    
+    # Chave começa pela hora: janelas (últimas N horas) são intervalos contíguos do índice
+    bucket_start = db.Column(db.DateTime, primary_key=True)
+    user_account_id = db.Column(db.String(36), db.ForeignKey('user_accounts.id'), primary_key=True)
+    
+    tokens = db.Column(db.BigInteger, default=0, nullable=False)
+    requests = db.Column(db.Integer, default=0, nullable=False)
+    cost_usd = db.Column(db.Numeric(14, 6), default=0, nullable=False)
+
+
 class UserAlert(db.Model):
     """Modelo para alertas de usuário"""
     __tablename__ = 'user_alerts'
+    __table_args__ = (
+        # Um alerta de limiar por usuário, tipo e dia entre todos os workers (reserva do digest)
+        db.Index('ux_user_alerts_daily', 'user_account_id', 'alert_type', 'alert_day', unique=True),
+    )
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     user_account_id = db.Column(db.String(36), db.ForeignKey('user_accounts.id'), nullable=False, index=True)
@@ -181,6 +319,7 @@ class UserAlert(db.Model):
     # Tipo de alerta
     alert_type = db.Column(db.String(50), nullable=False)  # '80_percent', '95_percent', 'blocked'
     alert_message = db.Column(db.Text, nullable=True)
+    alert_day = db.Column(db.Date, nullable=True)  # Dia (UTC) dos alertas de limiar; NULL no bloqueio
     
     # Status
     is_sent = db.Column(db.Boolean, default=False, nullable=False)
@@ -216,6 +355,17 @@ class UserAlert(db.Model):
         }
 
 
+# Configurações padrão do sistema (chave, valor, descrição), gravadas por `flask database init`
+DEFAULT_SYSTEM_CONFIGS = [
+    ('default_tokens_per_user', '1000', 'Tokens padrão para novos usuários'),
+    ('conversion_factor', '0.376', 'Fator de conversão de tokens'),
+    ('alert_threshold_80', '0.8', 'Limite para alerta de 80%'),
+    ('alert_threshold_95', '0.95', 'Limite para alerta de 95%'),
+    ('credits_email', 'creditos@iasolaris.com.br', 'Email para compra de créditos'),
+    ('system_name', 'IA SOLARIS', 'Nome do sistema'),
+]
+
+
 class SystemConfig(db.Model):
     """Modelo para configurações do sistema"""
     __tablename__ = 'system_config'
@@ -1,10 +1,25 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from functools import wraps
 import logging
 import json
+import time
 from datetime import datetime
+from sqlalchemy import select, func
 from src.models.token_control import db, UserAccount
+from src.models.serializers import (
+    select_transactions, select_users, select_alerts, transaction_row, user_row, alert_row
+)
+from src.models.database import ledger_write_lock, pin_primary, route_reads_to_replica
 from src.services.proxy_service import ProxyService
+from src.services.export_service import LedgerExportService, EXPORT_FORMATS, decode_cursor
+from src.services.grant_service import BulkGrantService, parse_csv_grants, parse_ndjson_grants
+from src.services.stats_service import StatsService
+from src.services.user_search_service import UserSearchService
+from src.services.lazy_service import LazyService
+from src.services.metrics_service import metrics
+from src.services.event_service import event_bus, publish_event
+from src.services.tracing_service import tracer
+from src.services.admission_service import ADMISSION_STATUS
 
 # Configurar logging
 logger = logging.getLogger(__name__)
@@ -12,8 +27,12 @@ logger = logging.getLogger(__name__)
 # Criar blueprint
 proxy_bp = Blueprint('proxy', __name__)
 
-# Instanciar serviço
-proxy_service = ProxyService()
+# Serviços construídos no primeiro uso (cada worker cria os seus; o import fica leve)
+proxy_service = LazyService(ProxyService)
+export_service = LazyService(LedgerExportService)
+grant_service = LazyService(lambda: BulkGrantService(proxy_service.email_service))
+stats_service = LazyService(StatsService)
+user_search_service = LazyService(UserSearchService)
 
 def extract_user_info(request):
     """Extrai informações do usuário da requisição"""
@@ -56,7 +75,8 @@ def require_user(f):
         
         try:
             # Obtém ou cria usuário
-            user = proxy_service.get_or_create_user(user_id, user_email, user_name)
+            with tracer.start_span('require_user', **{'enduser.id': user_id}):
+                user = proxy_service.get_or_create_user(user_id, user_email, user_name)
             request.current_user = user
             
         except Exception as e:
@@ -70,6 +90,31 @@ def require_user(f):
     
     return decorated_function
 
+def parse_date_arg(name):
+    """Converte parâmetro de data (YYYY-MM-DD ou ISO 8601, UTC) da query string
+
+    Data inválida gera ValueError com o nome do parâmetro (a rota responde 400).
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Parâmetro {name} inválido: use YYYY-MM-DD ou ISO 8601") from None
+
+def replica_read(f):
+    """Decorator para endpoints somente leitura: consultas vão para a réplica"""
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        # Usuário com escrita recente lê do primário (saldo sempre atualizado)
+        user_id, _, _ = extract_user_info(request)
+        route_reads_to_replica(user_id)
+        
+        return f(*args, **kwargs)
+    
+    return decorated_function
+
 @proxy_bp.route('/health', methods=['GET'])
 def health_check():
     """Endpoint de health check"""
@@ -97,6 +142,17 @@ def health_check():
             'error': str(e)
         }), 500
 
+@proxy_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Exporta métricas do worker no formato Prometheus"""
+    if not metrics.enabled:
+        return jsonify({
+            'error': 'not_found',
+            'message': 'Métricas desabilitadas'
+        }), 404
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @proxy_bp.route('/chat/completions', methods=['POST'])
 @require_user
 def chat_completions():
@@ -128,6 +184,11 @@ def chat_completions():
             # Verifica se é erro de tokens insuficientes
             if response_data.get('error') == 'insufficient_tokens':
                 return jsonify(response_data), 402  # Payment Required
+            elif response_data.get('error') in ADMISSION_STATUS:
+                # Recusado na admissão (fila do usuário cheia ou upstream saturado)
+                return jsonify(response_data), ADMISSION_STATUS[response_data['error']], {
+                    'Retry-After': str(response_data['retry_after'])
+                }
             else:
                 return jsonify(response_data), 500
                 
@@ -139,6 +200,7 @@ def chat_completions():
         }), 500
 
 @proxy_bp.route('/user/info', methods=['GET'])
+@replica_read
 @require_user
 def get_user_info():
     """Obtém informações do usuário atual"""
@@ -156,6 +218,7 @@ def get_user_info():
         }), 500
 
 @proxy_bp.route('/user/usage', methods=['GET'])
+@replica_read
 @require_user
 def get_user_usage():
     """Obtém estatísticas de uso do usuário"""
@@ -165,18 +228,31 @@ def get_user_usage():
         # Parâmetros de consulta
         limit = request.args.get('limit', 50, type=int)
         offset = request.args.get('offset', 0, type=int)
+        try:
+            start_date = parse_date_arg('start_date')
+            end_date = parse_date_arg('end_date')
+        except ValueError as e:
+            return jsonify({
+                'error': 'invalid_date',
+                'message': str(e)
+            }), 400
         
-        # Busca transações
+        # Busca transações (intervalo de datas limita as partições lidas)
         from src.models.token_control import TokenTransaction
-        transactions = TokenTransaction.query.filter_by(
-            user_account_id=user.id
-        ).order_by(
+        query = select_transactions().where(TokenTransaction.user_account_id == user.id)
+        if start_date:
+            query = query.where(TokenTransaction.created_at >= start_date)
+        if end_date:
+            query = query.where(TokenTransaction.created_at < end_date)
+        
+        # Tuplas direto para JSON, sem objetos ORM
+        rows = db.session.execute(query.order_by(
             TokenTransaction.created_at.desc()
-        ).offset(offset).limit(limit).all()
+        ).offset(offset).limit(limit))
         
         return jsonify({
             'user_id': user.id,
-            'transactions': [t.to_dict() for t in transactions],
+            'transactions': [transaction_row(row) for row in rows],
             'summary': {
                 'total_tokens': user.total_tokens,
                 'used_tokens': user.used_tokens,
@@ -193,6 +269,7 @@ def get_user_usage():
         }), 500
 
 @proxy_bp.route('/user/alerts', methods=['GET'])
+@replica_read
 @require_user
 def get_user_alerts():
     """Obtém alertas do usuário"""
@@ -200,14 +277,14 @@ def get_user_alerts():
         user = request.current_user
         
         from src.models.token_control import UserAlert
-        alerts = UserAlert.query.filter_by(
-            user_account_id=user.id
+        rows = db.session.execute(select_alerts().where(
+            UserAlert.user_account_id == user.id
         ).order_by(
             UserAlert.created_at.desc()
-        ).limit(20).all()
+        ).limit(20))
         
         return jsonify({
-            'alerts': [alert.to_dict() for alert in alerts]
+            'alerts': [alert_row(row) for row in rows]
         })
         
     except Exception as e:
@@ -247,6 +324,7 @@ def get_available_models():
         }), 500
 
 @proxy_bp.route('/admin/users', methods=['GET'])
+@replica_read
 def admin_list_users():
     """Lista todos os usuários (endpoint administrativo)"""
     try:
@@ -255,19 +333,20 @@ def admin_list_users():
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
-        users = UserAccount.query.paginate(
-            page=page,
-            per_page=per_page,
-            error_out=False
-        )
+        # Mesmos ajustes do paginate(error_out=False)
+        page = page if page >= 1 else 1
+        per_page = per_page if per_page >= 1 else 20
+        
+        total = db.session.execute(select(func.count()).select_from(UserAccount)).scalar()
+        rows = db.session.execute(select_users().offset((page - 1) * per_page).limit(per_page))
         
         return jsonify({
-            'users': [user.to_dict() for user in users.items],
+            'users': [user_row(row) for row in rows],
             'pagination': {
                 'page': page,
                 'per_page': per_page,
-                'total': users.total,
-                'pages': users.pages
+                'total': total,
+                'pages': -(-total // per_page)
             }
         })
         
@@ -278,6 +357,89 @@ def admin_list_users():
             'message': 'Erro ao listar usuários'
         }), 500
 
+@proxy_bp.route('/admin/users/search', methods=['GET'])
+@replica_read
+def admin_search_users():
+    """Busca usuários por email ou nome (prefixo, substring e similaridade)"""
+    try:
+        # TODO: Adicionar autenticação de admin
+        
+        term = request.args.get('q', '')
+        limit = request.args.get('limit', type=int)
+        status = request.args.get('status', 'all')
+        
+        try:
+            users = user_search_service.search(term, limit=limit, status=status)
+        except ValueError as e:
+            return jsonify({
+                'error': 'invalid_search',
+                'message': str(e)
+            }), 400
+        
+        return jsonify({
+            'users': users,
+            'query': term.strip(),
+            'count': len(users)
+        })
+        
+    except Exception as e:
+        logger.error(f"Erro ao buscar usuários: {str(e)}")
+        return jsonify({
+            'error': 'internal_error',
+            'message': 'Erro ao buscar usuários'
+        }), 500
+
+@proxy_bp.route('/admin/users/top-consumers', methods=['GET'])
+@replica_read
+def admin_top_consumers():
+    """Usuários que mais consumiram tokens nas últimas N horas"""
+    try:
+        # TODO: Adicionar autenticação de admin
+        
+        hours = request.args.get('hours', 24, type=int)
+        limit = request.args.get('limit', 10, type=int)
+        
+        if not 1 <= hours <= stats_service.rollup_retention_hours or not 1 <= limit <= 100:
+            return jsonify({
+                'error': 'invalid_parameters',
+                'message': f'hours deve estar entre 1 e {stats_service.rollup_retention_hours}; limit entre 1 e 100'
+            }), 400
+        
+        return jsonify(stats_service.get_top_consumers(hours=hours, limit=limit))
+        
+    except Exception as e:
+        logger.error(f"Erro ao obter maiores consumidores: {str(e)}")
+        return jsonify({
+            'error': 'internal_error',
+            'message': 'Erro ao obter maiores consumidores'
+        }), 500
+
+@proxy_bp.route('/admin/users/near-limit', methods=['GET'])
+@replica_read
+def admin_near_limit():
+    """Usuários acima de X% da cota (padrão 95%), com estimativa de quando esgotam"""
+    try:
+        # TODO: Adicionar autenticação de admin
+        
+        threshold = request.args.get('threshold', 95.0, type=float)
+        limit = request.args.get('limit', 50, type=int)
+        include_blocked = request.args.get('include_blocked', 'false').lower() == 'true'
+        
+        if not 0 < threshold <= 100 or not 1 <= limit <= 500:
+            return jsonify({
+                'error': 'invalid_parameters',
+                'message': 'threshold deve estar entre 0 e 100; limit entre 1 e 500'
+            }), 400
+        
+        return jsonify(stats_service.get_near_limit(threshold=threshold, limit=limit, include_blocked=include_blocked))
+        
+    except Exception as e:
+        logger.error(f"Erro ao obter usuários próximos do limite: {str(e)}")
+        return jsonify({
+            'error': 'internal_error',
+            'message': 'Erro ao obter usuários próximos do limite'
+        }), 500
+
 @proxy_bp.route('/admin/users/<user_id>/add-tokens', methods=['POST'])
 def admin_add_tokens(user_id):
     """Adiciona tokens a um usuário (endpoint administrativo)"""
@@ -303,8 +465,16 @@ def admin_add_tokens(user_id):
             }), 404
         
         # Adiciona tokens
-        transaction = user.add_tokens(tokens_to_add, reason)
-        db.session.commit()
+        was_blocked = user.is_blocked
+        with ledger_write_lock():
+            transaction = user.add_tokens(tokens_to_add, reason)
+            db.session.commit()
+        pin_primary(user.librechat_user_id)
+        publish_event('tokens.granted', {
+            'user': user.to_dict(),
+            'tokens': tokens_to_add,
+            'unblocked': was_blocked and not user.is_blocked
+        })
         
         # Envia email de confirmação
         proxy_service.email_service.send_credits_purchased_confirmation(
@@ -328,60 +498,317 @@ def admin_add_tokens(user_id):
             'message': 'Erro ao adicionar tokens'
         }), 500
 
+@proxy_bp.route('/admin/users/<user_id>/priority-tier', methods=['POST'])
+def admin_set_priority_tier(user_id):
+    """Define o tier de prioridade do usuário na fila de chamadas ao upstream"""
+    try:
+        # TODO: Adicionar autenticação de admin
+
+        data = request.get_json() or {}
+        tier = data.get('tier')
+
+        tiers = proxy_service.admission.tier_weights
+        if tier not in tiers:
+            return jsonify({
+                'error': 'invalid_tier',
+                'message': f"Tier inválido. Opções: {', '.join(sorted(tiers))}"
+            }), 400
+
+        user = UserAccount.query.get(user_id)
+        if not user:
+            return jsonify({
+                'error': 'user_not_found',
+                'message': 'Usuário não encontrado'
+            }), 404
+
+        user.priority_tier = tier
+        db.session.commit()
+        pin_primary(user.librechat_user_id)
+
+        logger.info(f"Admin definiu o tier {tier} para o usuário {user.email}")
+
+        return jsonify({
+            'success': True,
+            'user': user.to_dict()
+        })
+
+    except Exception as e:
+        logger.error(f"Erro ao definir tier do usuário: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'error': 'internal_error',
+            'message': 'Erro ao definir tier do usuário'
+        }), 500
+
+@proxy_bp.route('/admin/tokens/bulk-grant', methods=['POST'])
+def admin_bulk_grant_tokens():
+    """Adiciona tokens a várias contas em uma requisição (CSV, NDJSON ou JSON)"""
+    try:
+        # TODO: Adicionar autenticação de admin
+
+        default_reason = request.args.get('reason', 'bulk_grant')
+        send_emails = request.args.get('send_emails', 'true').lower() == 'true'
+
+        # Corpo lido em streaming (CSV/NDJSON) para listas grandes
+        if request.mimetype == 'text/csv':
+            rows = parse_csv_grants(request.stream)
+        elif request.mimetype == 'application/x-ndjson':
+            rows = parse_ndjson_grants(request.stream)
+        else:
+            data = request.get_json(silent=True)
+            rows = data.get('grants') if isinstance(data, dict) else data
+            if not isinstance(rows, list):
+                return jsonify({
+                    'error': 'invalid_request',
+                    'message': 'Envie CSV, NDJSON ou JSON com a lista de concessões'
+                }), 400
+
+        results = list(grant_service.apply(rows, default_reason, send_emails))
+        granted = [r for r in results if r['status'] == 'granted']
+
+        unreadable = results[-1] if results and results[-1].get('error') == 'unreadable_input' else None
+
+        logger.info(f"Admin concedeu tokens em lote: {len(granted)}/{len(results)} linhas")
+        if granted:
+            # Muitas contas alteradas: painéis recarregam o resumo uma vez
+            publish_event('stats.resync', {'reason': 'bulk_grant', 'accounts': len(granted)})
+
+        body = {
+            'success': unreadable is None,
+            'summary': {
+                'rows': len(results),
+                'granted': len(granted),
+                'failed': len(results) - len(granted),
+                'tokens_granted': sum(r['tokens'] for r in granted)
+            },
+            'results': results
+        }
+        if unreadable is not None:
+            # Linhas anteriores já foram aplicadas: reenviar só a partir de resume_from_line
+            body.update({
+                'error': 'unreadable_input',
+                'message': f"Entrada ilegível na linha {unreadable['line']}; as linhas anteriores foram processadas",
+                'resume_from_line': unreadable['line']
+            })
+            return jsonify(body), 400
+        return jsonify(body)
+
+    except Exception as e:
+        logger.error(f"Erro ao adicionar tokens em lote: {str(e)}")
+        db.session.rollback()
+        return jsonify({
+            'error': 'internal_error',
+            'message': 'Erro ao adicionar tokens em lote'
+        }), 500
+
 @proxy_bp.route('/admin/stats', methods=['GET'])
+@replica_read
 def admin_get_stats():
     """Obtém estatísticas gerais do sistema"""
     try:
         # TODO: Adicionar autenticação de admin
         
-        from sqlalchemy import func
-        from src.models.token_control import TokenTransaction
-        
-        # Estatísticas básicas
-        total_users = UserAccount.query.count()
-        active_users = UserAccount.query.filter_by(is_active=True).count()
-        blocked_users = UserAccount.query.filter_by(is_blocked=True).count()
+        # Contagens, somas e transações do dia em uma única consulta
+        return jsonify(stats_service.get_system_stats())
         
-        # Estatísticas de tokens
-        total_tokens_distributed = db.session.query(
-            func.sum(UserAccount.total_tokens)
-        ).scalar() or 0
+    except Exception as e:
+        logger.error(f"Erro ao obter estatísticas: {str(e)}")
+        return jsonify({
+            'error': 'internal_error',
+            'message': 'Erro ao obter estatísticas'
+        }), 500
+
+@proxy_bp.route('/admin/overview', methods=['GET'])
+@replica_read
+def admin_get_overview():
+    """Resumo da página inicial do painel (estatísticas + usuários recentes) com cache curto"""
+    try:
+        # TODO: Adicionar autenticação de admin
         
-        total_tokens_used = db.session.query(
-            func.sum(UserAccount.used_tokens)
-        ).scalar() or 0
+        overview = stats_service.get_overview()
         
-        # Transações hoje
-        from datetime import date
-        today = date.today()
-        transactions_today = TokenTransaction.query.filter(
-            func.date(TokenTransaction.created_at) == today
-        ).count()
+        response = jsonify(overview)
+        response.headers['Cache-Control'] = f'private, max-age={int(stats_service.overview_ttl)}'
+        return response
         
+    except Exception as e:
+        logger.error(f"Erro ao obter resumo do painel: {str(e)}")
         return jsonify({
-            'users': {
-                'total': total_users,
-                'active': active_users,
-                'blocked': blocked_users
-            },
-            'tokens': {
-                'total_distributed': total_tokens_distributed,
-                'total_used': total_tokens_used,
-                'total_remaining': total_tokens_distributed - total_tokens_used
-            },
-            'activity': {
-                'transactions_today': transactions_today
-            },
-            'timestamp': datetime.utcnow().isoformat()
-        })
+            'error': 'internal_error',
+            'message': 'Erro ao obter resumo do painel'
+        }), 500
+
+@proxy_bp.route('/admin/usage/timeseries', methods=['GET'])
+@replica_read
+def admin_usage_timeseries():
+    """Série temporal de tokens, custo e requisições por modelo (reduzida por LTTB)"""
+    try:
+        # TODO: Adicionar autenticação de admin
         
+        try:
+            points = int(request.args.get('points', stats_service.timeseries_default_points))
+        except ValueError:
+            points = 0
+        if not 3 <= points <= 2000:
+            return jsonify({
+                'error': 'invalid_points',
+                'message': 'points deve estar entre 3 e 2000'
+            }), 400
+        
+        try:
+            start = parse_date_arg('start_date')
+            end = parse_date_arg('end_date')
+        except ValueError as e:
+            return jsonify({
+                'error': 'invalid_date',
+                'message': str(e)
+            }), 400
+        
+        try:
+            timeseries = stats_service.get_usage_timeseries(
+                start=start,
+                end=end,
+                bucket=request.args.get('bucket'),
+                model=request.args.get('model'),
+                points=points
+            )
+        except ValueError as e:
+            return jsonify({
+                'error': 'invalid_range',
+                'message': str(e)
+            }), 400
+        
+        return jsonify(timeseries)
+    
     except Exception as e:
-        logger.error(f"Erro ao obter estatísticas: {str(e)}")
+        logger.error(f"Erro ao obter série temporal de uso: {str(e)}")
         return jsonify({
             'error': 'internal_error',
-            'message': 'Erro ao obter estatísticas'
+            'message': 'Erro ao obter série temporal de uso'
         }), 500
 
+@proxy_bp.route('/admin/transactions/export', methods=['GET'])
+@replica_read
+def admin_export_transactions():
+    """Exporta o extrato em streaming (NDJSON ou CSV, opcionalmente gzip)"""
+    # TODO: Adicionar autenticação de admin
+    
+    export_format = request.args.get('format', 'ndjson').lower()
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            'error': 'invalid_format',
+            'message': 'Formato deve ser ndjson ou csv'
+        }), 400
+    
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            return jsonify({
+                'error': 'invalid_cursor',
+                'message': 'Cursor de retomada inválido'
+            }), 400
+    
+    try:
+        start_date = parse_date_arg('start_date')
+        end_date = parse_date_arg('end_date')
+    except ValueError as e:
+        return jsonify({
+            'error': 'invalid_date',
+            'message': str(e)
+        }), 400
+    
+    compress = request.args.get('gzip', 'false').lower() == 'true'
+    filters = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'user_id': request.args.get('user_id'),
+        'model': request.args.get('model'),
+        'cursor': cursor
+    }
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    filename = f"token_transactions_{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}.{extension}"
+    if compress:
+        mimetype, filename = 'application/gzip', f"{filename}.gz"
+    
+    # Cada linha traz o próprio cursor: em caso de queda, retomar com ?cursor=<último>
+    generator = export_service.stream(export_format, compress, **filters)
+    return Response(
+        stream_with_context(generator),
+        mimetype=mimetype,
+        headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@proxy_bp.route('/admin/events', methods=['GET'])
+def admin_events():
+    """Stream SSE de eventos do painel (consumo, bloqueios, alertas, créditos)"""
+    # TODO: Adicionar autenticação de admin
+    
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    
+    subscription, missed = event_bus.subscribe(last_event_id)
+    
+    def format_event(event):
+        return f"id: {event['id']}\nevent: {event['type']}\ndata: {json.dumps(event['data'], default=str)}\n\n"
+    
+    def generate():
+        try:
+            # Reconexão automática do EventSource após 3s
+            yield 'retry: 3000\n\n'
+            for event in missed:
+                yield format_event(event)
+            
+            # Conexão com duração limitada: libera a thread e o cliente reconecta
+            deadline = time.monotonic() + event_bus.max_stream_seconds
+            while time.monotonic() < deadline and not subscription.dropped:
+                event = subscription.get(timeout=event_bus.heartbeat_seconds)
+                yield format_event(event) if event else ': ping\n\n'
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@proxy_bp.route('/admin/traces', methods=['GET'])
+def admin_traces():
+    """Traces recentes do buffer em memória deste worker (TRACE_EXPORTER=memory)"""
+    # TODO: Adicionar autenticação de admin
+
+    if not hasattr(tracer.exporter, 'get_finished_spans'):
+        return jsonify({
+            'error': 'traces_unavailable',
+            'message': 'Buffer de traces desativado (use TRACE_EXPORTER=memory)'
+        }), 404
+
+    limit = min(request.args.get('limit', 20, type=int), 200)
+
+    traces = {}
+    for span in tracer.exporter.get_finished_spans(request.args.get('trace_id')):
+        traces.setdefault(span['trace_id'], []).append(span)
+
+    # Mais recentes primeiro; spans de cada trace na ordem de início
+    recent = list(traces.items())[-limit:][::-1]
+    return jsonify({
+        'traces': [
+            {
+                'trace_id': trace_id,
+                'spans': sorted(spans, key=lambda span: span['start_time_unix_nano'])
+            }
+            for trace_id, spans in recent
+        ]
+    })
+
 # Middleware para CORS
 @proxy_bp.after_request
 def after_request(response):
@@ -0,0 +1,219 @@
+"""Admissão das chamadas ao upstream: limite por usuário e fila justa
+
+Cada processo libera no máximo UPSTREAM_MAX_CONCURRENCY chamadas simultâneas
+ao LiteLLM/OpenAI e no máximo USER_MAX_CONCURRENCY por usuário. Quem passa do
+limite espera numa fila servida em ordem justa ponderada (start-time fair
+queueing): cada pedido começa em max(tempo virtual, fim do pedido anterior
+do usuário), termina 1/peso depois, e a vaga livre vai para o menor início
+entre os usuários abaixo do próprio limite. Um usuário com um script em laço
+fica com a sua fatia, não com todas as vagas; contas com tier de peso maior
+(ADMISSION_TIER_WEIGHTS) recebem uma fatia proporcionalmente maior.
+
+Rejeições: fila do usuário cheia (USER_MAX_QUEUED) -> 429; espera acima de
+ADMISSION_MAX_WAIT_SECONDS -> 503. As duas com Retry-After.
+"""
+import os
+import math
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+from src.services.metrics_service import metrics
+from src.services.tracing_service import tracer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIER = 'standard'
+
+# Status HTTP de cada recusa (o corpo traz retry_after, repetido no header Retry-After)
+ADMISSION_STATUS = {'too_many_requests': 429, 'upstream_busy': 503}
+
+admission_wait = metrics.histogram('upstream_admission_wait_seconds', 'Espera na fila antes da chamada ao upstream, por tier')
+admission_rejected = metrics.counter('upstream_admission_rejected_total', 'Chamadas ao upstream recusadas na admissão, por motivo')
+upstream_in_flight = metrics.gauge('upstream_in_flight', 'Chamadas ao upstream em andamento no processo')
+upstream_queued = metrics.gauge('upstream_queued', 'Chamadas aguardando vaga para o upstream no processo')
+
+
+def parse_tier_weights(value: str) -> Dict[str, float]:
+    """'tier=peso,tier=peso' -> {tier: peso}; o tier padrão sempre existe"""
+    weights = {DEFAULT_TIER: 1.0}
+    for item in value.split(','):
+        name, _, weight = item.strip().partition('=')
+        if name and weight and float(weight) > 0:
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+class AdmissionRejected(Exception):
+    """Chamada recusada antes de chegar ao upstream (429 ou 503 com Retry-After)"""
+
+    def __init__(self, error: str, message: str, retry_after: int):
+        super().__init__(message)
+        self.error = error
+        self.message = message
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict[str, object]:
+        return {'error': self.error, 'message': self.message, 'retry_after': self.retry_after}
+
+
+class _Ticket:
+    __slots__ = ('user_key', 'tier', 'start', 'event', 'queued_at', 'granted_at')
+
+    def __init__(self, user_key: str, tier: str, start: float):
+        self.user_key = user_key
+        self.tier = tier
+        self.start = start
+        self.event = threading.Event()
+        self.queued_at = time.monotonic()
+        self.granted_at = None
+
+
+class _UserState:
+    __slots__ = ('in_flight', 'queued', 'last_finish')
+
+    def __init__(self):
+        self.in_flight = 0
+        self.queued = 0
+        self.last_finish = 0.0
+
+
+class FairShareScheduler:
+    """Vagas de chamada ao upstream por processo, com limite por usuário e fila justa ponderada"""
+
+    def __init__(self):
+        self.capacity = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '6'))
+        self.user_max_in_flight = int(os.getenv('USER_MAX_CONCURRENCY', '2'))
+        self.user_max_queued = int(os.getenv('USER_MAX_QUEUED', '2'))
+        self.max_wait = float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '30'))
+        self.tier_weights = parse_tier_weights(os.getenv('ADMISSION_TIER_WEIGHTS', 'standard=1,priority=4'))
+
+        self._lock = threading.Lock()
+        self._users: Dict[str, _UserState] = {}
+        self._waiting: List[_Ticket] = []
+        self._in_flight = 0
+        self._virtual_time = 0.0
+        # Média móvel do tempo de uma chamada (estimativa do Retry-After)
+        self._hold_seconds = 1.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _weight(self, tier: Optional[str]) -> float:
+        return self.tier_weights.get(tier or DEFAULT_TIER, self.tier_weights[DEFAULT_TIER])
+
+    def _retry_after(self, queued: int) -> int:
+        """Segundos até a fila do usuário andar, pela duração média das chamadas"""
+        return max(1, math.ceil(self._hold_seconds * (queued + 1) / max(self.user_max_in_flight, 1)))
+
+    def acquire(self, user_key: str, tier: Optional[str] = None) -> _Ticket:
+        """Espera a vaga do usuário; AdmissionRejected se a fila dele estiver cheia ou a espera estourar"""
+        tier = tier if tier in self.tier_weights else DEFAULT_TIER
+        with self._lock:
+            state = self._users.get(user_key)
+            if state is None:
+                state = self._users[user_key] = _UserState()
+
+            start = max(self._virtual_time, state.last_finish)
+            ticket = _Ticket(user_key, tier, start)
+
+            # Caminho rápido: sem fila e com vaga (global e do usuário)
+            if not self._waiting and self._in_flight < self.capacity and state.in_flight < self.user_max_in_flight:
+                state.last_finish = start + 1 / self._weight(tier)
+                self._grant(ticket, state)
+                admission_wait.observe(0, tier=tier)
+                return ticket
+
+            if state.queued >= self.user_max_queued:
+                retry_after = self._retry_after(state.queued)
+                admission_rejected.inc(reason='user_queue_full')
+                raise AdmissionRejected(
+                    'too_many_requests',
+                    f"Muitas requisições simultâneas: até {self.user_max_in_flight} em andamento "
+                    f"e {self.user_max_queued} na fila por usuário",
+                    retry_after
+                )
+
+            state.last_finish = start + 1 / self._weight(tier)
+            state.queued += 1
+            self._waiting.append(ticket)
+            upstream_queued.inc()
+            self._dispatch()
+
+        with tracer.start_span('admission.wait', **{'admission.tier': tier}) as span:
+            ticket.event.wait(self.max_wait)
+            with self._lock:
+                # A vaga pode ter sido concedida entre o timeout e o lock
+                timed_out = ticket.granted_at is None
+                if timed_out:
+                    self._waiting.remove(ticket)
+                    state.queued -= 1
+                    upstream_queued.dec()
+                    self._cleanup(user_key)
+                    retry_after = self._retry_after(len(self._waiting))
+            waited = (ticket.granted_at or time.monotonic()) - ticket.queued_at
+            span.set_attribute('admission.wait_ms', round(waited * 1000, 2))
+
+        admission_wait.observe(waited, tier=tier)
+        if timed_out:
+            admission_rejected.inc(reason='timeout')
+            logger.warning("Chamada de %s esperou %.1fs sem vaga para o upstream", user_key, waited)
+            raise AdmissionRejected(
+                'upstream_busy',
+                'Serviço de IA sobrecarregado, tente novamente em instantes',
+                retry_after
+            )
+        return ticket
+
+    def release(self, ticket: _Ticket):
+        """Libera a vaga e entrega a próxima pela ordem justa"""
+        held = time.monotonic() - ticket.granted_at
+        with self._lock:
+            state = self._users[ticket.user_key]
+            state.in_flight -= 1
+            self._in_flight -= 1
+            upstream_in_flight.dec()
+            self._hold_seconds += 0.1 * (held - self._hold_seconds)
+            self._cleanup(ticket.user_key)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, user_key: str, tier: Optional[str] = None) -> Iterator[None]:
+        """Vaga de chamada ao upstream durante o bloco (sem limite se UPSTREAM_MAX_CONCURRENCY=0)"""
+        if not self.enabled:
+            yield
+            return
+        ticket = self.acquire(user_key, tier)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def _grant(self, ticket: _Ticket, state: _UserState):
+        ticket.granted_at = time.monotonic()
+        self._virtual_time = max(self._virtual_time, ticket.start)
+        state.in_flight += 1
+        self._in_flight += 1
+        upstream_in_flight.inc()
+        ticket.event.set()
+
+    def _dispatch(self):
+        """Concede as vagas livres aos menores inícios elegíveis, na ordem de chegada no empate (com o lock)"""
+        while self._waiting and self._in_flight < self.capacity:
+            eligible = [ticket for ticket in self._waiting
+                        if self._users[ticket.user_key].in_flight < self.user_max_in_flight]
+            if not eligible:
+                return
+            ticket = min(eligible, key=lambda ticket: ticket.start)
+            self._waiting.remove(ticket)
+            state = self._users[ticket.user_key]
+            state.queued -= 1
+            upstream_queued.dec()
+            self._grant(ticket, state)
+
+    def _cleanup(self, user_key: str):
+        state = self._users.get(user_key)
+        if state is not None and not state.in_flight and not state.queued:
+            del self._users[user_key]
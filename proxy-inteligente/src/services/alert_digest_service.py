@@ -0,0 +1,231 @@
+import os
+import time
+import atexit
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from flask import current_app
+from sqlalchemy import or_, select, and_, update
+from sqlalchemy.dialects import postgresql, sqlite
+from src.models.token_control import db, UserAccount, UserAlert
+from src.services.event_service import publish_event
+from src.services.tracing_service import tracer
+
+logger = logging.getLogger(__name__)
+
+# Gravidade de cada alerta: o digest usa o template do mais grave
+ALERT_SEVERITY = {'80_percent': 1, '95_percent': 2, 'blocked': 3}
+ALERT_TEMPLATES = {'80_percent': 'alert_80', '95_percent': 'alert_95', 'blocked': 'blocked'}
+ALERT_MESSAGES = {
+    '80_percent': "Você consumiu 80% dos seus tokens. Restam {remaining} tokens.",
+    '95_percent': "ATENÇÃO: Você consumiu 95% dos seus tokens. Restam apenas {remaining} tokens.",
+    'blocked': "Sua conta foi bloqueada por esgotamento de tokens.",
+}
+
+# Alertas de limiar valem uma vez por dia (mesma regra de check_and_send_alerts)
+DAILY_ALERTS = ('80_percent', '95_percent')
+
+
+class AlertDigestService:
+    """Agrupa os alertas de cada usuário numa janela e envia um único email com o estado mais grave
+
+    O agrupamento é por processo (cada worker tem a sua janela); a reserva em
+    user_alerts antes do envio garante um email por alerta de limiar no dia
+    entre os workers. Alertas ainda na janela se perdem se o worker for morto
+    (SIGKILL); no encerramento normal a janela é esvaziada.
+    """
+
+    def __init__(self, email_service):
+        self.email_service = email_service
+        self.window = float(os.getenv('ALERT_DIGEST_WINDOW_SECONDS', '60'))
+
+        # user_account_id -> {'alerts': {tipo: levantado_em}, 'due': instante do envio, 'traces': traces de origem}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._app = None
+
+    def submit(self, user: UserAccount, alert_type: str):
+        """Registra o alerta; o email sai quando a janela do usuário fecha"""
+        raised_at = datetime.utcnow()
+        span = tracer.current_span()
+        with self._lock:
+            entry = self._pending.get(user.id)
+            if entry is None:
+                entry = self._pending[user.id] = {'alerts': {}, 'due': time.monotonic() + self.window, 'traces': set()}
+            is_new = alert_type not in entry['alerts']
+            entry['alerts'].setdefault(alert_type, raised_at)
+            if span is not None:
+                entry['traces'].add(span.trace_id)
+
+        if alert_type == 'blocked' and is_new:
+            # O painel mostra o bloqueio na hora; só o email espera a janela
+            publish_event('user.blocked', {'user': user.to_dict()})
+
+        if self.window <= 0:
+            self.flush(force=True)
+            return
+
+        self._app = current_app._get_current_object()
+        self._ensure_worker()
+
+    def pending_count(self) -> int:
+        """Usuários com digest aguardando a janela"""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self, force: bool = False) -> int:
+        """Envia os digests com janela vencida (todos, se force); retorna quantos emails saíram"""
+        now = time.monotonic()
+        with self._lock:
+            ready = {user_id: entry['alerts'] for user_id, entry in self._pending.items() if force or entry['due'] <= now}
+            origins = set()
+            for user_id in ready:
+                origins.update(self._pending.pop(user_id)['traces'])
+
+        if not ready:
+            return 0
+
+        try:
+            # Fora da requisição vira um trace próprio, ligado às requisições que levantaram os alertas
+            with tracer.start_span('alert_digest.flush', **{
+                'alert_digest.users': len(ready), 'alert_digest.origin_trace_ids': sorted(origins)
+            }) as span:
+                sent = self._deliver(ready)
+                span.set_attribute('alert_digest.emails', sent)
+                return sent
+        except Exception as e:
+            logger.error(f"Erro ao enviar digest de alertas para {len(ready)} usuário(s): {str(e)}")
+            db.session.rollback()
+            return 0
+
+    def _claim(self, digests: List[Tuple[UserAccount, Dict[str, datetime]]]) -> List[Dict[str, Any]]:
+        """Grava os alertas antes do envio; devolve só os que este worker reservou
+
+        ON CONFLICT no índice único (usuário, tipo, dia): se outro worker já gravou o
+        mesmo alerta de limiar hoje, a linha não entra e o email não sai daqui.
+        """
+        rows = []
+        for user, alerts in digests:
+            for alert_type, raised_at in sorted(alerts.items(), key=lambda item: ALERT_SEVERITY[item[0]]):
+                rows.append({
+                    'id': str(uuid.uuid4()),
+                    'user_account_id': user.id,
+                    'alert_type': alert_type,
+                    'alert_message': ALERT_MESSAGES[alert_type].format(remaining=user.remaining_tokens),
+                    'alert_day': raised_at.date() if alert_type in DAILY_ALERTS else None,
+                    'is_sent': False,
+                    'is_resolved': False,
+                    'created_at': raised_at,
+                })
+
+        insert = postgresql.insert if db.engine.dialect.name == 'postgresql' else sqlite.insert
+        claimed = set(db.session.execute(
+            insert(UserAlert).values(rows).on_conflict_do_nothing(
+                index_elements=['user_account_id', 'alert_type', 'alert_day']
+            ).returning(UserAlert.id)
+        ).scalars())
+        db.session.commit()
+        return [row for row in rows if row['id'] in claimed]
+
+    def _deliver(self, ready: Dict[str, Dict[str, datetime]]) -> int:
+        """Dedup e reserva em user_alerts, depois um email por usuário (mesma sessão SMTP)"""
+        now = datetime.utcnow()
+        today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        user_ids = list(ready)
+
+        users = {user.id: user for user in UserAccount.query.filter(UserAccount.id.in_(user_ids)).all()}
+
+        # Já registrados: limiares desde o início do dia; bloqueio dentro da janela (outro worker)
+        recorded = set(db.session.execute(
+            select(UserAlert.user_account_id, UserAlert.alert_type).where(
+                UserAlert.user_account_id.in_(user_ids),
+                or_(
+                    and_(UserAlert.alert_type.in_(DAILY_ALERTS), UserAlert.created_at > today),
+                    and_(UserAlert.alert_type == 'blocked', UserAlert.created_at > now - timedelta(seconds=max(self.window, 1)))
+                )
+            )
+        ).all())
+
+        digests: List[Tuple[UserAccount, Dict[str, datetime]]] = []
+        for user_id, alerts in ready.items():
+            user = users.get(user_id)
+            if user is None:
+                continue
+            alerts = {alert_type: raised_at for alert_type, raised_at in alerts.items() if (user_id, alert_type) not in recorded}
+            if alerts:
+                digests.append((user, alerts))
+
+        if not digests:
+            return 0
+
+        # A consulta acima é só um filtro barato; quem decide é a reserva (atômica)
+        records = self._claim(digests)
+        claimed: Dict[str, Dict[str, datetime]] = {}
+        for record in records:
+            claimed.setdefault(record['user_account_id'], {})[record['alert_type']] = record['created_at']
+        digests = [(user, claimed[user.id]) for user, _ in digests if user.id in claimed]
+
+        if not digests:
+            return 0
+
+        # Um email por usuário com o template do alerta mais grave, agrupados por template
+        by_template: Dict[str, List[UserAccount]] = {}
+        for user, alerts in digests:
+            by_template.setdefault(ALERT_TEMPLATES[max(alerts, key=ALERT_SEVERITY.get)], []).append(user)
+
+        sent = {}
+        for template, template_users in by_template.items():
+            emails = self.email_service.build_emails(template, [(user, {}) for user in template_users])
+            for user, result in zip(template_users, self.email_service.send_batch(emails)):
+                sent[user.id] = result
+
+        # Todos os alertas agrupados ficam registrados (inclusive os menos graves); marca os enviados
+        sent_at = datetime.utcnow()
+        for record in records:
+            if sent[record['user_account_id']]:
+                record.update(is_sent=True, sent_at=sent_at)
+        sent_ids = [record['id'] for record in records if record['is_sent']]
+        if sent_ids:
+            db.session.execute(
+                update(UserAlert).where(UserAlert.id.in_(sent_ids)).values(is_sent=True, sent_at=sent_at),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.commit()
+
+        for record in records:
+            publish_event('alert.raised', {'user': users[record['user_account_id']].to_dict(), 'alert': UserAlert(**record).to_dict()})
+
+        logger.info(f"Digest de alertas: {len(digests)} email(s), {len(records)} alerta(s) registrados")
+        return len(digests)
+
+    def _ensure_worker(self):
+        """Inicia (uma vez por processo) a thread que fecha as janelas"""
+        if self._worker is not None:
+            return
+
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='alert-digest', daemon=True)
+                self._worker.start()
+                atexit.register(self._flush_on_exit)
+
+    def _run(self):
+        """Dorme até a próxima janela vencer e envia os digests prontos"""
+        while True:
+            with self._lock:
+                due = min((entry['due'] for entry in self._pending.values()), default=None)
+            timeout = 1.0 if due is None else max(0.0, due - time.monotonic())
+            self._wakeup.wait(min(timeout, 1.0))
+
+            with self._app.app_context():
+                self.flush()
+
+    def _flush_on_exit(self):
+        """Envia o que ainda estiver na janela ao encerrar o processo"""
+        if self._app is not None and self.pending_count():
+            with self._app.app_context():
+                self.flush(force=True)
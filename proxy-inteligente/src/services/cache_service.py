@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+_redis_checked = False
+_redis_lock = threading.Lock()
+
+
+def get_redis():
+    """Obtém cliente Redis compartilhado (None se REDIS_URL não estiver configurado)"""
+    global _redis_client, _redis_checked
+
+    if _redis_checked:
+        return _redis_client
+
+    with _redis_lock:
+        if not _redis_checked:
+            redis_url = os.getenv('REDIS_URL')
+            if redis_url:
+                try:
+                    import redis
+                    _redis_client = redis.Redis.from_url(
+                        redis_url,
+                        socket_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', '0.5')),
+                        socket_connect_timeout=float(os.getenv('REDIS_SOCKET_TIMEOUT', '0.5'))
+                    )
+                except ImportError:
+                    logger.warning("Pacote redis não instalado, usando cache local")
+            _redis_checked = True
+
+    return _redis_client
+
+
+class LocalTTLStore:
+    """Armazenamento chave/valor com expiração, local ao processo"""
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def set(self, key: str, value: Any, ttl: float):
+        """Define valor com expiração em segundos"""
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Obtém valor se ainda não expirou"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+
+_local_store = LocalTTLStore()
+
+
+def set_flag(key: str, ttl: float):
+    """Marca uma chave por ttl segundos (Redis entre workers, ou local)"""
+    _local_store.set(key, True, ttl)
+
+    client = get_redis()
+    if client is not None:
+        try:
+            client.set(key, b'1', px=int(ttl * 1000))
+        except Exception as e:
+            logger.warning(f"Erro ao gravar no Redis, usando apenas cache local: {str(e)}")
+
+
+def has_flag(key: str, default_on_error: bool = True) -> bool:
+    """Verifica se a chave está marcada"""
+    if _local_store.get(key):
+        return True
+
+    client = get_redis()
+    if client is not None:
+        try:
+            return bool(client.exists(key))
+        except Exception as e:
+            logger.warning(f"Erro ao consultar Redis: {str(e)}")
+            return default_on_error
+
+    return False
+
+
+_compute_locks = {}
+_compute_locks_guard = threading.Lock()
+
+
+def _compute_lock(key: str) -> threading.Lock:
+    """Lock por chave para o cálculo em voo único"""
+    with _compute_locks_guard:
+        lock = _compute_locks.get(key)
+        if lock is None:
+            lock = _compute_locks[key] = threading.Lock()
+        return lock
+
+
+def get_or_compute(key: str, ttl: float, loader: Callable[[], Any], lock_timeout: float = 5.0) -> Any:
+    """Obtém valor em cache ou calcula uma única vez (sem estouro de consultas simultâneas)
+
+    No processo, só uma thread calcula e as demais aguardam o resultado. Com
+    Redis, o valor é compartilhado entre workers e um lock SET NX garante que
+    apenas um worker recalcule; os outros aguardam o valor publicado.
+    """
+    value = _local_store.get(key)
+    if value is not None:
+        return value
+
+    with _compute_lock(key):
+        value = _local_store.get(key)
+        if value is not None:
+            return value
+
+        client = get_redis()
+        if client is not None:
+            try:
+                value = _wait_shared_value(client, key, lock_timeout)
+            except Exception as e:
+                logger.warning(f"Erro ao consultar cache no Redis, calculando localmente: {str(e)}")
+                client = None
+
+        if value is None:
+            value = loader()
+            if client is not None:
+                try:
+                    client.set(key, json.dumps(value, default=str), px=int(ttl * 1000))
+                    client.delete(f"{key}:lock")
+                except Exception as e:
+                    logger.warning(f"Erro ao gravar cache no Redis: {str(e)}")
+
+        _local_store.set(key, value, ttl)
+        return value
+
+
+def _wait_shared_value(client, key: str, lock_timeout: float) -> Optional[Any]:
+    """Retorna o valor compartilhado, ou None quando este worker deve calcular"""
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        raw = client.get(key)
+        if raw is not None:
+            return json.loads(raw)
+
+        # Quem obtiver o lock calcula; os demais aguardam o valor
+        if client.set(f"{key}:lock", b'1', nx=True, px=int(lock_timeout * 1000)):
+            return None
+
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(0.05)
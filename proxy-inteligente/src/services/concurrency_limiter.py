@@ -0,0 +1,159 @@
+"""Limite adaptativo de chamadas simultâneas ao upstream, por modelo (AIMD)
+
+Cada modelo tem um limite de chamadas em andamento no processo que se
+ajusta pela resposta do upstream:
+  aumento aditivo   chamada bem-sucedida com o limite em uso: +1/limite
+                    (≈ +1 a cada `limite` chamadas)
+  redução multiplicativa   timeout, erro de conexão ou 429/5xx: limite x
+                    UPSTREAM_LIMIT_BACKOFF, no máximo uma vez por "janela"
+                    (chamadas que começaram antes da última redução não
+                    reduzem de novo)
+  redução por latência   resposta acima de UPSTREAM_LATENCY_TOLERANCE x a
+                    referência do modelo para respostas do mesmo tamanho
+                    (0 desliga)
+Acima do limite a chamada é recusada na hora (503 upstream_busy com
+Retry-After) em vez de esperar pelo timeout de um provedor sobrecarregado.
+
+O limite começa e fica no máximo na capacidade do processo: o menor entre
+UPSTREAM_MAX_CONCURRENCY (admissão) e GUNICORN_THREADS. Acima disso ele nunca
+estaria ocupado, não cresceria e levaria várias reduções para recusar algo.
+
+O tempo total de uma resposta depende sobretudo do tamanho dela, então a
+referência de latência é separada por faixa de tokens de saída (potências de
+2: dentro de uma faixa o tamanho varia no máximo 2x). Ela desce a cada
+chamada mais rápida e só sobe com chamadas feitas com pouca concorrência
+(sem se acostumar com a fila do provedor).
+"""
+import os
+import math
+import time
+import threading
+from typing import Dict, Optional
+from src.services.metrics_service import metrics
+
+# Modelos distintos com limite próprio (o nome vem do cliente); os demais dividem um limite
+OTHER_MODELS = '(outros)'
+
+concurrency_limit = metrics.gauge('upstream_concurrency_limit', 'Limite adaptativo de chamadas simultâneas ao upstream, por modelo')
+upstream_shed = metrics.counter('upstream_shed_total', 'Chamadas recusadas pelo limite adaptativo, por modelo')
+limit_decreases = metrics.counter('upstream_limit_decreases_total', 'Reduções do limite adaptativo, por modelo e motivo')
+
+
+def process_capacity() -> int:
+    """Chamadas ao upstream que um processo consegue ter em andamento (admissão e threads do worker)"""
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+    admission = int(os.getenv('UPSTREAM_MAX_CONCURRENCY', '6'))
+    return min(admission, threads) if admission > 0 else threads
+
+
+def size_bucket(output_tokens: int) -> int:
+    """Faixa de tamanho da resposta: 1, 2-3, 4-7, 8-15, ... tokens de saída"""
+    return output_tokens.bit_length()
+
+
+class AdaptiveLimiter:
+    """Limite AIMD de um modelo"""
+
+    def __init__(self, model: str, initial: float, minimum: float, maximum: float,
+                 backoff: float, tolerance: float):
+        self.model = model
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.in_flight = 0
+        # Latência de referência por faixa de tokens de saída
+        self.baselines: Dict[int, float] = {}
+        self.recent: Optional[float] = None
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+        concurrency_limit.set(self.limit, model=model)
+
+    def try_acquire(self) -> bool:
+        """Ocupa uma vaga; False (sem esperar) se o limite estiver ocupado"""
+        with self._lock:
+            if self.in_flight >= int(self.limit):
+                upstream_shed.inc(model=self.model)
+                return False
+            self.in_flight += 1
+            return True
+
+    def retry_after(self) -> int:
+        """Segundos sugeridos ao cliente recusado (latência recente, entre 1 e 30)"""
+        return min(30, max(1, math.ceil(self.recent or 1)))
+
+    def release(self, started: float, latency: Optional[float], overloaded: bool,
+                output_tokens: Optional[int] = None):
+        """Devolve a vaga e ajusta o limite pelo resultado (latency None e sem sobrecarga: só devolve)"""
+        with self._lock:
+            utilized = self.in_flight >= self.limit / 2
+            light = self.in_flight <= max(1, self.limit / 4)
+            self.in_flight -= 1
+
+            reason = 'error' if overloaded else None
+            if latency is not None:
+                self.recent = latency if self.recent is None else self.recent + 0.1 * (latency - self.recent)
+
+            # Sinal de latência, comparado com respostas de tamanho parecido
+            if self.tolerance > 0 and latency is not None and not overloaded and output_tokens:
+                bucket = size_bucket(output_tokens)
+                baseline = self.baselines.get(bucket)
+                if baseline is None:
+                    self.baselines[bucket] = latency
+                else:
+                    if latency > baseline * self.tolerance:
+                        reason = 'latency'
+                    # Referência desce sempre e só sobe sem carga (latência do provedor, não da fila)
+                    if latency < baseline or light:
+                        self.baselines[bucket] = baseline + 0.2 * (latency - baseline)
+
+            if reason is not None:
+                # Uma redução por janela: chamadas já em voo quando o limite caiu não contam de novo
+                if started >= self._last_decrease:
+                    self.limit = max(self.minimum, self.limit * self.backoff)
+                    self._last_decrease = time.monotonic()
+                    limit_decreases.inc(model=self.model, reason=reason)
+            elif utilized and latency is not None:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            concurrency_limit.set(round(self.limit, 2), model=self.model)
+
+
+class AdaptiveConcurrency:
+    """Limitadores por modelo (criados no primeiro uso)"""
+
+    def __init__(self):
+        self.enabled = os.getenv('UPSTREAM_ADAPTIVE_LIMIT', 'true').lower() == 'true'
+        capacity = process_capacity()
+        self.maximum = min(capacity, float(os.getenv('UPSTREAM_LIMIT_MAX') or capacity))
+        self.initial = min(self.maximum, float(os.getenv('UPSTREAM_LIMIT_INITIAL') or self.maximum))
+        self.minimum = min(self.initial, float(os.getenv('UPSTREAM_LIMIT_MIN', '1')))
+        self.backoff = float(os.getenv('UPSTREAM_LIMIT_BACKOFF', '0.7'))
+        self.tolerance = float(os.getenv('UPSTREAM_LATENCY_TOLERANCE', '3'))
+        self.max_models = int(os.getenv('UPSTREAM_LIMIT_MAX_MODELS', '32'))
+        self._limiters: Dict[str, AdaptiveLimiter] = {}
+        self._lock = threading.Lock()
+
+    def for_model(self, model: str) -> AdaptiveLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is not None:
+            return limiter
+        with self._lock:
+            if model not in self._limiters and len(self._limiters) >= self.max_models:
+                model = OTHER_MODELS
+            if model not in self._limiters:
+                self._limiters[model] = AdaptiveLimiter(
+                    model, self.initial, self.minimum, self.maximum, self.backoff, self.tolerance
+                )
+            return self._limiters[model]
+
+    def limits(self) -> Dict[str, Dict[str, float]]:
+        """Limite, chamadas em voo e latências por modelo (diagnóstico)"""
+        return {
+            model: {'limit': round(limiter.limit, 2), 'in_flight': limiter.in_flight,
+                    'recent_s': limiter.recent,
+                    # Referência por faixa, pela menor quantidade de tokens de saída da faixa
+                    'baseline_s': {1 << (bucket - 1): round(value, 3)
+                                   for bucket, value in sorted(limiter.baselines.items())}}
+            for model, limiter in list(self._limiters.items())
+        }
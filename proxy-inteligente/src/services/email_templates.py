@@ -0,0 +1,69 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Iterable, List, Mapping, Optional, Tuple
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, select_autoescape
+
+# Templates HTML + texto de cada email: <nome>.html e <nome>.txt (parciais começam com _)
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'templates', 'email')
+
+
+def _thousands(value: int) -> str:
+    """Número com separador de milhar (mesmo formato de antes: 1,000)"""
+    return f"{value:,}"
+
+
+class EmailTemplates:
+    """Templates de email compilados uma vez por processo, com cache de renderização"""
+
+    def __init__(self, directory: str = TEMPLATES_DIR, cache_size: Optional[int] = None):
+        self.environment = Environment(
+            loader=FileSystemLoader(directory),
+            autoescape=select_autoescape(['html']),
+            undefined=StrictUndefined,
+            trim_blocks=True,
+            lstrip_blocks=True,
+            auto_reload=False
+        )
+        self.environment.filters['thousands'] = _thousands
+
+        # Compila tudo agora (no import / master do --preload), não no primeiro envio
+        self._templates = {
+            name: self.environment.get_template(name)
+            for name in self.environment.list_templates(extensions=['html', 'txt'])
+        }
+        self.names = sorted({os.path.splitext(name)[0] for name in self._templates if not name.startswith('_')})
+
+        self.cache_size = int(os.getenv('EMAIL_RENDER_CACHE_SIZE', '1024')) if cache_size is None else cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, name: str, context: Mapping[str, Any]) -> Tuple[str, str]:
+        """(html, texto) do email `name`; reaproveita a renderização de um contexto idêntico"""
+        key = (name, tuple(sorted(context.items())))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        rendered = (self._templates[f"{name}.html"].render(context), self._templates[f"{name}.txt"].render(context))
+
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = rendered
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return rendered
+
+    def render_many(self, name: str, contexts: Iterable[Mapping[str, Any]],
+                    shared: Optional[Mapping[str, Any]] = None) -> List[Tuple[str, str]]:
+        """Renderiza um email por contexto (notificações em massa); `shared` vale para todos"""
+        if name not in self.names:
+            raise KeyError(f"Template de email inexistente: {name}")
+        shared = dict(shared or {})
+        return [self.render(name, {**shared, **context}) for context in contexts]
+
+
+# Instância do processo (templates compilados no import)
+email_templates = EmailTemplates()
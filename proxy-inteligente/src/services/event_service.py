@@ -0,0 +1,160 @@
+import os
+import json
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+from src.services.cache_service import get_redis
+
+logger = logging.getLogger(__name__)
+
+# Canal Redis compartilhado pelos workers
+EVENTS_CHANNEL = os.getenv('ADMIN_EVENTS_CHANNEL', 'ia_solaris:admin_events')
+
+
+def _event_key(event_id: str):
+    """Chave ordenável do ID do evento (milissegundos, processo, sequência)"""
+    try:
+        return tuple(int(part) for part in event_id.split('-'))
+    except (AttributeError, ValueError):
+        return (0,)
+
+
+class Subscription:
+    """Fila de eventos de um cliente conectado"""
+
+    def __init__(self, maxsize: int):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Próximo evento ou None se o tempo esgotar"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBus:
+    """Pub/sub de eventos do painel: local ao processo, ou via Redis entre workers"""
+
+    def __init__(self):
+        self.buffer_size = int(os.getenv('ADMIN_EVENTS_BUFFER', '1000'))
+        self.queue_size = int(os.getenv('ADMIN_EVENTS_QUEUE_SIZE', '1000'))
+        self.heartbeat_seconds = float(os.getenv('ADMIN_EVENTS_HEARTBEAT_SECONDS', '15'))
+        self.max_stream_seconds = float(os.getenv('ADMIN_EVENTS_MAX_SECONDS', '300'))
+        self._subscribers = set()
+        self._recent = deque(maxlen=self.buffer_size)
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._listener = None
+
+    def publish(self, event_type: str, data: Dict[str, Any]):
+        """Publica um evento (nunca interrompe a requisição em caso de falha)"""
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+        event = {
+            'id': f"{int(time.time() * 1000)}-{os.getpid()}-{seq}",
+            'type': event_type,
+            'data': data
+        }
+
+        client = get_redis()
+        if client is not None:
+            try:
+                client.publish(EVENTS_CHANNEL, json.dumps(event, default=str))
+                return
+            except Exception as e:
+                logger.warning(f"Erro ao publicar evento no Redis, entregando apenas localmente: {str(e)}")
+
+        self._dispatch(event)
+
+    def subscribe(self, last_event_id: Optional[str] = None):
+        """Registra um cliente e devolve (assinatura, eventos perdidos desde last_event_id)"""
+        self._ensure_listener()
+
+        subscription = Subscription(self.queue_size)
+        with self._lock:
+            self._subscribers.add(subscription)
+            missed = []
+            if last_event_id:
+                last_key = _event_key(last_event_id)
+                missed = [event for event in self._recent if _event_key(event['id']) > last_key]
+
+        return subscription, missed
+
+    def unsubscribe(self, subscription: Subscription):
+        """Remove o cliente"""
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        """Clientes conectados neste processo"""
+        with self._lock:
+            return len(self._subscribers)
+
+    def _dispatch(self, event: Dict[str, Any]):
+        """Entrega o evento a todos os clientes deste processo"""
+        with self._lock:
+            self._recent.append(event)
+            subscribers = list(self._subscribers)
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                # Cliente lento: encerra o stream para ele reconectar e ressincronizar
+                subscription.dropped = True
+
+    def _ensure_listener(self):
+        """Inicia (uma vez por processo) a thread que recebe os eventos do Redis"""
+        if self._listener is not None or get_redis() is None:
+            return
+
+        with self._lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='admin-events', daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        """Repassa os eventos do canal Redis para os clientes locais"""
+        while True:
+            try:
+                # Conexão própria, sem o timeout curto usado nos comandos
+                import redis
+                client = redis.Redis.from_url(os.getenv('REDIS_URL'), health_check_interval=30)
+                pubsub = client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(EVENTS_CHANNEL)
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        self._dispatch(json.loads(message['data']))
+            except Exception as e:
+                logger.warning(f"Conexão de eventos com o Redis perdida, reconectando: {str(e)}")
+                time.sleep(1)
+
+
+# Barramento global do processo
+event_bus = EventBus()
+
+
+def publish_event(event_type: str, data: Dict[str, Any]):
+    """Atalho para publicar no barramento global"""
+    event_bus.publish(event_type, data)
+
+
+def init_events(app):
+    """Registra o barramento e avisa se os eventos não chegam a todos os workers
+
+    Sem Redis cada worker entrega só aos clientes SSE conectados nele; o número de
+    workers vem de WEB_CONCURRENCY (o mesmo valor que o gunicorn usa).
+    """
+    app.extensions['event_bus'] = event_bus
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+    if workers > 1 and get_redis() is None:
+        logger.warning(
+            "%d workers sem REDIS_URL: cada painel recebe só os eventos do worker em que está "
+            "conectado; configure o Redis para /v1/admin/events", workers
+        )
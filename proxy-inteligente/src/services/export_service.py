@@ -0,0 +1,142 @@
+import os
+import io
+import csv
+import json
+import zlib
+import base64
+import logging
+from datetime import datetime
+from typing import Iterator, Optional, Tuple
+from sqlalchemy import select, tuple_
+from src.models.token_control import db, TokenTransaction
+
+logger = logging.getLogger(__name__)
+
+# Colunas exportadas (mesma ordem no CSV)
+EXPORT_COLUMNS = (
+    'id', 'user_account_id', 'tokens_used', 'model_used', 'request_id', 'cost_usd',
+    'prompt_tokens', 'completion_tokens', 'total_tokens', 'created_at'
+)
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+}
+
+
+def encode_cursor(created_at: datetime, transaction_id: str) -> str:
+    """Gera token de retomada a partir da última linha recebida"""
+    payload = json.dumps([created_at.isoformat(), transaction_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str) -> Tuple[datetime, str]:
+    """Lê token de retomada (ValueError se inválido)"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        created_at, transaction_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(created_at), str(transaction_id)
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+class LedgerExportService:
+    """Exporta o extrato (token_transactions) em streaming com memória constante"""
+
+    def __init__(self):
+        self.batch_size = int(os.getenv('LEDGER_EXPORT_BATCH_SIZE', '2000'))
+
+    def build_query(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                    user_id: Optional[str] = None, model: Optional[str] = None,
+                    cursor: Optional[str] = None):
+        """Monta SELECT ordenado por (created_at, id) com filtros e retomada"""
+        table = TokenTransaction.__table__
+        query = select(*[table.c[name] for name in EXPORT_COLUMNS])
+
+        if start_date:
+            query = query.where(table.c.created_at >= start_date)
+        if end_date:
+            query = query.where(table.c.created_at < end_date)
+        if user_id:
+            query = query.where(table.c.user_account_id == user_id)
+        if model:
+            query = query.where(table.c.model_used == model)
+        if cursor:
+            # Keyset: continua exatamente depois da última linha entregue
+            query = query.where(tuple_(table.c.created_at, table.c.id) > tuple_(*decode_cursor(cursor)))
+
+        return query.order_by(table.c.created_at, table.c.id)
+
+    def iter_batches(self, query) -> Iterator[list]:
+        """Percorre o resultado com cursor no servidor, em lotes"""
+        result = db.session.execute(query, execution_options={'yield_per': self.batch_size})
+        try:
+            for rows in result.partitions():
+                yield rows
+        finally:
+            result.close()
+
+    @staticmethod
+    def _row_values(row) -> list:
+        """Converte linha em valores serializáveis + cursor da linha"""
+        values = []
+        for name, value in zip(EXPORT_COLUMNS, row):
+            if name == 'cost_usd' and value is not None:
+                value = float(value)
+            elif name == 'created_at':
+                value = value.isoformat()
+            values.append(value)
+        values.append(encode_cursor(row.created_at, row.id))
+        return values
+
+    def _render_ndjson(self, rows) -> str:
+        """Uma linha JSON por transação"""
+        keys = EXPORT_COLUMNS + ('cursor',)
+        return ''.join(
+            json.dumps(dict(zip(keys, self._row_values(row))), separators=(',', ':')) + '\n'
+            for row in rows
+        )
+
+    def _render_csv(self, rows) -> str:
+        """Linhas CSV (sem cabeçalho)"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in rows:
+            writer.writerow(self._row_values(row))
+        return buffer.getvalue()
+
+    def stream(self, export_format: str = 'ndjson', compress: bool = False, **filters) -> Iterator[bytes]:
+        """Gera o arquivo de exportação em pedaços (um por lote do banco)"""
+        query = self.build_query(**filters)
+        render = self._render_csv if export_format == 'csv' else self._render_ndjson
+        # wbits=31: formato gzip, comprimido incrementalmente
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+        def emit(text_chunk):
+            data = text_chunk.encode('utf-8')
+            return compressor.compress(data) if compressor else data
+
+        if export_format == 'csv':
+            header = io.StringIO()
+            csv.writer(header, lineterminator='\n').writerow(EXPORT_COLUMNS + ('cursor',))
+            chunk = emit(header.getvalue())
+            if chunk:
+                yield chunk
+
+        exported = 0
+        try:
+            for rows in self.iter_batches(query):
+                exported += len(rows)
+                chunk = emit(render(rows))
+                if chunk:
+                    yield chunk
+        except Exception as e:
+            # Cabeçalhos já enviados: encerra o stream (cliente retoma pelo cursor)
+            logger.error(f"Erro na exportação do extrato após {exported} linhas: {str(e)}")
+            db.session.rollback()
+            raise
+
+        if compressor:
+            yield compressor.flush()
+
+        logger.info(f"Exportação do extrato concluída: {exported} linhas ({export_format})")
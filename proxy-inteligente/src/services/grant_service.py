@@ -0,0 +1,274 @@
+import os
+import io
+import csv
+import json
+import uuid
+import logging
+from datetime import datetime
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import select, insert, update, bindparam, and_, or_, text
+from src.models.token_control import db, UserAccount, TokenTransaction
+from src.models.database import ledger_write_lock
+from src.services.email_service import EmailService
+
+logger = logging.getLogger(__name__)
+
+
+def parse_csv_grants(stream) -> Iterator[Dict[str, Any]]:
+    """Lê concessões de um CSV (cabeçalho: user_id ou librechat_user_id, tokens, reason)"""
+    # surrogateescape: bytes fora de UTF-8 invalidam só a própria linha, não o bloco lido
+    reader = csv.DictReader(io.TextIOWrapper(stream, encoding='utf-8-sig', errors='surrogateescape', newline=''))
+    for row in reader:
+        yield row if _is_utf8(row) else {'_invalid': True}
+
+
+def _is_utf8(row: Dict[str, Any]) -> bool:
+    """False se algum campo veio de bytes inválidos (surrogates do surrogateescape)"""
+    values = [value for value in row.values() if isinstance(value, str)]
+    values += [value for value in row.get(None) or [] if isinstance(value, str)]  # Colunas extras
+    try:
+        for value in values:
+            value.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def parse_ndjson_grants(stream) -> Iterator[Dict[str, Any]]:
+    """Lê concessões de NDJSON (um objeto por linha)"""
+    for raw_line in stream:
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield {'_invalid': True}
+
+
+def _read_until_error(rows: Iterable[Dict[str, Any]], failure: List[Exception]) -> Iterator[Dict[str, Any]]:
+    """Repassa as linhas até a entrada falhar; o erro fica em `failure`"""
+    iterator = iter(rows)
+    while True:
+        try:
+            row = next(iterator)
+        except StopIteration:
+            return
+        except Exception as e:
+            failure.append(e)
+            return
+        yield row
+
+
+class BulkGrantService:
+    """Concede tokens em lote: atualizações e extrato em transações por lote"""
+
+    def __init__(self, email_service: EmailService = None):
+        self.chunk_size = int(os.getenv('BULK_GRANT_CHUNK_SIZE', '1000'))
+        self.email_service = email_service or EmailService()
+
+    def apply(self, rows: Iterable[Dict[str, Any]], default_reason: str = 'bulk_grant',
+              send_emails: bool = True) -> Iterator[Dict[str, Any]]:
+        """Processa as linhas em lotes e gera o relatório linha a linha
+
+        Entrada ilegível no meio (bytes fora de UTF-8, CSV malformado, corpo
+        interrompido): as linhas lidas até ali são aplicadas e a última linha
+        do relatório é `unreadable_input`, com o número da linha onde retomar.
+        Os lotes anteriores já foram confirmados; reenviar o arquivo inteiro
+        concederia tudo de novo.
+        """
+        failure = []
+        numbered = enumerate(_read_until_error(rows, failure), start=1)
+        read = 0
+        while True:
+            chunk = list(islice(numbered, self.chunk_size))
+            if not chunk:
+                break
+            read = chunk[-1][0]
+
+            grants = []
+            for line, raw in chunk:
+                grant, error = self._normalize(line, raw, default_reason)
+                if error:
+                    yield error
+                else:
+                    grants.append(grant)
+
+            if grants:
+                yield from self._apply_chunk(grants, send_emails)
+
+        if failure:
+            logger.error(f"Entrada de concessões ilegível após a linha {read}: {failure[0]}")
+            yield {'line': read + 1, 'status': 'error', 'error': 'unreadable_input', 'message': str(failure[0])[:200]}
+
+    @staticmethod
+    def _normalize(line: int, raw: Any, default_reason: str) -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """Valida uma linha de entrada"""
+        if not isinstance(raw, dict) or raw.get('_invalid'):
+            return None, {'line': line, 'status': 'error', 'error': 'invalid_row'}
+
+        # Campos de texto com outro tipo JSON (número, lista...) invalidam a linha
+        if any(raw.get(field) is not None and not isinstance(raw[field], str)
+               for field in ('user_id', 'librechat_user_id', 'reason')):
+            return None, {'line': line, 'status': 'error', 'error': 'invalid_row'}
+
+        user_id = (raw.get('user_id') or '').strip() or None
+        librechat_user_id = (raw.get('librechat_user_id') or '').strip() or None
+        if not user_id and not librechat_user_id:
+            return None, {'line': line, 'status': 'error', 'error': 'missing_user'}
+
+        try:
+            tokens = int(raw.get('tokens'))
+        except (TypeError, ValueError):
+            tokens = 0
+        if tokens <= 0:
+            return None, {'line': line, 'user_id': user_id or librechat_user_id, 'status': 'error', 'error': 'invalid_amount'}
+
+        return {
+            'line': line,
+            'user_id': user_id,
+            'librechat_user_id': librechat_user_id,
+            'tokens': tokens,
+            'reason': (raw.get('reason') or '').strip() or default_reason
+        }, None
+
+    def _resolve_users(self, grants: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Busca as contas do lote em uma única consulta"""
+        table = UserAccount.__table__
+        ids = {g['user_id'] for g in grants if g['user_id']}
+        librechat_ids = {g['librechat_user_id'] for g in grants if not g['user_id']}
+
+        conditions = []
+        if ids:
+            conditions.append(table.c.id.in_(ids))
+        if librechat_ids:
+            conditions.append(table.c.librechat_user_id.in_(librechat_ids))
+
+        rows = db.session.execute(
+            select(table.c.id, table.c.librechat_user_id, table.c.email, table.c.name).where(or_(*conditions))
+        ).all()
+
+        accounts = {}
+        for row in rows:
+            accounts[('id', row.id)] = row
+            accounts[('librechat', row.librechat_user_id)] = row
+        return accounts
+
+    def _update_balances(self, totals: Dict[str, int], now: datetime) -> Dict[str, Tuple[int, int]]:
+        """Soma os tokens de todas as contas do lote (mesma regra de desbloqueio de add_tokens)"""
+        table = UserAccount.__table__
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            # Um único UPDATE ... FROM unnest(...) para o lote inteiro
+            rows = db.session.execute(
+                text(
+                    "UPDATE user_accounts AS u SET "
+                    "total_tokens = u.total_tokens + v.tokens, "
+                    "is_blocked = (u.is_blocked AND u.total_tokens + v.tokens - u.used_tokens <= 0), "
+                    "updated_at = :now "
+                    "FROM unnest(CAST(:ids AS varchar[]), CAST(:tokens AS integer[])) AS v(id, tokens) "
+                    "WHERE u.id = v.id "
+                    "RETURNING u.id, u.total_tokens, u.used_tokens"
+                ),
+                {'ids': list(totals.keys()), 'tokens': list(totals.values()), 'now': now}
+            ).all()
+        else:
+            db.session.execute(
+                update(table).where(table.c.id == bindparam('b_id')).values(
+                    total_tokens=table.c.total_tokens + bindparam('b_tokens'),
+                    is_blocked=and_(table.c.is_blocked, table.c.total_tokens + bindparam('b_tokens') - table.c.used_tokens <= 0),
+                    updated_at=now
+                ),
+                [{'b_id': account_id, 'b_tokens': tokens} for account_id, tokens in totals.items()]
+            )
+            rows = db.session.execute(
+                select(table.c.id, table.c.total_tokens, table.c.used_tokens).where(table.c.id.in_(totals.keys()))
+            ).all()
+
+        return {row.id: (row.total_tokens, row.used_tokens) for row in rows}
+
+    def _apply_chunk(self, grants: List[Dict[str, Any]], send_emails: bool) -> List[Dict[str, Any]]:
+        """Aplica um lote: UPDATE em massa + INSERT do extrato + COMMIT"""
+        report = []
+        confirmations = []
+        now = datetime.utcnow()
+
+        try:
+            with ledger_write_lock():
+                accounts = self._resolve_users(grants)
+
+                resolved = []
+                totals = {}
+                for grant in grants:
+                    key = ('id', grant['user_id']) if grant['user_id'] else ('librechat', grant['librechat_user_id'])
+                    account = accounts.get(key)
+                    if account is None:
+                        report.append({
+                            'line': grant['line'],
+                            'user_id': grant['user_id'] or grant['librechat_user_id'],
+                            'status': 'error',
+                            'error': 'user_not_found'
+                        })
+                        continue
+                    grant['account'] = account
+                    grant['transaction_id'] = str(uuid.uuid4())
+                    totals[account.id] = totals.get(account.id, 0) + grant['tokens']
+                    resolved.append(grant)
+
+                if resolved:
+                    balances = self._update_balances(totals, now)
+                    db.session.execute(
+                        insert(TokenTransaction.__table__),
+                        [{
+                            'id': grant['transaction_id'],
+                            'user_account_id': grant['account'].id,
+                            'tokens_used': -grant['tokens'],  # Negativo indica crédito
+                            'model_used': 'credit',
+                            'request_id': grant['reason'],
+                            'created_at': now
+                        } for grant in resolved]
+                    )
+
+                db.session.commit()
+
+        except Exception as e:
+            logger.error(f"Erro ao aplicar lote de concessões (linhas {grants[0]['line']}-{grants[-1]['line']}): {str(e)}")
+            db.session.rollback()
+            return sorted(report + [{
+                'line': grant['line'],
+                'user_id': grant['user_id'] or grant['librechat_user_id'],
+                'status': 'error',
+                'error': 'chunk_failed'
+            } for grant in grants if grant.get('account') is not None], key=lambda item: item['line'])
+
+        for grant in resolved:
+            account = grant['account']
+            total_tokens, used_tokens = balances[account.id]
+            report.append({
+                'line': grant['line'],
+                'user_id': account.id,
+                'librechat_user_id': account.librechat_user_id,
+                'tokens': grant['tokens'],
+                'status': 'granted',
+                'transaction_id': grant['transaction_id'],
+                'total_tokens': total_tokens,
+                'remaining_tokens': max(0, total_tokens - used_tokens)
+            })
+
+            if send_emails:
+                # Cópia desanexada da conta só para o template do email
+                snapshot = UserAccount(
+                    id=account.id, email=account.email, name=account.name,
+                    total_tokens=total_tokens, used_tokens=used_tokens
+                )
+                confirmations.append((snapshot, grant['tokens'], grant['transaction_id']))
+
+        if confirmations:
+            # Um envio em lote por chunk: todas as confirmações na mesma sessão SMTP
+            self.email_service.enqueue(self.email_service.send_credits_purchased_batch, confirmations)
+
+        granted = len(resolved)
+        logger.info(f"Lote de concessões aplicado: {granted} concedidas, {len(grants) - granted} sem usuário")
+
+        return sorted(report, key=lambda item: item['line'])
@@ -1,12 +1,22 @@
 import os
+import time
 import requests
 import json
 import logging
 from typing import Dict, Any, Tuple, Optional
 from datetime import datetime
+from src.services.tracing_service import tracer
+from src.services.concurrency_limiter import AdaptiveConcurrency
 
 logger = logging.getLogger(__name__)
 
+def is_overload(response: Dict[str, Any]) -> bool:
+    """Falha que indica upstream sobrecarregado (reduz o limite adaptativo)"""
+    if response.get('error') in ('timeout', 'connection_error'):
+        return True
+    status_code = response.get('status_code') or 0
+    return status_code == 429 or status_code >= 500
+
 class LiteLLMService:
     """Serviço para integração com LiteLLM"""
     
@@ -26,19 +36,49 @@ class LiteLLMService:
         }
         
         # Timeout padrão
-        self.timeout = 120  # 2 minutos
+        self.timeout = float(os.getenv('UPSTREAM_TIMEOUT_SECONDS', '120'))  # 2 minutos
+        
+        # Chamadas simultâneas por modelo, ajustadas pela latência e pelos erros do upstream
+        self.concurrency = AdaptiveConcurrency()
     
+    @tracer.traced('llm.make_request')
     def make_request(self, request_data: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
         """Faz requisição via LiteLLM ou OpenAI direto"""
+        limiter = None
+        if self.concurrency.enabled:
+            limiter = self.concurrency.for_model(request_data.get('model', 'gpt-3.5-turbo'))
+            if not limiter.try_acquire():
+                # Acima do limite: recusa na hora em vez de esperar um upstream lento
+                logger.warning("Limite de chamadas simultâneas de %s atingido (%d), recusando",
+                               limiter.model, int(limiter.limit))
+                span = tracer.current_span()
+                if span is not None:
+                    span.set_attribute('llm.shed', True)
+                return False, {
+                    'error': 'upstream_busy',
+                    'message': 'Serviço de IA sobrecarregado, tente novamente em instantes',
+                    'retry_after': limiter.retry_after()
+                }
+        
+        started = time.monotonic()
+        latency, overloaded, output_tokens = None, False, None
         try:
             # Tenta primeiro via LiteLLM
             success, response = self._make_litellm_request(request_data)
+            # Sucesso aumenta o limite (ou reduz, se bem mais lento que o normal); timeout, conexão e 429/5xx reduzem
+            if success:
+                latency = time.monotonic() - started
+                output_tokens = (response.get('usage') or {}).get('completion_tokens')
+            overloaded = not success and is_overload(response)
             
             if success:
                 return True, response
             
             # Se LiteLLM falhar, tenta OpenAI direto
             logger.warning("LiteLLM falhou, tentando OpenAI direto")
+            span = tracer.current_span()
+            if span is not None:
+                span.set_attribute('llm.fallback_reason', response.get('error'))
             return self._make_openai_direct_request(request_data)
             
         except Exception as e:
@@ -47,6 +87,9 @@ class LiteLLMService:
                 'error': 'request_failed',
                 'message': 'Falha na comunicação com serviços de IA'
             }
+        finally:
+            if limiter is not None:
+                limiter.release(started, latency, overloaded, output_tokens)
     
     def _make_litellm_request(self, request_data: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
         """Faz requisição via LiteLLM"""
@@ -56,22 +99,29 @@ class LiteLLMService:
             # Prepara dados da requisição
             payload = self._prepare_request_payload(request_data)
             
-            logger.info(f"Fazendo requisição LiteLLM para modelo: {payload.get('model')}")
+            logger.info("Fazendo requisição LiteLLM para modelo: %s", payload.get('model'))
             
-            # Faz requisição
-            response = requests.post(
-                url,
-                headers=self.headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            # Faz requisição (traceparent do span cliente continua o trace no LiteLLM)
+            with tracer.start_span('litellm.chat_completions', kind='client', **{
+                'http.method': 'POST', 'http.url': url, 'llm.model': payload.get('model')
+            }) as span:
+                response = requests.post(
+                    url,
+                    headers=tracer.inject(self.headers),
+                    json=payload,
+                    timeout=self.timeout
+                )
+                span.set_attribute('http.status_code', response.status_code)
+                if response.status_code != 200:
+                    span.set_error(f"HTTP {response.status_code}")
             
             if response.status_code == 200:
                 response_data = response.json()
-                logger.info(f"Requisição LiteLLM bem-sucedida. Tokens: {response_data.get('usage', {}).get('total_tokens', 'N/A')}")
+                logger.info("Requisição LiteLLM bem-sucedida. Tokens: %s", response_data.get('usage', {}).get('total_tokens', 'N/A'))
                 return True, response_data
             else:
-                logger.error(f"Erro LiteLLM: {response.status_code} - {response.text}")
+                logger.error("Erro LiteLLM: %s - %s", response.status_code, response.text,
+                             extra={'upstream': 'litellm', 'status_code': response.status_code})
                 return False, {
                     'error': 'litellm_error',
                     'status_code': response.status_code,
@@ -85,7 +135,7 @@ class LiteLLMService:
             logger.error("Erro de conexão com LiteLLM")
             return False, {'error': 'connection_error', 'message': 'Erro de conexão com LiteLLM'}
         except Exception as e:
-            logger.error(f"Erro inesperado LiteLLM: {str(e)}")
+            logger.error("Erro inesperado LiteLLM: %s", e)
             return False, {'error': 'unexpected_error', 'message': str(e)}
     
     def _make_openai_direct_request(self, request_data: Dict[str, Any]) -> Tuple[bool, Dict[str, Any]]:
@@ -107,22 +157,29 @@ class LiteLLMService:
             # Prepara dados da requisição
             payload = self._prepare_request_payload(request_data)
             
-            logger.info(f"Fazendo requisição OpenAI direta para modelo: {payload.get('model')}")
+            logger.info("Fazendo requisição OpenAI direta para modelo: %s", payload.get('model'))
             
             # Faz requisição
-            response = requests.post(
-                url,
-                headers=headers,
-                json=payload,
-                timeout=self.timeout
-            )
+            with tracer.start_span('openai.chat_completions', kind='client', **{
+                'http.method': 'POST', 'http.url': url, 'llm.model': payload.get('model'), 'llm.fallback': True
+            }) as span:
+                response = requests.post(
+                    url,
+                    headers=tracer.inject(headers),
+                    json=payload,
+                    timeout=self.timeout
+                )
+                span.set_attribute('http.status_code', response.status_code)
+                if response.status_code != 200:
+                    span.set_error(f"HTTP {response.status_code}")
             
             if response.status_code == 200:
                 response_data = response.json()
-                logger.info(f"Requisição OpenAI direta bem-sucedida. Tokens: {response_data.get('usage', {}).get('total_tokens', 'N/A')}")
+                logger.info("Requisição OpenAI direta bem-sucedida. Tokens: %s", response_data.get('usage', {}).get('total_tokens', 'N/A'))
                 return True, response_data
             else:
-                logger.error(f"Erro OpenAI: {response.status_code} - {response.text}")
+                logger.error("Erro OpenAI: %s - %s", response.status_code, response.text,
+                             extra={'upstream': 'openai', 'status_code': response.status_code})
                 return False, {
                     'error': 'openai_error',
                     'status_code': response.status_code,
@@ -130,7 +187,7 @@ class LiteLLMService:
                 }
                 
         except Exception as e:
-            logger.error(f"Erro inesperado OpenAI: {str(e)}")
+            logger.error("Erro inesperado OpenAI: %s", e)
             return False, {'error': 'unexpected_error', 'message': str(e)}
     
     def _prepare_request_payload(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
@@ -0,0 +1,161 @@
+import os
+import threading
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Buckets padrão (segundos) para histogramas de latência
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    """Formata labels no padrão Prometheus"""
+    if not labels:
+        return ''
+    parts = []
+    for key, value in labels:
+        escaped = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{key}="{escaped}"')
+    return '{' + ','.join(parts) + '}'
+
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    """Normaliza labels em chave ordenada"""
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+class Counter:
+    """Contador monotônico com labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, **labels):
+        """Incrementa o valor para os labels informados"""
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        """Retorna amostras (nome, labels, valor)"""
+        with self._lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Valor instantâneo com labels"""
+
+    type_name = 'gauge'
+
+    def set(self, value: float, **labels):
+        """Define o valor para os labels informados"""
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def dec(self, value: float = 1, **labels):
+        """Decrementa o valor para os labels informados"""
+        self.inc(-value, **labels)
+
+
+class Histogram:
+    """Histograma com buckets cumulativos, soma e contagem"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name: str, description: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        """Registra uma observação"""
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self) -> List[Tuple[str, tuple, float]]:
+        """Retorna amostras de buckets, soma e contagem"""
+        result = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, bucket_count in zip(self.buckets, counts):
+                    result.append((f"{self.name}_bucket", key + (('le', repr(bound)),), bucket_count))
+                result.append((f"{self.name}_bucket", key + (('le', '+Inf'),), count))
+                result.append((f"{self.name}_sum", key, total))
+                result.append((f"{self.name}_count", key, count))
+        return result
+
+
+class MetricsRegistry:
+    """Registro de métricas do processo com exportação no formato Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+        self.enabled = os.getenv('ENABLE_METRICS', 'true').lower() == 'true'
+
+    def _register(self, metric):
+        """Registra métrica (ou retorna a já registrada com o mesmo nome)"""
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, description: str) -> Counter:
+        """Obtém ou cria contador"""
+        return self._register(Counter(name, description))
+
+    def gauge(self, name: str, description: str) -> Gauge:
+        """Obtém ou cria gauge"""
+        return self._register(Gauge(name, description))
+
+    def histogram(self, name: str, description: str, buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Obtém ou cria histograma"""
+        return self._register(Histogram(name, description, buckets))
+
+    def register_collector(self, collector: Callable[[], Iterable[Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]]]):
+        """Registra função chamada na exportação: retorna (nome, tipo, descrição, [(labels, valor)])"""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """Exporta todas as métricas no formato texto do Prometheus"""
+        lines = []
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        for collector in collectors:
+            for name, type_name, description, samples in collector():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(_label_key(labels))} {value}")
+
+        return '\n'.join(lines) + '\n'
+
+
+# Registro global do processo (cada worker do gunicorn exporta o seu)
+metrics = MetricsRegistry()
@@ -0,0 +1,352 @@
+import os
+import gzip
+import logging
+import re
+from datetime import datetime, date
+from typing import List, Dict, Any, Tuple
+from sqlalchemy import text
+from src.models.token_control import db, TokenTransaction
+
+logger = logging.getLogger(__name__)
+
+# Nome das partições mensais: token_transactions_p202501
+PARTITION_PATTERN = re.compile(r'^token_transactions_p(\d{4})(\d{2})$')
+
+
+def _add_months(day: date, months: int) -> date:
+    """Soma meses a uma data (sempre no dia 1)"""
+    month_index = day.year * 12 + (day.month - 1) + months
+    return date(month_index // 12, month_index % 12 + 1, 1)
+
+
+class PartitionService:
+    """Gerencia partições mensais de token_transactions (Postgres)"""
+
+    def __init__(self):
+        self.table_name = TokenTransaction.__tablename__
+        self.months_ahead = int(os.getenv('LEDGER_PARTITION_MONTHS_AHEAD', '3'))
+        self.retention_months = int(os.getenv('LEDGER_RETENTION_MONTHS', '12'))
+        self.archive_dir = os.getenv(
+            'LEDGER_ARCHIVE_DIR',
+            os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), 'archive', 'ledger')
+        )
+
+    def is_supported(self) -> bool:
+        """Verifica se o banco atual suporta particionamento"""
+        return db.engine.dialect.name == 'postgresql'
+
+    def is_partitioned(self) -> bool:
+        """Verifica se token_transactions foi criada como tabela particionada"""
+        if not self.is_supported():
+            return False
+
+        return bool(db.session.execute(
+            text(
+                "SELECT 1 FROM pg_partitioned_table pt "
+                "JOIN pg_class c ON c.oid = pt.partrelid "
+                "WHERE c.relname = :table_name AND pg_table_is_visible(c.oid)"
+            ),
+            {'table_name': self.table_name}
+        ).scalar())
+
+    def is_legacy(self) -> bool:
+        """Postgres com token_transactions comum (criada antes do particionamento; ver partition_existing)"""
+        if not self.is_supported() or self.is_partitioned():
+            return False
+        return bool(db.session.execute(
+            text("SELECT to_regclass(:table_name) IS NOT NULL"), {'table_name': self.table_name}
+        ).scalar())
+
+    def warn_if_legacy(self) -> bool:
+        """Avisa no log se o extrato ainda não é particionado (manutenção não faz nada nele)"""
+        if not self.is_legacy():
+            return False
+        logger.warning(
+            f"{self.table_name} é uma tabela comum, criada antes do particionamento: partições e "
+            f"retenção NÃO são aplicadas e a chave primária não bate com o modelo (id, created_at). "
+            f"Converta com `flask --app src.main ledger partition-existing`"
+        )
+        return True
+
+    def list_partitions(self) -> List[Tuple[str, date]]:
+        """Lista partições mensais existentes (nome, mês inicial)"""
+        rows = db.session.execute(
+            text(
+                "SELECT child.relname FROM pg_inherits i "
+                "JOIN pg_class parent ON parent.oid = i.inhparent "
+                "JOIN pg_class child ON child.oid = i.inhrelid "
+                "WHERE parent.relname = :table_name AND pg_table_is_visible(parent.oid)"
+            ),
+            {'table_name': self.table_name}
+        ).scalars().all()
+
+        partitions = []
+        for name in rows:
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                partitions.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+
+        return sorted(partitions, key=lambda item: item[1])
+
+    @property
+    def default_partition(self) -> str:
+        return f"{self.table_name}_default"
+
+    def ensure_partitions(self, months_ahead: int = None, today: date = None) -> List[str]:
+        """Cria as partições do mês atual, dos próximos meses e a DEFAULT (idempotente)"""
+        if not self.is_partitioned():
+            self.warn_if_legacy()
+            return []
+
+        months_ahead = self.months_ahead if months_ahead is None else months_ahead
+        first_month = (today or datetime.utcnow().date()).replace(day=1)
+        existing = {name for name, _ in self.list_partitions()}
+
+        # Sem o job agendado, as liquidações de meses sem partição caem aqui em vez de falhar
+        db.session.execute(text(
+            f'CREATE TABLE IF NOT EXISTS "{self.default_partition}" PARTITION OF "{self.table_name}" DEFAULT'
+        ))
+
+        created = []
+        for offset in range(months_ahead + 1):
+            start = _add_months(first_month, offset)
+            end = _add_months(start, 1)
+            name = f"{self.table_name}_p{start.year:04d}{start.month:02d}"
+            if name in existing:
+                continue
+
+            if self._default_has_rows(start, end):
+                moved = self._attach_from_default(name, start, end)
+                logger.warning(f"{moved} transações movidas da partição DEFAULT para {name} (job de partições atrasado?)")
+            else:
+                db.session.execute(text(
+                    f'CREATE TABLE IF NOT EXISTS "{name}" PARTITION OF "{self.table_name}" '
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+                ))
+            created.append(name)
+
+        db.session.commit()
+
+        if created:
+            logger.info(f"Partições criadas: {', '.join(created)}")
+
+        return created
+
+    def _default_has_rows(self, start: date, end: date) -> bool:
+        """Verifica se a partição DEFAULT recebeu linhas do intervalo do mês"""
+        return bool(db.session.execute(
+            text(
+                f'SELECT EXISTS (SELECT 1 FROM "{self.default_partition}" '
+                f"WHERE created_at >= :start AND created_at < :end)"
+            ),
+            {'start': start, 'end': end}
+        ).scalar())
+
+    def _attach_from_default(self, name: str, start: date, end: date) -> int:
+        """Cria a partição do mês com as linhas que estavam na DEFAULT (na mesma transação)
+
+        Criar a partição direto falharia: a DEFAULT já tem linhas do intervalo.
+        """
+        db.session.execute(text(
+            f'CREATE TABLE "{name}" (LIKE "{self.table_name}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+        ))
+        moved = db.session.execute(
+            text(
+                f'WITH moved AS (DELETE FROM "{self.default_partition}" '
+                f"WHERE created_at >= :start AND created_at < :end RETURNING *) "
+                f'INSERT INTO "{name}" SELECT * FROM moved'
+            ),
+            {'start': start, 'end': end}
+        ).rowcount
+        db.session.execute(text(
+            f'ALTER TABLE "{self.table_name}" ATTACH PARTITION "{name}" '
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        return moved
+
+    def apply_retention(self, retention_months: int = None, archive_dir: str = None,
+                        today: date = None) -> List[Dict[str, Any]]:
+        """Desanexa, exporta (CSV gzip) e remove partições mais antigas que a retenção"""
+        if not self.is_partitioned():
+            self.warn_if_legacy()
+            return []
+
+        retention_months = self.retention_months if retention_months is None else retention_months
+        archive_dir = archive_dir or self.archive_dir
+        cutoff = _add_months((today or datetime.utcnow().date()).replace(day=1), -retention_months)
+
+        os.makedirs(archive_dir, exist_ok=True)
+
+        # Inclui partições já desanexadas por uma execução interrompida
+        candidates = self.list_partitions() + [(name, month, True) for name, month in self._list_detached()]
+
+        archived = []
+        for name, month_start, *detached in candidates:
+            if month_start >= cutoff:
+                continue
+
+            archive_path = os.path.join(archive_dir, f"{name}.csv.gz")
+            rows = self._archive_partition(name, archive_path, already_detached=bool(detached))
+            archived.append({'partition': name, 'file': archive_path, 'rows': rows})
+            logger.info(f"Partição {name} arquivada em {archive_path} ({rows} linhas)")
+
+        return archived
+
+    def partition_existing(self, today: date = None) -> Dict[str, Any]:
+        """Converte a token_transactions comum em particionada, mês a mês, e troca por rename
+
+        1. cria {tabela}_partitioned (particionada, com PK (id, created_at),
+           FK, índices e as partições de todos os meses com dados + DEFAULT)
+        2. copia mês a mês até o atual, um COMMIT por mês, sem bloquear a
+           aplicação (o extrato só recebe INSERTs)
+        3. com a tabela antiga bloqueada para escrita (leituras continuam):
+           copia o que chegou durante a cópia, confere as contagens e troca
+           os nomes; a antiga fica como {tabela}_legacy para conferência
+           (remover com DROP TABLE depois)
+        Uma execução interrompida antes da troca é refeita do zero.
+        """
+        table = self.table_name
+        new, legacy = f"{table}_partitioned", f"{table}_legacy"
+        if not self.is_legacy():
+            return {'converted': False, 'reason': 'já particionada' if self.is_partitioned() else 'sem suporte'}
+        if db.session.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {'name': legacy}).scalar():
+            raise RuntimeError(f"{legacy} já existe (conversão anterior?); remova-a antes de converter de novo")
+
+        db.session.execute(text(f'DROP TABLE IF EXISTS "{new}"'))
+        self._create_partitioned_copy(new)
+
+        current_month = (today or datetime.utcnow().date()).replace(day=1)
+        oldest = db.session.execute(text(f'SELECT min(created_at) FROM "{table}"')).scalar()
+        first_month = min(oldest.date().replace(day=1), current_month) if oldest else current_month
+        months = []
+        month = first_month
+        while month <= _add_months(current_month, self.months_ahead):
+            months.append(month)
+            month = _add_months(month, 1)
+
+        for start in months:
+            end = _add_months(start, 1)
+            db.session.execute(text(
+                f'CREATE TABLE "{table}_p{start.year:04d}{start.month:02d}" PARTITION OF "{new}" '
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+            ))
+        db.session.execute(text(f'CREATE TABLE "{table}_default" PARTITION OF "{new}" DEFAULT'))
+        db.session.commit()
+
+        for start in [month for month in months if month <= current_month]:
+            rows = self._copy_rows(table, new, start, _add_months(start, 1))
+            db.session.commit()
+            logger.info(f"{table}: {start:%Y-%m} copiado ({rows} linhas)")
+
+        # Troca: escrita bloqueada só para o que chegou durante a cópia
+        # (linhas com created_at mais antigo que o mês anterior não são esperadas: a contagem acusa)
+        db.session.execute(text(f'LOCK TABLE "{table}" IN EXCLUSIVE MODE'))
+        db.session.execute(text(
+            f'INSERT INTO "{new}" SELECT * FROM "{table}" AS o '
+            f"WHERE o.created_at >= :since AND NOT EXISTS "
+            f'(SELECT 1 FROM "{new}" AS n WHERE n.id = o.id AND n.created_at = o.created_at)'
+        ), {'since': _add_months(current_month, -1)})
+        old_count = db.session.execute(text(f'SELECT count(*) FROM "{table}"')).scalar()
+        new_count = db.session.execute(text(f'SELECT count(*) FROM "{new}"')).scalar()
+        if old_count != new_count:
+            db.session.rollback()
+            raise RuntimeError(f"Contagens diferentes ({table}: {old_count}, cópia: {new_count}); nada foi trocado")
+
+        self._swap_names(table, new, legacy)
+        db.session.commit()
+        logger.warning(f"{table} convertida em particionada ({new_count} linhas); a tabela antiga ficou como {legacy}")
+        return {'converted': True, 'rows': new_count, 'partitions': len(months) + 1, 'legacy_table': legacy}
+
+    def _create_partitioned_copy(self, new: str):
+        """Tabela particionada com as colunas, chaves e índices do modelo (nomes com sufixo até a troca)"""
+        model = TokenTransaction.__table__
+        db.session.execute(text(
+            f'CREATE TABLE "{new}" (LIKE "{self.table_name}" INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)'
+        ))
+        primary_key = ', '.join(f'"{column.name}"' for column in model.primary_key.columns)
+        db.session.execute(text(f'ALTER TABLE "{new}" ADD CONSTRAINT "{new}_pkey" PRIMARY KEY ({primary_key})'))
+        for foreign_key in model.foreign_keys:
+            target = foreign_key.column
+            db.session.execute(text(
+                f'ALTER TABLE "{new}" ADD CONSTRAINT "{new}_{foreign_key.parent.name}_fkey" '
+                f'FOREIGN KEY ("{foreign_key.parent.name}") REFERENCES "{target.table.name}" ("{target.name}")'
+            ))
+        for index in model.indexes:
+            columns = ', '.join(f'"{column.name}"' for column in index.columns)
+            db.session.execute(text(f'CREATE INDEX "{index.name}_partitioned" ON "{new}" ({columns})'))
+
+    def _copy_rows(self, source: str, target: str, start: date, end: date) -> int:
+        """Copia um mês do extrato antigo para a tabela nova"""
+        return db.session.execute(
+            text(f'INSERT INTO "{target}" SELECT * FROM "{source}" WHERE created_at >= :start AND created_at < :end'),
+            {'start': start, 'end': end}
+        ).rowcount
+
+    def _swap_names(self, table: str, new: str, legacy: str):
+        """Antiga -> _legacy e nova -> nome do modelo (tabela, PK, FK e índices)"""
+        model = TokenTransaction.__table__
+        constraints = db.session.execute(
+            text("SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype IN ('p', 'f')"),
+            {'table': table}
+        ).scalars().all()
+        for name in constraints:
+            db.session.execute(text(f'ALTER TABLE "{table}" RENAME CONSTRAINT "{name}" TO "{name}_legacy"'))
+        for index in model.indexes:
+            db.session.execute(text(f'ALTER INDEX IF EXISTS "{index.name}" RENAME TO "{index.name}_legacy"'))
+        db.session.execute(text(f'ALTER TABLE "{table}" RENAME TO "{legacy}"'))
+
+        db.session.execute(text(f'ALTER TABLE "{new}" RENAME TO "{table}"'))
+        db.session.execute(text(f'ALTER TABLE "{table}" RENAME CONSTRAINT "{new}_pkey" TO "{table}_pkey"'))
+        for foreign_key in model.foreign_keys:
+            column = foreign_key.parent.name
+            db.session.execute(text(
+                f'ALTER TABLE "{table}" RENAME CONSTRAINT "{new}_{column}_fkey" TO "{table}_{column}_fkey"'
+            ))
+        for index in model.indexes:
+            db.session.execute(text(f'ALTER INDEX "{index.name}_partitioned" RENAME TO "{index.name}"'))
+
+    def _list_detached(self) -> List[Tuple[str, date]]:
+        """Lista tabelas mensais que não estão mais anexadas à tabela principal"""
+        rows = db.session.execute(
+            text(
+                "SELECT c.relname FROM pg_class c "
+                "WHERE c.relkind = 'r' AND c.relname LIKE :prefix AND pg_table_is_visible(c.oid) "
+                "AND NOT EXISTS (SELECT 1 FROM pg_inherits i WHERE i.inhrelid = c.oid)"
+            ),
+            {'prefix': f"{self.table_name}_p%"}
+        ).scalars().all()
+
+        detached = []
+        for name in rows:
+            match = PARTITION_PATTERN.match(name)
+            if match:
+                detached.append((name, date(int(match.group(1)), int(match.group(2)), 1)))
+
+        return detached
+
+    def _archive_partition(self, name: str, archive_path: str, already_detached: bool = False) -> int:
+        """Desanexa a partição, exporta para arquivo e remove a tabela"""
+        if not already_detached:
+            db.session.execute(text(f'ALTER TABLE "{self.table_name}" DETACH PARTITION "{name}"'))
+            db.session.commit()
+
+        # COPY direto do driver para o arquivo comprimido (memória constante)
+        tmp_path = f"{archive_path}.tmp"
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive_file:
+                cursor.copy_expert(f'COPY "{name}" TO STDOUT WITH (FORMAT csv, HEADER true)', archive_file)
+            rows = cursor.rowcount
+            cursor.close()
+            connection.commit()
+        finally:
+            connection.close()
+
+        os.replace(tmp_path, archive_path)
+
+        db.session.execute(text(f'DROP TABLE "{name}"'))
+        db.session.commit()
+
+        return rows
+
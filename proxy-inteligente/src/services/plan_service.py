@@ -0,0 +1,157 @@
+import os
+import logging
+from datetime import datetime, date
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from src.models.token_control import db, AllowancePlan
+from src.models.database import ledger_write_lock
+from src.services.event_service import publish_event
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('monthly', 'weekly')
+MODES = ('reset', 'top_up')
+
+# Saldo restante antes da aplicação (mesma regra de UserAccount.remaining_tokens)
+REMAINING_SQL = "CASE WHEN {p}total_tokens > {p}used_tokens THEN {p}total_tokens - {p}used_tokens ELSE 0 END"
+
+# SET de cada modo: reset define a cota e zera o uso; top_up soma a cota
+SET_SQL = {
+    'reset': "total_tokens = :tokens, used_tokens = 0, is_blocked = (is_blocked AND :tokens <= 0)",
+    'top_up': "total_tokens = total_tokens + :tokens, "
+              "is_blocked = (is_blocked AND total_tokens + :tokens - used_tokens <= 0)",
+}
+
+# Lançamento no extrato (negativo = crédito): variação do saldo restante
+LEDGER_SQL = {
+    'reset': REMAINING_SQL + " - :tokens",
+    'top_up': "-:tokens",
+}
+
+# UUID v4 gerado no próprio SQLite (INSERT ... SELECT sem ida e volta ao Python)
+SQLITE_UUID_SQL = (
+    "lower(hex(randomblob(4)) || '-' || hex(randomblob(2)) || '-4' || substr(hex(randomblob(2)), 2) || '-' || "
+    "substr('89ab', 1 + (abs(random()) % 4), 1) || substr(hex(randomblob(2)), 2) || '-' || hex(randomblob(6)))"
+)
+
+
+def period_key(period: str, day: date) -> str:
+    """Identificador do período que contém a data (2025-01 ou 2025-W03)"""
+    if period == 'weekly':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return f"{day.year:04d}-{day.month:02d}"
+
+
+class PlanService:
+    """Aplica as cotas periódicas dos planos em lotes, com SQL set-based"""
+
+    def __init__(self):
+        self.chunk_size = int(os.getenv('PLAN_APPLY_CHUNK_SIZE', '5000'))
+
+    def apply_all(self, today: date = None, chunk_size: int = None) -> List[Dict[str, Any]]:
+        """Aplica todos os planos ativos no período atual"""
+        plans = AllowancePlan.query.filter_by(is_active=True).order_by(AllowancePlan.name).all()
+        return [self.apply_plan(plan, today=today, chunk_size=chunk_size) for plan in plans]
+
+    def apply_plan(self, plan: AllowancePlan, period: Optional[str] = None, today: date = None,
+                   chunk_size: int = None) -> Dict[str, Any]:
+        """Aplica um plano às contas que ainda não receberam o período (idempotente)"""
+        if plan.mode not in MODES or plan.period not in PERIODS:
+            raise ValueError(f"Plano {plan.name} com período/modo inválido: {plan.period}/{plan.mode}")
+
+        period = period or period_key(plan.period, today or datetime.utcnow().date())
+        chunk_size = chunk_size or self.chunk_size
+        params = {
+            'plan_id': plan.id,
+            'period': period,
+            'tokens': plan.tokens,
+            'reason': f"plan_{plan.mode}:{plan.name}:{period}",
+            'model_used': 'credit' if plan.mode == 'top_up' else 'plan_reset',
+            'chunk_size': chunk_size,
+        }
+        apply_chunk = self._apply_chunk_postgres if db.engine.dialect.name == 'postgresql' else self._apply_chunk_sqlite
+
+        accounts = 0
+        chunks = 0
+        last_id = ''
+        started = datetime.utcnow()
+
+        # Keyset por id: cada lote é uma transação curta (não trava a tabela inteira)
+        while True:
+            params['now'] = datetime.utcnow()
+            params['last_id'] = last_id
+            count, last_id = apply_chunk(plan.mode, params)
+            if not count:
+                break
+            accounts += count
+            chunks += 1
+
+        elapsed = (datetime.utcnow() - started).total_seconds()
+        logger.info(f"Plano {plan.name} aplicado no período {period}: {accounts} contas em {chunks} lotes ({elapsed:.1f}s)")
+        if accounts:
+            publish_event('stats.resync', {'reason': 'plan_apply', 'plan': plan.name, 'accounts': accounts})
+
+        return {'plan': plan.name, 'period': period, 'accounts': accounts, 'chunks': chunks, 'seconds': elapsed}
+
+    def _apply_chunk_postgres(self, mode: str, params: Dict[str, Any]):
+        """Lote no Postgres: SELECT FOR UPDATE + UPDATE + INSERT ... SELECT em um único comando"""
+        row = db.session.execute(
+            text(
+                "WITH target AS ("
+                "  SELECT id, total_tokens AS old_total_tokens, used_tokens AS old_used_tokens FROM user_accounts"
+                "  WHERE plan_id = :plan_id AND is_active AND id > :last_id"
+                "  AND plan_period IS DISTINCT FROM :period"
+                "  ORDER BY id LIMIT :chunk_size FOR UPDATE"
+                "), updated AS ("
+                f"  UPDATE user_accounts AS u SET {SET_SQL[mode]}, plan_period = :period, updated_at = :now"
+                "  FROM target t WHERE u.id = t.id"
+                f"  RETURNING u.id, {LEDGER_SQL[mode].format(p='t.old_')} AS delta"
+                "), ledger AS ("
+                "  INSERT INTO token_transactions (id, user_account_id, tokens_used, model_used, request_id, created_at)"
+                "  SELECT gen_random_uuid()::text, id, delta, :model_used, :reason, :now FROM updated"
+                ") "
+                "SELECT count(*), max(id) FROM updated"
+            ),
+            params
+        ).one()
+        db.session.commit()
+        return row[0], row[1]
+
+    def _apply_chunk_sqlite(self, mode: str, params: Dict[str, Any]):
+        """Lote no SQLite: INSERT ... SELECT antes do UPDATE, sob a fila de escrita"""
+        with ledger_write_lock():
+            ids = db.session.execute(
+                text(
+                    "SELECT id FROM user_accounts "
+                    "WHERE plan_id = :plan_id AND is_active AND id > :last_id "
+                    "AND (plan_period IS NULL OR plan_period <> :period) "
+                    "ORDER BY id LIMIT :chunk_size"
+                ),
+                params
+            ).scalars().all()
+            if not ids:
+                db.session.rollback()
+                return 0, None
+
+            chunk = dict(params, first_id=ids[0], max_id=ids[-1])
+            window = (
+                "plan_id = :plan_id AND is_active AND id >= :first_id AND id <= :max_id "
+                "AND (plan_period IS NULL OR plan_period <> :period)"
+            )
+            db.session.execute(
+                text(
+                    "INSERT INTO token_transactions (id, user_account_id, tokens_used, model_used, request_id, created_at) "
+                    f"SELECT {SQLITE_UUID_SQL}, id, "
+                    f"{LEDGER_SQL[mode].format(p='')}, :model_used, :reason, :now "
+                    f"FROM user_accounts WHERE {window}"
+                ),
+                chunk
+            )
+            db.session.execute(
+                text(f"UPDATE user_accounts SET {SET_SQL[mode]}, plan_period = :period, updated_at = :now WHERE {window}"),
+                chunk
+            )
+            db.session.commit()
+
+        return len(ids), ids[-1]
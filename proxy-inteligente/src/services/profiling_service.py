@@ -0,0 +1,284 @@
+"""Profiling amostrado por requisição (opt-in)
+
+Uma fração das requisições (PROFILE_SAMPLE_RATE) ou as que trazem o header
+X-Profile com o token de admin (PROFILE_ADMIN_TOKEN) são perfiladas por um
+profiler estatístico: uma thread por processo lê a pilha da thread da
+requisição a cada PROFILE_INTERVAL_MS (sys._current_frames), sem
+instrumentar chamadas. O tempo de SQL vem dos eventos de cursor do
+SQLAlchemy (query_accounting) e as amostras são atribuídas à etapa do
+ProxyService em execução.
+
+Saída em PROFILE_DIR:
+  request    <hora>-<método>-<rota>-<ms>ms-<pid>.folded + .json por requisição
+  aggregate  <método>-<rota>.<pid>.folded acumulado + summaries.<pid>.ndjson
+Os .folded (uma pilha por linha + contagem) abrem no speedscope ou no
+flamegraph.pl.
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+from flask import g, request
+from src.services.metrics_service import metrics
+from src.services.query_accounting import QueryCounter, start_counter, stop_counter
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Amostras com estes frames na pilha contam como tempo de banco
+SQL_FRAME_PREFIXES = ('sqlalchemy/', 'psycopg2/', 'sqlite3/')
+# Etapa da requisição: frame mais interno do ProxyService na pilha
+STAGE_PREFIX = 'ProxyService.'
+OUTSIDE_STAGE = '(fora do ProxyService)'
+
+profiles_captured = metrics.counter('request_profiles_total', 'Requisições perfiladas por gatilho')
+
+
+class RequestProfile:
+    """Pilhas amostradas e tempo de SQL de uma requisição"""
+
+    def __init__(self, method: str, path: str, trigger: str):
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.stacks: Counter = Counter()
+        self.queries: Optional[QueryCounter] = None
+
+    def summary(self, status: int, duration: float, interval: float) -> Dict[str, Any]:
+        """Tempo por etapa (amostras x intervalo), SQL medido e consultas mais caras"""
+        stages: Dict[str, Dict[str, float]] = {}
+        sql_samples = 0
+        for stack, count in self.stacks.items():
+            stage = next((frame.split(':', 1)[1] for frame in reversed(stack)
+                          if frame.split(':', 1)[-1].startswith(STAGE_PREFIX)), OUTSIDE_STAGE)
+            in_sql = any(frame.startswith(SQL_FRAME_PREFIXES) for frame in stack)
+            entry = stages.setdefault(stage, {'ms': 0.0, 'sql_ms': 0.0})
+            entry['ms'] += count * interval * 1000
+            if in_sql:
+                entry['sql_ms'] += count * interval * 1000
+                sql_samples += count
+
+        # Consultas agrupadas pelo início do SQL
+        statements: Dict[str, list] = {}
+        for statement, seconds in self.queries.statements:
+            entry = statements.setdefault(' '.join(statement.split())[:160], [0, 0.0])
+            entry[0] += 1
+            entry[1] += seconds
+        top = sorted(statements.items(), key=lambda item: item[1][1], reverse=True)[:10]
+        return {
+            'method': self.method,
+            'path': self.path,
+            'status': status,
+            'trigger': self.trigger,
+            'started_at': self.started_at.isoformat(),
+            'duration_ms': round(duration * 1000, 2),
+            'interval_ms': interval * 1000,
+            'samples': sum(self.stacks.values()),
+            'stages': {
+                stage: {'ms': round(values['ms'], 1), 'sql_ms': round(values['sql_ms'], 1)}
+                for stage, values in sorted(stages.items(), key=lambda item: item[1]['ms'], reverse=True)
+            },
+            'sql': {
+                'queries': self.queries.count,
+                'ms': round(self.queries.seconds * 1000, 2),
+                'sampled_ms': round(sql_samples * interval * 1000, 1),
+                'top': [
+                    {'statement': statement, 'count': count, 'ms': round(seconds * 1000, 2)}
+                    for statement, (count, seconds) in top
+                ]
+            }
+        }
+
+
+class SamplingProfiler:
+    """Thread única por processo que amostra as pilhas das requisições perfiladas"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: Dict[int, RequestProfile] = {}
+        self._labels: Dict[Any, str] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self, profile: RequestProfile):
+        """Começa a amostrar a thread atual"""
+        with self._lock:
+            self._active[threading.get_ident()] = profile
+            # Após fork (gunicorn --preload) a thread do master não existe no worker
+            if self._thread is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def stop(self) -> Optional[RequestProfile]:
+        """Para de amostrar a thread atual e devolve o perfil"""
+        with self._lock:
+            return self._active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            if not self._active:
+                self._wakeup.wait()
+                self._wakeup.clear()
+                continue
+
+            time.sleep(self.interval)
+            with self._lock:
+                active = list(self._active.items())
+
+            frames = sys._current_frames()
+            for thread_id, profile in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[self._fold(frame)] += 1
+
+    def _fold(self, frame) -> Tuple[str, ...]:
+        """Pilha da raiz até o frame atual como rótulos 'arquivo:função'"""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = self._labels.get(code)
+            if label is None:
+                label = self._labels[code] = f"{_short_path(code.co_filename)}:{getattr(code, 'co_qualname', code.co_name)}"
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(stack)
+
+
+def _short_path(filename: str) -> str:
+    """Caminho relativo ao diretório do sys.path que contém o arquivo"""
+    for root in sorted((path for path in sys.path if path), key=len, reverse=True):
+        if filename.startswith(root.rstrip(os.sep) + os.sep):
+            return filename[len(root.rstrip(os.sep)) + 1:].replace(os.sep, '/')
+    return os.path.basename(filename)
+
+
+class ProfilingService:
+    """Middleware de profiling: escolhe as requisições, amostra e grava os resultados"""
+
+    def __init__(self):
+        self.sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+        self.admin_token = os.getenv('PROFILE_ADMIN_TOKEN', '')
+        self.output_dir = os.getenv('PROFILE_DIR', 'profiles')
+        self.output_mode = os.getenv('PROFILE_OUTPUT', 'request')
+        self.min_duration = float(os.getenv('PROFILE_MIN_DURATION_MS', '0')) / 1000
+        self.path_prefix = os.getenv('PROFILE_PATH_PREFIX', '/v1/')
+        self.profiler = SamplingProfiler(float(os.getenv('PROFILE_INTERVAL_MS', '5')) / 1000)
+
+        # Modo aggregate: pilhas somadas por rota no processo
+        self._aggregates: Dict[str, Counter] = {}
+        self._write_lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or bool(self.admin_token)
+
+    def init_app(self, app):
+        """Registra os hooks (nada é registrado com o profiling desligado)"""
+        if not self.enabled:
+            return
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        logger.info(
+            f"Profiling por requisição: amostragem={self.sample_rate} header={'sim' if self.admin_token else 'não'} "
+            f"intervalo={self.profiler.interval * 1000:.0f}ms saída={self.output_dir} ({self.output_mode})"
+        )
+
+    def _trigger(self) -> Optional[str]:
+        """Motivo para perfilar a requisição atual (None = não perfilar)"""
+        if not request.path.startswith(self.path_prefix):
+            return None
+        token = request.headers.get(PROFILE_HEADER)
+        if token and self.admin_token and hmac.compare_digest(token, self.admin_token):
+            return 'header'
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return 'sample'
+        return None
+
+    def _before_request(self):
+        trigger = self._trigger()
+        if trigger:
+            g.request_profile = RequestProfile(request.method, request.path, trigger)
+            g.request_profile.queries = start_counter()
+            self.profiler.start(g.request_profile)
+
+    def _after_request(self, response):
+        profile = g.pop('request_profile', None)
+        if profile is None:
+            return response
+
+        self.profiler.stop()
+        stop_counter(profile.queries)
+        duration = time.perf_counter() - profile.started
+        profiles_captured.inc(trigger=profile.trigger)
+        if duration < self.min_duration and profile.trigger == 'sample':
+            return response
+
+        try:
+            profile_id = self._write(profile, profile.summary(response.status_code, duration, self.profiler.interval), request)
+            response.headers['X-Profile-Id'] = profile_id
+        except OSError as e:
+            logger.error(f"Erro ao gravar profile de {profile.method} {profile.path}: {str(e)}")
+        return response
+
+    def _teardown_request(self, exception):
+        # Exceção antes do after_request: só para de amostrar
+        profile = g.pop('request_profile', None)
+        if profile is not None:
+            self.profiler.stop()
+            stop_counter(profile.queries)
+
+    def _write(self, profile: RequestProfile, summary: Dict[str, Any], req) -> str:
+        """Grava as pilhas (.folded) e o resumo; retorna o identificador do arquivo"""
+        route = req.url_rule.rule if req.url_rule else profile.path
+        slug = route.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+        root = f"{profile.method} {route}"
+
+        with self._write_lock:
+            if self.output_mode == 'aggregate':
+                name = f"{profile.method.lower()}-{slug}.{os.getpid()}"
+                stacks = self._aggregates.setdefault(name, Counter())
+                stacks.update(profile.stacks)
+                self._write_folded(os.path.join(self.output_dir, f"{name}.folded"), root, stacks)
+                with open(os.path.join(self.output_dir, f"summaries.{os.getpid()}.ndjson"), 'a', encoding='utf-8') as handle:
+                    handle.write(json.dumps(summary, separators=(',', ':')) + '\n')
+                return name
+
+            name = (f"{profile.started_at.strftime('%Y%m%dT%H%M%S')}-{profile.method.lower()}-{slug}-"
+                    f"{summary['duration_ms']:.0f}ms-{os.getpid()}")
+            self._write_folded(os.path.join(self.output_dir, f"{name}.folded"), root, profile.stacks)
+            with open(os.path.join(self.output_dir, f"{name}.json"), 'w', encoding='utf-8') as handle:
+                json.dump(summary, handle, indent=2, ensure_ascii=False)
+            return name
+
+    @staticmethod
+    def _write_folded(path: str, root: str, stacks: Counter):
+        """Formato folded: 'raiz;frame;...;frame contagem' por linha"""
+        with open(path, 'w', encoding='utf-8') as handle:
+            for stack, count in stacks.most_common():
+                handle.write(f"{';'.join((root,) + stack)} {count}\n")
+
+
+profiling_service = ProfilingService()
+
+
+def init_profiling(app):
+    """Ativa o profiling amostrado se PROFILE_SAMPLE_RATE ou PROFILE_ADMIN_TOKEN estiverem definidos"""
+    profiling_service.init_app(app)
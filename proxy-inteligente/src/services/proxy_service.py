@@ -4,12 +4,19 @@ import logging
 from datetime import datetime
 from typing import Dict, Any, Optional, Tuple
 from flask import current_app
+from sqlalchemy import text, select, func, inspect
+from sqlalchemy.orm.attributes import set_committed_value
 from src.models.token_control import db, UserAccount, TokenTransaction, UserAlert
+from src.models.serializers import select_transactions, transaction_row
+from src.models.database import ledger_write_lock, pin_primary, use_primary, is_reading_from_replica
 from src.services.litellm_service import LiteLLMService
 from src.services.email_service import EmailService
+from src.services.alert_digest_service import AlertDigestService
+from src.services.admission_service import FairShareScheduler, AdmissionRejected
+from src.services.event_service import publish_event
+from src.services.tracing_service import tracer
 
 # Configurar logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 class ProxyService:
@@ -18,17 +25,29 @@ class ProxyService:
     def __init__(self):
         self.litellm_service = LiteLLMService()
         self.email_service = EmailService()
+        # Alertas de um usuário na mesma janela viram um único email (o mais grave)
+        self.alert_digest = AlertDigestService(self.email_service)
+        # Vagas de chamada ao upstream: limite por usuário e fila justa entre usuários
+        self.admission = FairShareScheduler()
         
         # Configurações padrão
         self.default_tokens_per_user = 1000
         self.conversion_factor = 0.376  # Fator de conversão baseado na análise
         
+        # Disponibilidade da função ia_solaris.settle_usage (detectada sob demanda)
+        self._settle_usage_available = None
+        
     def get_or_create_user(self, librechat_user_id: str, email: str = None, name: str = None) -> UserAccount:
         """Obtém ou cria usuário no sistema"""
         try:
             # Busca usuário existente
             user = UserAccount.query.filter_by(librechat_user_id=librechat_user_id).first()
             
+            # Réplica atrasada: confirma no primário antes de criar
+            if not user and is_reading_from_replica():
+                with use_primary():
+                    user = UserAccount.query.filter_by(librechat_user_id=librechat_user_id).first()
+            
             if not user:
                 # Cria novo usuário
                 user = UserAccount(
@@ -41,6 +60,7 @@ class ProxyService:
                 db.session.commit()
                 
                 logger.info(f"Novo usuário criado: {user.email} (ID: {user.id})")
+                publish_event('user.created', {'user': user.to_dict()})
             
             return user
             
@@ -77,7 +97,7 @@ class ProxyService:
             else:
                 estimated_tokens = int(estimated_tokens * 1.2)  # Margem para resposta
             
-            logger.info(f"Tokens estimados para modelo {model}: {estimated_tokens}")
+            logger.info("Tokens estimados para modelo %s: %s", model, estimated_tokens)
             return estimated_tokens
             
         except Exception as e:
@@ -109,10 +129,15 @@ class ProxyService:
         """Processa requisição para OpenAI via LiteLLM"""
         try:
             # Estima tokens necessários
-            tokens_needed = self.estimate_tokens_needed(request_data)
+            with tracer.start_span('estimate_tokens_needed', **{'llm.model': request_data.get('model')}) as span:
+                tokens_needed = self.estimate_tokens_needed(request_data)
+                span.set_attribute('llm.tokens_estimated', tokens_needed)
             
             # Verifica limites do usuário
-            can_proceed, message = self.check_user_limits(user, tokens_needed)
+            with tracer.start_span('check_user_limits') as span:
+                can_proceed, message = self.check_user_limits(user, tokens_needed)
+                if not can_proceed:
+                    span.set_attribute('limits.rejected', message)
             if not can_proceed:
                 return False, {
                     'error': 'insufficient_tokens',
@@ -124,8 +149,12 @@ class ProxyService:
                     }
                 }
             
-            # Faz requisição via LiteLLM
-            success, response_data = self.litellm_service.make_request(request_data)
+            # Faz requisição via LiteLLM (na vez do usuário; fila cheia ou espera longa viram 429/503)
+            try:
+                with self.admission.slot(user.id, user.priority_tier):
+                    success, response_data = self.litellm_service.make_request(request_data)
+            except AdmissionRejected as e:
+                return False, e.to_dict()
             
             if success:
                 # Extrai informações de uso real
@@ -135,28 +164,25 @@ class ProxyService:
                 # Aplica fator de conversão
                 converted_tokens = int(actual_tokens * self.conversion_factor)
                 
-                # Registra consumo
-                transaction = user.consume_tokens(
-                    tokens_used=converted_tokens,
-                    model_used=request_data.get('model'),
-                    request_id=response_data.get('id'),
-                    cost_usd=self.calculate_cost(actual_tokens, request_data.get('model'))
-                )
+                # Registra consumo, bloqueio e alertas
+                with tracer.start_span('ledger.settle_usage', **{'ledger.tokens': converted_tokens}):
+                    transaction_id = self.settle_usage(
+                        user,
+                        tokens_used=converted_tokens,
+                        model_used=request_data.get('model'),
+                        request_id=response_data.get('id'),
+                        cost_usd=self.calculate_cost(actual_tokens, request_data.get('model'))
+                    )
                 
-                # Salva no banco
-                db.session.commit()
-                
-                # Verifica se precisa enviar alertas
-                self.check_and_send_alerts(user)
-                
-                logger.info(f"Requisição processada para usuário {user.email}. Tokens consumidos: {converted_tokens}")
+                logger.info("Requisição processada para usuário %s. Tokens consumidos: %s", user.email, converted_tokens,
+                            extra={'user_id': user.id, 'model': request_data.get('model'), 'tokens': converted_tokens})
                 
                 # Adiciona informações de uso à resposta
                 response_data['ia_solaris_usage'] = {
                     'tokens_consumed': converted_tokens,
                     'remaining_tokens': user.remaining_tokens,
                     'usage_percentage': user.usage_percentage,
-                    'transaction_id': transaction.id
+                    'transaction_id': transaction_id
                 }
                 
                 return True, response_data
@@ -164,13 +190,123 @@ class ProxyService:
                 return False, response_data
                 
         except Exception as e:
-            logger.error(f"Erro ao processar requisição OpenAI para usuário {user.id}: {str(e)}")
+            logger.error("Erro ao processar requisição OpenAI para usuário %s: %s", user.id, e)
             db.session.rollback()
             return False, {
                 'error': 'internal_error',
                 'message': 'Erro interno do sistema'
             }
     
+    def settle_usage(self, user: UserAccount, tokens_used: int, model_used: str = None,
+                     request_id: str = None, cost_usd: float = None) -> str:
+        """Liquida o consumo da requisição e retorna o ID da transação"""
+        # Leituras do próprio saldo vão para o primário logo após a escrita
+        pin_primary(user.librechat_user_id)
+        
+        if self._has_settle_usage_function():
+            with tracer.start_span('ledger.commit', **{'ledger.path': 'settle_usage_function'}):
+                transaction_id = self._settle_usage_postgres(user, tokens_used, model_used, request_id, cost_usd)
+            self.publish_usage_settled(user, tokens_used, model_used, transaction_id)
+            return transaction_id
+        
+        # Fallback (SQLite ou Postgres sem a função): ORM + verificação de alertas
+        with tracer.start_span('ledger.commit', **{'ledger.path': 'orm'}), ledger_write_lock():
+            transaction = user.consume_tokens(
+                tokens_used=tokens_used,
+                model_used=model_used,
+                request_id=request_id,
+                cost_usd=cost_usd
+            )
+            db.session.commit()
+        
+        self.check_and_send_alerts(user)
+        
+        # consume_tokens já marca o bloqueio, então o alerta é enviado aqui
+        if user.is_blocked:
+            self.send_alert_blocked(user)
+        
+        self.publish_usage_settled(user, tokens_used, model_used, transaction.id)
+        return transaction.id
+    
+    def publish_usage_settled(self, user: UserAccount, tokens_used: int, model_used: Optional[str], transaction_id: str):
+        """Notifica o painel administrativo sobre o consumo liquidado"""
+        publish_event('usage.settled', {
+            'user': user.to_dict(),
+            'tokens_used': tokens_used,
+            'model_used': model_used,
+            'transaction_id': transaction_id
+        })
+    
+    def _has_settle_usage_function(self) -> bool:
+        """Verifica (uma vez por processo) se ia_solaris.settle_usage está disponível"""
+        if self._settle_usage_available is None:
+            available = False
+            try:
+                if db.engine.dialect.name == 'postgresql':
+                    available = db.session.execute(text(
+                        "SELECT to_regprocedure('ia_solaris.settle_usage(varchar, integer, varchar, varchar, numeric)') IS NOT NULL"
+                    )).scalar()
+                    if not available:
+                        logger.warning("Função ia_solaris.settle_usage não encontrada, usando liquidação via ORM")
+            except Exception as e:
+                logger.error(f"Erro ao verificar função settle_usage: {str(e)}")
+                db.session.rollback()
+            self._settle_usage_available = bool(available)
+        
+        return self._settle_usage_available
+    
+    def _settle_usage_postgres(self, user: UserAccount, tokens_used: int, model_used: Optional[str],
+                               request_id: Optional[str], cost_usd: Optional[float]) -> str:
+        """Liquida o consumo em um único round-trip via ia_solaris.settle_usage"""
+        row = db.session.execute(
+            text(
+                "SELECT * FROM ia_solaris.settle_usage("
+                ":user_account_id, :tokens_used, :model_used, :request_id, :cost_usd)"
+            ),
+            {
+                'user_account_id': user.id,
+                'tokens_used': tokens_used,
+                'model_used': model_used,
+                'request_id': request_id,
+                'cost_usd': cost_usd
+            }
+        ).mappings().first()
+        
+        if row is None:
+            db.session.rollback()
+            raise ValueError("Tokens insuficientes ou conta bloqueada")
+        
+        # O commit expira a instância: guarda as colunas carregadas para restaurá-las
+        # com o resultado da liquidação (log, alertas e evento sem novo SELECT)
+        loaded = inspect(user).dict
+        values = {column.key: loaded[column.key] for column in UserAccount.__mapper__.column_attrs if column.key in loaded}
+        
+        db.session.commit()
+        
+        values.update(
+            total_tokens=row['total_tokens'],
+            used_tokens=row['used_tokens'],
+            is_blocked=row['is_blocked'],
+            last_activity=row['settled_at'],
+            updated_at=row['settled_at']
+        )
+        for key, value in values.items():
+            set_committed_value(user, key, value)
+        
+        self.send_pending_alerts(user, row['alerts'] or [])
+        return row['transaction_id']
+    
+    def send_pending_alerts(self, user: UserAccount, alerts: list):
+        """Envia os alertas pendentes retornados pela liquidação"""
+        if '80_percent' in alerts:
+            self.send_alert_80_percent(user)
+        
+        if '95_percent' in alerts:
+            self.send_alert_95_percent(user)
+        
+        if 'blocked' in alerts:
+            self.send_alert_blocked(user)
+    
     def calculate_cost(self, tokens: int, model: str) -> float:
         """Calcula custo em USD baseado no modelo"""
         # Preços por 1K tokens (aproximados)
@@ -228,85 +364,39 @@ class ProxyService:
             logger.error(f"Erro ao verificar alertas para usuário {user.id}: {str(e)}")
     
     def send_alert_80_percent(self, user: UserAccount):
-        """Envia alerta de 80% de consumo"""
-        try:
-            alert = UserAlert(
-                user_account_id=user.id,
-                alert_type='80_percent',
-                alert_message=f"Você consumiu 80% dos seus tokens. Restam {user.remaining_tokens} tokens."
-            )
-            db.session.add(alert)
-            
-            # Envia email
-            success = self.email_service.send_alert_80_percent(user)
-            if success:
-                alert.mark_as_sent()
-            
-            db.session.commit()
-            logger.info(f"Alerta 80% enviado para usuário {user.email}")
-            
-        except Exception as e:
-            logger.error(f"Erro ao enviar alerta 80% para usuário {user.id}: {str(e)}")
+        """Agenda o alerta de 80% de consumo no digest do usuário"""
+        self.alert_digest.submit(user, '80_percent')
     
     def send_alert_95_percent(self, user: UserAccount):
-        """Envia alerta de 95% de consumo"""
-        try:
-            alert = UserAlert(
-                user_account_id=user.id,
-                alert_type='95_percent',
-                alert_message=f"ATENÇÃO: Você consumiu 95% dos seus tokens. Restam apenas {user.remaining_tokens} tokens."
-            )
-            db.session.add(alert)
-            
-            # Envia email
-            success = self.email_service.send_alert_95_percent(user)
-            if success:
-                alert.mark_as_sent()
-            
-            db.session.commit()
-            logger.info(f"Alerta 95% enviado para usuário {user.email}")
-            
-        except Exception as e:
-            logger.error(f"Erro ao enviar alerta 95% para usuário {user.id}: {str(e)}")
+        """Agenda o alerta de 95% de consumo no digest do usuário"""
+        self.alert_digest.submit(user, '95_percent')
     
     def send_alert_blocked(self, user: UserAccount):
-        """Envia alerta de conta bloqueada"""
-        try:
-            alert = UserAlert(
-                user_account_id=user.id,
-                alert_type='blocked',
-                alert_message="Sua conta foi bloqueada por esgotamento de tokens."
-            )
-            db.session.add(alert)
-            
-            # Envia email
-            success = self.email_service.send_alert_blocked(user)
-            if success:
-                alert.mark_as_sent()
-            
-            db.session.commit()
-            logger.info(f"Alerta de bloqueio enviado para usuário {user.email}")
-            
-        except Exception as e:
-            logger.error(f"Erro ao enviar alerta de bloqueio para usuário {user.id}: {str(e)}")
+        """Agenda o alerta de conta bloqueada no digest do usuário"""
+        self.alert_digest.submit(user, 'blocked')
     
     def get_user_stats(self, user: UserAccount) -> Dict[str, Any]:
         """Obtém estatísticas do usuário"""
         try:
-            # Busca transações recentes
-            recent_transactions = TokenTransaction.query.filter_by(
-                user_account_id=user.id
-            ).order_by(TokenTransaction.created_at.desc()).limit(10).all()
+            # Busca transações recentes (só as colunas, sem objetos ORM)
+            recent_transactions = db.session.execute(select_transactions().where(
+                TokenTransaction.user_account_id == user.id
+            ).order_by(TokenTransaction.created_at.desc()).limit(10))
             
             # Calcula estatísticas
-            total_transactions = TokenTransaction.query.filter_by(user_account_id=user.id).count()
+            total_transactions = db.session.execute(
+                select(func.count()).select_from(TokenTransaction).where(TokenTransaction.user_account_id == user.id)
+            ).scalar()
+            
+            # Uma consulta de uso diário serve às duas métricas
+            daily_usage = self.calculate_daily_usage(user)
             
             return {
                 'user_info': user.to_dict(),
-                'recent_transactions': [t.to_dict() for t in recent_transactions],
+                'recent_transactions': [transaction_row(row) for row in recent_transactions],
                 'total_transactions': total_transactions,
-                'daily_usage': self.calculate_daily_usage(user),
-                'monthly_projection': self.calculate_monthly_projection(user)
+                'daily_usage': daily_usage,
+                'monthly_projection': self.calculate_monthly_projection(user, daily_usage)
             }
             
         except Exception as e:
@@ -337,8 +427,9 @@ class ProxyService:
             logger.error(f"Erro ao calcular uso diário para usuário {user.id}: {str(e)}")
             return 0
     
-    def calculate_monthly_projection(self, user: UserAccount) -> int:
+    def calculate_monthly_projection(self, user: UserAccount, daily_usage: Optional[int] = None) -> int:
         """Calcula projeção mensal baseada no uso atual"""
-        daily_usage = self.calculate_daily_usage(user)
+        if daily_usage is None:
+            daily_usage = self.calculate_daily_usage(user)
         return daily_usage * 30
 
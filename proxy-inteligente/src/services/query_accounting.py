@@ -0,0 +1,202 @@
+"""Contagem de consultas SQL e tempo de banco por requisição
+
+Os eventos de cursor do SQLAlchemy alimentam os contadores ativos na thread:
+o da requisição (métricas por endpoint e, em debug ou com QUERY_HEADERS=true,
+headers X-DB-Queries / X-DB-Time-Ms) e os de `count_queries()` /
+`assert_max_queries()`, usados para travar o número de consultas de um
+endpoint (ver QUERY_BUDGETS, tests/test_query_budgets.py e `flask queries check`).
+"""
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Tuple
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (1, 2, 3, 4, 5, 8, 13, 21, 34, 55, 100, 250)
+
+request_queries = metrics.histogram(
+    'http_request_db_queries',
+    'Consultas SQL por requisição, por endpoint',
+    buckets=QUERY_COUNT_BUCKETS
+)
+request_db_seconds = metrics.histogram(
+    'http_request_db_seconds',
+    'Tempo de banco (execução das consultas) por requisição, por endpoint'
+)
+
+# Máximo de consultas por endpoint (GET com o usuário de desenvolvimento, dados vazios).
+# Subir um valor aqui é decisão de revisão: a suíte (tests/test_query_budgets.py) e
+# `flask queries check` falham acima dele.
+QUERY_BUDGETS = {
+    '/v1/user/info': 4,
+    '/v1/user/usage': 2,
+    '/v1/user/alerts': 2,
+    '/v1/admin/users': 2,
+    '/v1/admin/stats': 1,
+    '/v1/admin/overview': 2,
+    '/v1/admin/users/near-limit': 1,
+    '/v1/admin/usage/timeseries': 1,
+}
+
+_local = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+
+
+class QueryCounter:
+    """Consultas executadas (e tempo de banco) enquanto o contador está ativo"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.statements: List[Tuple[str, float]] = []
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.statements.append((statement, seconds))
+
+    def describe(self) -> str:
+        """Lista numerada das consultas (mensagem de falha de orçamento)"""
+        return '\n'.join(
+            f"  {i}. [{seconds * 1000:.2f}ms] {' '.join(statement.split())[:200]}"
+            for i, (statement, seconds) in enumerate(self.statements, 1)
+        )
+
+
+def _active_counters() -> List[QueryCounter]:
+    counters = getattr(_local, 'counters', None)
+    if counters is None:
+        counters = _local.counters = []
+    return counters
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_accounting_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_accounting_start')
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    for counter in getattr(_local, 'counters', ()):
+        counter.record(statement, elapsed)
+
+
+def install():
+    """Registra os eventos de cursor (uma vez por processo, em todas as engines)"""
+    global _installed
+    with _install_lock:
+        if not _installed:
+            event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+            _installed = True
+
+
+def start_counter() -> QueryCounter:
+    """Começa a contar as consultas da thread atual (encerrar com stop_counter)"""
+    install()
+    counter = QueryCounter()
+    _active_counters().append(counter)
+    return counter
+
+
+def stop_counter(counter: QueryCounter) -> QueryCounter:
+    """Para de contar (idempotente) e devolve o contador"""
+    counters = _active_counters()
+    if counter in counters:
+        counters.remove(counter)
+    return counter
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCounter]:
+    """Conta as consultas executadas pela thread atual dentro do bloco"""
+    counter = start_counter()
+    try:
+        yield counter
+    finally:
+        stop_counter(counter)
+
+
+@contextmanager
+def assert_max_queries(max_queries: int, label: str = 'Bloco') -> Iterator[QueryCounter]:
+    """Helper de teste: AssertionError se o bloco executar mais de `max_queries` consultas"""
+    with count_queries() as counter:
+        yield counter
+    if counter.count > max_queries:
+        raise AssertionError(
+            f"{label} executou {counter.count} consultas (máximo {max_queries}):\n{counter.describe()}"
+        )
+
+
+def check_query_budgets(app, budgets=None) -> List[Tuple[str, int, int, int]]:
+    """Executa cada endpoint do orçamento no test client: (path, status, consultas, máximo)"""
+    budgets = QUERY_BUDGETS if budgets is None else budgets
+    client = app.test_client()
+    # Primeira requisição cria o usuário de desenvolvimento (fora da contagem)
+    client.get('/v1/user/info')
+
+    results = []
+    for path, max_queries in budgets.items():
+        with count_queries() as counter:
+            response = client.get(path)
+        results.append((path, response.status_code, counter.count, max_queries))
+    return results
+
+
+class QueryAccounting:
+    """Middleware: contador por requisição, métricas por endpoint e headers de debug"""
+
+    def __init__(self):
+        self.headers = os.getenv('QUERY_HEADERS', 'false').lower() == 'true'
+        self.warn_threshold = int(os.getenv('DB_QUERY_WARN_THRESHOLD', '0'))
+
+    def init_app(self, app):
+        install()
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+    def _before_request(self):
+        g.query_counter = start_counter()
+
+    def _after_request(self, response):
+        counter = g.pop('query_counter', None)
+        if counter is None:
+            return response
+        stop_counter(counter)
+
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        request_queries.observe(counter.count, endpoint=endpoint)
+        request_db_seconds.observe(counter.seconds, endpoint=endpoint)
+
+        if self.headers or current_app.debug:
+            response.headers['X-DB-Queries'] = str(counter.count)
+            response.headers['X-DB-Time-Ms'] = f"{counter.seconds * 1000:.2f}"
+        if self.warn_threshold and counter.count > self.warn_threshold:
+            logger.warning(f"{request.method} {endpoint} executou {counter.count} consultas "
+                           f"({counter.seconds * 1000:.1f}ms de banco)")
+        return response
+
+    def _teardown_request(self, exception):
+        # Exceção antes do after_request: descarta o contador da thread
+        counter = g.pop('query_counter', None)
+        if counter is not None:
+            stop_counter(counter)
+
+
+query_accounting = QueryAccounting()
+
+
+def init_query_accounting(app):
+    """Ativa a contagem de consultas por requisição"""
+    query_accounting.init_app(app)
@@ -0,0 +1,205 @@
+import os
+import time
+import atexit
+import smtplib
+import logging
+import threading
+from email.message import Message
+from typing import Dict, List, Optional, Tuple
+from src.services.metrics_service import metrics
+
+logger = logging.getLogger(__name__)
+
+smtp_connections_opened = metrics.counter(
+    'smtp_connections_opened_total',
+    'Sessões SMTP abertas (connect + STARTTLS + login)'
+)
+smtp_messages = metrics.counter(
+    'smtp_messages_total',
+    'Mensagens entregues ao servidor SMTP, por resultado'
+)
+
+
+def _is_session_error(error: Exception) -> bool:
+    """Erro da sessão (conexão caiu/expirou): vale reconectar e reenviar a mensagem"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        # 421: servidor encerrando a sessão (inatividade, limite de mensagens)
+        return error.smtp_code == 421 or isinstance(error, smtplib.SMTPConnectError)
+    if isinstance(error, smtplib.SMTPException):
+        return isinstance(error, smtplib.SMTPServerDisconnected)
+    return isinstance(error, OSError)
+
+
+class _PooledConnection:
+    """Sessão SMTP autenticada e seus contadores"""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+
+
+class SMTPConnectionPool:
+    """Sessões SMTP reaproveitadas entre envios (connect, STARTTLS e login uma vez por sessão)"""
+
+    def __init__(self, host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                 starttls: bool = True, size: int = 2, idle_seconds: float = 60.0,
+                 max_messages: int = 100, timeout: float = 30.0):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.size = size
+        self.idle_seconds = idle_seconds
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        """Estado vazio (também no filho após fork: as sessões do pai não são reutilizadas)"""
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.size)
+
+    def send_many(self, messages: List[Message]) -> List[bool]:
+        """Envia as mensagens em sequência na mesma sessão; reconecta uma vez se ela cair
+
+        Sem sessão (servidor fora do ar, pool esgotado) o restante do lote falha
+        de uma vez: reconectar a cada mensagem prenderia a thread de envio por
+        até `timeout` segundos por mensagem.
+        """
+        results = []
+        connection = None
+        try:
+            for index, message in enumerate(messages):
+                for attempt in (1, 2):
+                    if connection is None:
+                        try:
+                            connection = self._acquire()
+                        except Exception as e:
+                            remaining = len(messages) - index
+                            logger.error(f"Sem sessão SMTP, {remaining} email(s) do lote não enviados: {str(e)}")
+                            smtp_messages.inc(remaining, result='failed')
+                            return results + [False] * remaining
+                    try:
+                        connection.server.send_message(message)
+                        connection.sent += 1
+                        smtp_messages.inc(result='sent')
+                        results.append(True)
+                        break
+                    except Exception as e:
+                        if _is_session_error(e):
+                            self._discard(connection)
+                            connection = None
+                            if attempt == 1:
+                                logger.warning(f"Sessão SMTP perdida, reconectando: {str(e)}")
+                                continue
+                        logger.error(f"Erro ao enviar email para {message['To']}: {str(e)}")
+                        smtp_messages.inc(result='failed')
+                        results.append(False)
+                        break
+
+                if connection is not None and connection.sent >= self.max_messages:
+                    # Provedores limitam mensagens por sessão: abre outra para o restante
+                    self._release(connection)
+                    connection = None
+        finally:
+            if connection is not None:
+                self._release(connection)
+
+        return results
+
+    def close_all(self):
+        """Encerra as sessões ociosas (QUIT)"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for connection in idle:
+            connection.close()
+
+    def _acquire(self) -> _PooledConnection:
+        """Sessão ociosa mais recente ainda válida, ou uma nova"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise smtplib.SMTPException(f"Nenhuma sessão SMTP livre em {self.timeout}s (SMTP_POOL_SIZE={self.size})")
+
+        try:
+            while True:
+                with self._lock:
+                    connection = self._idle.pop() if self._idle else None
+                if connection is None:
+                    return self._open()
+                if time.monotonic() - connection.last_used < self.idle_seconds:
+                    return connection
+                # Servidores derrubam sessões ociosas: descarta em vez de arriscar um envio
+                connection.close()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, connection: _PooledConnection):
+        """Devolve a sessão ao pool (ou encerra, se já atingiu o limite de mensagens)"""
+        if connection.sent >= self.max_messages:
+            connection.close()
+        else:
+            connection.last_used = time.monotonic()
+            with self._lock:
+                self._idle.append(connection)
+        self._slots.release()
+
+    def _discard(self, connection: _PooledConnection):
+        """Descarta uma sessão quebrada"""
+        connection.server.close()
+        self._slots.release()
+
+    def _open(self) -> _PooledConnection:
+        """Abre e autentica uma sessão"""
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            # Sem fallback para texto puro: servidor sem STARTTLS (ou EHLO adulterado) falha aqui
+            if self.starttls:
+                server.starttls()
+                server.ehlo()
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+
+        smtp_connections_opened.inc(server=self.host)
+        return _PooledConnection(server)
+
+
+# Um pool por servidor/credencial, compartilhado pelas instâncias de EmailService do processo
+_pools: Dict[Tuple, SMTPConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str, port: int, username: Optional[str] = None, password: Optional[str] = None,
+                  starttls: bool = True, **options) -> SMTPConnectionPool:
+    """Obtém (ou cria) o pool do servidor informado"""
+    key = (host, port, username, password, starttls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = SMTPConnectionPool(host, port, username, password, starttls, **options)
+        return pool
+
+
+def close_smtp_pools():
+    """Encerra as sessões de todos os pools (fim do processo)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_all()
+
+
+atexit.register(close_smtp_pools)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=lambda: [pool._reset() for pool in list(_pools.values())])
@@ -0,0 +1,172 @@
+"""Servidor SMTP local que aceita tudo e guarda as mensagens em memória
+
+Para testes e desenvolvimento: aponte SMTP_SERVER/SMTP_PORT para ele e defina
+SMTP_STARTTLS=false e SMTP_ALLOW_ANONYMOUS=true (ou use qualquer usuário/senha:
+o AUTH é aceito sem verificação).
+
+Uso:
+    python -m src.services.smtp_sink --port 1025
+"""
+import time
+import email
+import socket
+import logging
+import argparse
+import threading
+import socketserver
+from email.message import Message
+from email.policy import default as default_policy
+from typing import List
+
+logger = logging.getLogger(__name__)
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Uma sessão SMTP (subconjunto usado pelo smtplib: EHLO, AUTH, MAIL, RCPT, DATA)"""
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        sink = self.server.sink
+        with sink._lock:
+            sink.connections += 1
+            sink._sessions.add(self.connection)
+        try:
+            self._serve(sink)
+        except OSError:
+            # Sessão derrubada por stop() ou pelo cliente
+            pass
+        finally:
+            with sink._lock:
+                sink._sessions.discard(self.connection)
+
+    def _serve(self, sink: 'SMTPSink'):
+        if sink.handshake_delay:
+            # Simula a latência de rede/TLS/login de um provedor real
+            time.sleep(sink.handshake_delay)
+        self.reply('220 smtp-sink pronto')
+
+        sender, recipients = None, []
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            line = raw.decode('utf-8', 'replace').rstrip('\r\n')
+            command = line[:4].upper()
+
+            if command == 'EHLO':
+                self.wfile.write(b"250-smtp-sink\r\n250-8BITMIME\r\n250-SMTPUTF8\r\n250 AUTH PLAIN LOGIN\r\n")
+            elif command == 'HELO':
+                self.reply('250 smtp-sink')
+            elif command == 'AUTH':
+                if line.upper().startswith('AUTH LOGIN'):
+                    if len(line.split()) == 2:
+                        self.reply('334 VXNlcm5hbWU6')
+                        self.rfile.readline()
+                    self.reply('334 UGFzc3dvcmQ6')
+                    self.rfile.readline()
+                self.reply('235 autenticado')
+            elif command == 'MAIL':
+                sender, recipients = line.split(':', 1)[1].strip(), []
+                self.reply('250 OK')
+            elif command == 'RCPT':
+                recipients.append(line.split(':', 1)[1].strip())
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 termine com <CRLF>.<CRLF>')
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if not data or data in (b'.\r\n', b'.\n'):
+                        break
+                    # Remove o ponto extra das linhas iniciadas por ponto (dot-stuffing)
+                    lines.append(data[1:] if data.startswith(b'..') else data)
+                message = email.message_from_bytes(b''.join(lines), policy=default_policy)
+                sink._store(message, sender, recipients)
+                sender, recipients = None, []
+                self.reply('250 OK: mensagem recebida')
+            elif command in ('RSET', 'NOOP'):
+                sender, recipients = None, []
+                self.reply('250 OK')
+            elif command == 'QUIT':
+                self.reply('221 até logo')
+                return
+            else:
+                self.reply('502 comando não suportado')
+
+
+class _ThreadingServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """Servidor SMTP em thread: `with SMTPSink() as sink:` e confira `sink.messages`"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, handshake_delay: float = 0.0, echo: bool = False):
+        self.handshake_delay = handshake_delay
+        self.echo = echo
+        self.messages: List[Message] = []
+        self.connections = 0
+        self._sessions = set()
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer((host, port), _SMTPHandler)
+        self._server.sink = self
+        self._thread = None
+
+    @property
+    def host(self) -> str:
+        return self._server.server_address[0]
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> 'SMTPSink':
+        self._thread = threading.Thread(target=self._server.serve_forever, name='smtp-sink', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Para o servidor e derruba as sessões abertas (como um servidor reiniciando)"""
+        self._server.shutdown()
+        self._server.server_close()
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            try:
+                session.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self) -> 'SMTPSink':
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _store(self, message: Message, sender: str, recipients: List[str]):
+        with self._lock:
+            self.messages.append(message)
+        if self.echo:
+            logger.info(f"Email recebido de {sender} para {', '.join(recipients)}: {message['Subject']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=1025)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sink = SMTPSink(args.host, args.port, echo=True)
+    logger.info(f"SMTP sink em {sink.host}:{sink.port}")
+    try:
+        sink._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
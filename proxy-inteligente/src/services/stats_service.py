@@ -0,0 +1,362 @@
+import os
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Sequence
+from sqlalchemy import func, select, literal_column, text, bindparam, delete, union_all
+from src.models.token_control import db, UserAccount, TokenTransaction, UserUsageHourly, USAGE_RATIO
+from src.models.database import ledger_write_lock, use_primary
+from src.models.serializers import select_users, user_row
+from src.services.cache_service import get_or_compute
+
+logger = logging.getLogger(__name__)
+
+OVERVIEW_CACHE_KEY = 'ia_solaris:admin_overview'
+TOP_CONSUMERS_CACHE_KEY = 'ia_solaris:admin_top_consumers'
+
+# Granularidades da série temporal de uso
+TIMESERIES_BUCKETS = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+# Lançamentos que não são consumo (créditos e ajustes de plano)
+NON_USAGE_MODELS = ('credit', 'plan_reset')
+
+# Hora de created_at no formato de cada banco (SQLite guarda DateTime como texto com microssegundos)
+HOUR_SQL = {
+    'postgresql': "date_trunc('hour', created_at)",
+    'sqlite': "strftime('%Y-%m-%d %H:00:00.000000', created_at)",
+}
+
+# Recalcula as horas a partir de :since com os valores do extrato (idempotente)
+ROLLUP_SQL = (
+    "INSERT INTO user_usage_hourly (bucket_start, user_account_id, tokens, requests, cost_usd) "
+    "SELECT {hour}, user_account_id, sum(tokens_used), count(*), coalesce(sum(cost_usd), 0) "
+    "FROM token_transactions "
+    "WHERE created_at >= :since AND tokens_used > 0 AND coalesce(model_used, '') NOT IN :non_usage "
+    "GROUP BY {hour}, user_account_id "
+    "ON CONFLICT (bucket_start, user_account_id) DO UPDATE SET "
+    "tokens = excluded.tokens, requests = excluded.requests, cost_usd = excluded.cost_usd"
+)
+
+
+def downsample_lttb(points: Sequence[Dict[str, Any]], threshold: int, key: str = 'tokens') -> List[Dict[str, Any]]:
+    """Largest-Triangle-Three-Buckets: reduz a série a threshold pontos preservando a forma"""
+    size = len(points)
+    if threshold >= size or threshold < 3:
+        return list(points)
+
+    xs = [point['timestamp'].timestamp() for point in points]
+    ys = [point[key] for point in points]
+    every = (size - 2) / (threshold - 2)
+
+    sampled = [points[0]]
+    a = 0
+    for i in range(threshold - 2):
+        # Média do próximo balde (terceiro vértice do triângulo)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, size)
+        avg_x = sum(xs[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(ys[next_start:next_end]) / (next_end - next_start)
+
+        # Ponto do balde atual com o maior triângulo (a, ponto, média seguinte)
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+
+        sampled.append(points[best])
+        a = best
+
+    sampled.append(points[-1])
+    return sampled
+
+
+class StatsService:
+    """Estatísticas agregadas do painel administrativo"""
+
+    def __init__(self):
+        self.overview_ttl = float(os.getenv('ADMIN_OVERVIEW_TTL_SECONDS', '5'))
+        self.recent_users_limit = int(os.getenv('ADMIN_OVERVIEW_RECENT_USERS', '5'))
+        self.timeseries_max_buckets = int(os.getenv('ADMIN_TIMESERIES_MAX_BUCKETS', '2400'))
+        self.timeseries_default_points = int(os.getenv('ADMIN_TIMESERIES_POINTS', '200'))
+        self.top_consumers_ttl = float(os.getenv('ADMIN_TOP_CONSUMERS_TTL_SECONDS', '30'))
+        self.rollup_retention_hours = int(os.getenv('USAGE_ROLLUP_RETENTION_HOURS', '744'))
+
+    def get_system_stats(self) -> Dict[str, Any]:
+        """Contagens de usuários, somas de tokens e transações do dia em uma única consulta"""
+        today_start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+        # Intervalo em created_at: usa índice e só a partição do mês
+        transactions_today = select(func.count()).select_from(TokenTransaction).where(
+            TokenTransaction.created_at >= today_start,
+            TokenTransaction.created_at < today_start + timedelta(days=1)
+        ).scalar_subquery()
+
+        row = db.session.execute(
+            select(
+                func.count().label('total'),
+                func.count().filter(UserAccount.is_active.is_(True)).label('active'),
+                func.count().filter(UserAccount.is_blocked.is_(True)).label('blocked'),
+                func.coalesce(func.sum(UserAccount.total_tokens), 0).label('total_distributed'),
+                func.coalesce(func.sum(UserAccount.used_tokens), 0).label('total_used'),
+                transactions_today.label('transactions_today')
+            ).select_from(UserAccount)
+        ).one()
+
+        return {
+            'users': {
+                'total': row.total,
+                'active': row.active,
+                'blocked': row.blocked
+            },
+            'tokens': {
+                'total_distributed': row.total_distributed,
+                'total_used': row.total_used,
+                'total_remaining': row.total_distributed - row.total_used
+            },
+            'activity': {
+                'transactions_today': row.transactions_today
+            },
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+    def compute_overview(self) -> Dict[str, Any]:
+        """Tudo o que a página inicial do painel precisa (duas consultas)"""
+        overview = self.get_system_stats()
+
+        recent_users = db.session.execute(select_users().order_by(
+            UserAccount.created_at.desc()
+        ).limit(self.recent_users_limit))
+        overview['recent_users'] = [user_row(row) for row in recent_users]
+
+        return overview
+
+    def get_overview(self) -> Dict[str, Any]:
+        """Resumo do painel com cache curto compartilhado (um cálculo por TTL)"""
+        return get_or_compute(OVERVIEW_CACHE_KEY, self.overview_ttl, self.compute_overview)
+
+    def choose_bucket(self, start: datetime, end: datetime, bucket: Optional[str] = None) -> str:
+        """Granularidade da série: a pedida (se couber no limite) ou a mais fina que cabe"""
+        if bucket is not None:
+            if bucket not in TIMESERIES_BUCKETS:
+                raise ValueError(f"Granularidade inválida: {bucket}")
+            if (end - start) / TIMESERIES_BUCKETS[bucket] > self.timeseries_max_buckets:
+                raise ValueError(f"Intervalo longo demais para granularidade {bucket}")
+            return bucket
+
+        for name, width in TIMESERIES_BUCKETS.items():
+            if (end - start) / width <= self.timeseries_max_buckets:
+                return name
+        raise ValueError("Intervalo longo demais para a série temporal")
+
+    def _bucket_expression(self, bucket: str):
+        """Início do balde de created_at no dialeto do banco"""
+        if db.engine.dialect.name == 'postgresql':
+            return func.date_trunc(literal_column(f"'{bucket}'"), TokenTransaction.created_at)
+        pattern = '%Y-%m-%d %H:00:00' if bucket == 'hour' else '%Y-%m-%d 00:00:00'
+        return func.strftime(pattern, TokenTransaction.created_at)
+
+    def get_usage_timeseries(self, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                             bucket: Optional[str] = None, model: Optional[str] = None,
+                             points: Optional[int] = None) -> Dict[str, Any]:
+        """Tokens, custo e requisições por modelo e balde de tempo, reduzidos a `points` pontos"""
+        # Datas com fuso viram UTC ingênuo, como created_at
+        end = self._naive_utc(end) or datetime.utcnow()
+        start = self._naive_utc(start) or end - timedelta(days=7)
+        if start >= end:
+            raise ValueError("Data inicial deve ser anterior à final")
+        bucket = self.choose_bucket(start, end, bucket)
+        width = TIMESERIES_BUCKETS[bucket]
+        points = points or self.timeseries_default_points
+
+        # Uma consulta agrupada: no máximo (baldes x modelos) linhas, só as partições do intervalo
+        bucket_column = self._bucket_expression(bucket).label('bucket')
+        query = select(
+            bucket_column,
+            TokenTransaction.model_used,
+            func.sum(TokenTransaction.tokens_used).label('tokens'),
+            func.coalesce(func.sum(TokenTransaction.cost_usd), 0).label('cost_usd'),
+            func.count().label('requests')
+        ).where(
+            TokenTransaction.created_at >= start,
+            TokenTransaction.created_at < end,
+            TokenTransaction.tokens_used > 0,
+            func.coalesce(TokenTransaction.model_used, '').notin_(NON_USAGE_MODELS)
+        ).group_by(bucket_column, TokenTransaction.model_used)
+        if model:
+            query = query.where(TokenTransaction.model_used == model)
+
+        # Grade completa de baldes (zeros onde não houve uso) para a redução não distorcer a forma
+        first = self._truncate(start, bucket)
+        grid = []
+        moment = first
+        while moment < end:
+            grid.append(moment)
+            moment += width
+
+        def empty_series():
+            return {moment: {'timestamp': moment, 'tokens': 0, 'cost_usd': 0.0, 'requests': 0} for moment in grid}
+
+        total = empty_series()
+        by_model: Dict[str, Dict[datetime, Dict[str, Any]]] = {}
+        for row in db.session.execute(query):
+            moment = row.bucket if isinstance(row.bucket, datetime) else datetime.fromisoformat(row.bucket)
+            name = row.model_used or 'unknown'
+            if name not in by_model:
+                by_model[name] = empty_series()
+            series = by_model[name]
+            for target in (series[moment], total[moment]):
+                target['tokens'] += int(row.tokens)
+                target['cost_usd'] += float(row.cost_usd)
+                target['requests'] += row.requests
+
+        def summarize(series):
+            values = list(series.values())
+            return {
+                'totals': {
+                    'tokens': sum(point['tokens'] for point in values),
+                    'cost_usd': round(sum(point['cost_usd'] for point in values), 6),
+                    'requests': sum(point['requests'] for point in values)
+                },
+                'points': [
+                    dict(point, timestamp=point['timestamp'].isoformat(), cost_usd=round(point['cost_usd'], 6))
+                    for point in downsample_lttb(values, points)
+                ]
+            }
+
+        models = [dict(summarize(series), model=name) for name, series in by_model.items()]
+        models.sort(key=lambda item: item['totals']['tokens'], reverse=True)
+
+        return {
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'bucket': bucket,
+            'buckets': len(grid),
+            'total': summarize(total),
+            'models': models
+        }
+
+    def refresh_usage_rollups(self) -> Dict[str, Any]:
+        """Atualiza user_usage_hourly: recalcula da última hora agregada (menos uma) até agora"""
+        now = datetime.utcnow()
+        with use_primary():
+            latest = db.session.execute(select(func.max(UserUsageHourly.bucket_start))).scalar()
+        horizon = self._truncate(now, 'hour') - timedelta(hours=self.rollup_retention_hours)
+        # Refaz também a hora anterior: pega transações que commitaram depois da virada
+        since = max(latest - timedelta(hours=1), horizon) if latest else horizon
+
+        statement = text(ROLLUP_SQL.format(hour=HOUR_SQL.get(db.engine.dialect.name, HOUR_SQL['sqlite']))).bindparams(
+            bindparam('non_usage', expanding=True)
+        )
+        with ledger_write_lock():
+            result = db.session.execute(statement, {'since': since, 'non_usage': list(NON_USAGE_MODELS)})
+            pruned = db.session.execute(delete(UserUsageHourly).where(UserUsageHourly.bucket_start < horizon))
+            db.session.commit()
+
+        return {'since': since.isoformat(), 'buckets': result.rowcount, 'pruned': pruned.rowcount}
+
+    def compute_top_consumers(self, hours: int, limit: int) -> List[Dict[str, Any]]:
+        """Maiores consumidores nas últimas `hours` horas, sem escrever no banco
+
+        Soma o rollup até a última hora agregada (que pode estar incompleta) e
+        calcula do extrato o restante; o rollup em si é do job `stats rollup`.
+        """
+        since = self._truncate(datetime.utcnow(), 'hour') - timedelta(hours=hours - 1)
+        latest = db.session.execute(select(func.max(UserUsageHourly.bucket_start))).scalar()
+        live_since = max(latest, since) if latest else since
+
+        rolled_up = select(
+            UserUsageHourly.user_account_id,
+            UserUsageHourly.tokens,
+            UserUsageHourly.requests,
+            UserUsageHourly.cost_usd
+        ).where(UserUsageHourly.bucket_start >= since, UserUsageHourly.bucket_start < live_since)
+        live = select(
+            TokenTransaction.user_account_id,
+            func.sum(TokenTransaction.tokens_used),
+            func.count(),
+            func.coalesce(func.sum(TokenTransaction.cost_usd), 0)
+        ).where(
+            TokenTransaction.created_at >= live_since,
+            TokenTransaction.tokens_used > 0,
+            func.coalesce(TokenTransaction.model_used, '').not_in(NON_USAGE_MODELS)
+        ).group_by(TokenTransaction.user_account_id)
+        usage = union_all(rolled_up, live).subquery()
+
+        window = select(
+            usage.c.user_account_id,
+            func.sum(usage.c.tokens).label('tokens'),
+            func.sum(usage.c.requests).label('requests'),
+            func.sum(usage.c.cost_usd).label('cost_usd')
+        ).group_by(usage.c.user_account_id).order_by(
+            func.sum(usage.c.tokens).desc()
+        ).limit(limit).subquery()
+
+        rows = db.session.execute(
+            select_users(window.c.tokens, window.c.requests, window.c.cost_usd)
+            .join(window, window.c.user_account_id == UserAccount.id)
+            .order_by(window.c.tokens.desc())
+        ).all()
+
+        return [
+            dict(user_row(row), window={
+                'tokens': int(row.tokens),
+                'requests': int(row.requests),
+                'cost_usd': float(row.cost_usd or 0),
+                'tokens_per_hour': round(int(row.tokens) / hours, 1)
+            })
+            for row in rows
+        ]
+
+    def get_top_consumers(self, hours: int = 24, limit: int = 10) -> Dict[str, Any]:
+        """Ranking com cache curto compartilhado (um recálculo do rollup por TTL)"""
+        key = f"{TOP_CONSUMERS_CACHE_KEY}:{hours}:{limit}"
+        users = get_or_compute(key, self.top_consumers_ttl, lambda: self.compute_top_consumers(hours, limit))
+        return {'hours': hours, 'limit': limit, 'users': users}
+
+    def get_near_limit(self, threshold: float = 95.0, limit: int = 50, include_blocked: bool = False) -> Dict[str, Any]:
+        """Usuários com usage_percentage >= threshold, mais próximos do limite primeiro
+
+        Varre só o trecho do índice ix_user_accounts_usage_ratio acima do limiar.
+        """
+        query = select_users().where(USAGE_RATIO >= threshold / 100)
+        if not include_blocked:
+            query = query.where(UserAccount.is_blocked.is_(False))
+        users = db.session.execute(query.order_by(USAGE_RATIO.desc()).limit(limit)).all()
+
+        # Ritmo das últimas 24h (rollup) para estimar quando cada um esgota a cota
+        since = self._truncate(datetime.utcnow(), 'hour') - timedelta(hours=23)
+        burn = dict(db.session.execute(
+            select(UserUsageHourly.user_account_id, func.sum(UserUsageHourly.tokens))
+            .where(UserUsageHourly.bucket_start >= since,
+                   UserUsageHourly.user_account_id.in_([user.id for user in users]))
+            .group_by(UserUsageHourly.user_account_id)
+        ).all()) if users else {}
+
+        results = []
+        for user in users:
+            per_hour = int(burn.get(user.id) or 0) / 24
+            results.append(dict(
+                user_row(user),
+                tokens_per_hour=round(per_hour, 1),
+                hours_to_limit=round(user.remaining_tokens / per_hour, 1) if per_hour else None
+            ))
+
+        return {'threshold': threshold, 'limit': limit, 'users': results}
+
+    @staticmethod
+    def _naive_utc(moment: Optional[datetime]) -> Optional[datetime]:
+        """Converte datas com fuso para UTC sem fuso"""
+        if moment is not None and moment.tzinfo is not None:
+            return moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment
+
+    @staticmethod
+    def _truncate(moment: datetime, bucket: str) -> datetime:
+        """Início do balde que contém o instante"""
+        moment = moment.replace(minute=0, second=0, microsecond=0)
+        return moment.replace(hour=0) if bucket == 'day' else moment
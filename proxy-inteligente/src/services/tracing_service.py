@@ -0,0 +1,351 @@
+"""Tracing distribuído no formato do OpenTelemetry, sem coletor
+
+Cada requisição /v1 vira um span raiz (kind=server) que continua o trace do
+header `traceparent` (W3C Trace Context) quando o LibreChat o envia. Dentro
+dele ficam os spans das etapas (require_user, estimativa, limites, chamada ao
+LiteLLM e fallback OpenAI, liquidação no ledger, emails), cada um com o número
+de consultas SQL e o tempo de banco executados durante o span
+(query_accounting). As chamadas ao LiteLLM/OpenAI levam o `traceparent` do
+span cliente, então o trace continua no upstream.
+
+Exportadores (TRACE_EXPORTER):
+  none    desligado (padrão): spans não são criados
+  memory  buffer circular em memória (TRACE_BUFFER_SIZE), lido em /v1/admin/traces
+  file    um span por linha (NDJSON) em TRACE_FILE, gravado por uma thread
+TRACE_SAMPLE_RATE escolhe a fração de traces novos; traces que chegam com
+`traceparent` seguem a decisão de amostragem de quem chamou.
+"""
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import secrets
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from flask import g, request
+from src.services.metrics_service import metrics
+from src.services.query_accounting import QueryCounter, start_counter, stop_counter
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = 'traceparent'
+TRACE_ID_HEADER = 'X-Trace-Id'
+
+_TRACEPARENT_RE = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+spans_exported = metrics.counter('trace_spans_exported_total', 'Spans exportados por exportador')
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """(trace_id, span_id do pai, amostrado) de um header traceparent válido"""
+    match = _TRACEPARENT_RE.match((value or '').strip().lower())
+    if not match:
+        return None
+    version, trace_id, span_id, flags = match.groups()
+    if version == 'ff' or trace_id == '0' * 32 or span_id == '0' * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+class Span:
+    """Operação com início, fim, atributos e status (campos do OTLP)"""
+
+    __slots__ = ('name', 'kind', 'trace_id', 'span_id', 'parent_id', 'sampled', 'attributes',
+                 'status', 'status_message', 'start_ns', 'end_ns', '_started', 'queries')
+
+    def __init__(self, name: str, kind: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.status = 'unset'
+        self.status_message = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._started = time.perf_counter()
+        self.queries: Optional[QueryCounter] = start_counter() if sampled else None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_error(self, message: str):
+        self.status = 'error'
+        self.status_message = message
+
+    def record_exception(self, exc: BaseException):
+        self.attributes['exception.type'] = type(exc).__name__
+        self.attributes['exception.message'] = str(exc)[:500]
+        self.set_error(type(exc).__name__)
+
+    def end(self):
+        if self.end_ns is not None:
+            return
+        self.end_ns = self.start_ns + int((time.perf_counter() - self._started) * 1e9)
+        if self.queries is not None:
+            stop_counter(self.queries)
+            if self.queries.count:
+                self.attributes['db.queries'] = self.queries.count
+                self.attributes['db.time_ms'] = round(self.queries.seconds * 1000, 2)
+            self.queries = None
+
+    def to_dict(self, resource: Dict[str, Any]) -> Dict[str, Any]:
+        span = {
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_span_id': self.parent_id,
+            'name': self.name,
+            'kind': self.kind,
+            'start_time_unix_nano': self.start_ns,
+            'end_time_unix_nano': self.end_ns,
+            'duration_ms': round((self.end_ns - self.start_ns) / 1e6, 3),
+            'attributes': self.attributes,
+            'status': {'code': self.status},
+            'resource': resource
+        }
+        if self.status_message:
+            span['status']['message'] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """Span descartado (tracing desligado): aceita as mesmas chamadas e não grava nada"""
+
+    traceparent = None
+    trace_id = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_error(self, message: str):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class InMemorySpanExporter:
+    """Últimos N spans em memória (por processo)"""
+
+    name = 'memory'
+
+    def __init__(self, max_spans: int):
+        self._spans = deque(maxlen=max_spans)
+        self._lock = threading.Lock()
+
+    def export(self, span: Dict[str, Any]):
+        with self._lock:
+            self._spans.append(span)
+
+    def get_finished_spans(self, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            spans = list(self._spans)
+        if trace_id:
+            spans = [span for span in spans if span['trace_id'] == trace_id]
+        return spans
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def shutdown(self):
+        pass
+
+
+class FileSpanExporter:
+    """Spans em NDJSON num arquivo local; a escrita fica numa thread fora da requisição"""
+
+    name = 'file'
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def export(self, span: Dict[str, Any]):
+        self._queue.put(span)
+        # Após fork (gunicorn --preload) a thread do master não existe no worker
+        if self._thread is None or self._pid != os.getpid():
+            with self._lock:
+                if self._thread is None or self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self._run, name='trace-file-exporter', daemon=True)
+                    self._thread.start()
+
+    def _drain(self, first: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        spans = [first] if first is not None else []
+        while len(spans) < 1000:
+            try:
+                spans.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return spans
+
+    def _write(self, spans: List[Dict[str, Any]]):
+        if not spans:
+            return
+        try:
+            with self._lock, open(self.path, 'a', encoding='utf-8') as handle:
+                handle.write(''.join(json.dumps(span, separators=(',', ':'), default=str) + '\n' for span in spans))
+        except OSError as e:
+            logger.error(f"Erro ao gravar {len(spans)} span(s) em {self.path}: {str(e)}")
+
+    def _run(self):
+        while True:
+            self._write(self._drain(self._queue.get()))
+
+    def shutdown(self):
+        """Grava o que ainda está na fila (saída do processo)"""
+        self._write(self._drain())
+
+
+class Tracer:
+    """Cria os spans, mantém o span atual (contextvars) e propaga o traceparent"""
+
+    def __init__(self):
+        self.sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '1.0'))
+        self.path_prefix = os.getenv('TRACE_PATH_PREFIX', '/v1/')
+        self.resource = {'service.name': os.getenv('TRACE_SERVICE_NAME', 'ia-solaris-proxy')}
+
+        exporter = os.getenv('TRACE_EXPORTER', 'none').lower()
+        if exporter == 'memory':
+            self.exporter = InMemorySpanExporter(int(os.getenv('TRACE_BUFFER_SIZE', '5000')))
+        elif exporter == 'file':
+            self.exporter = FileSpanExporter(os.getenv('TRACE_FILE', 'traces.ndjson'))
+            atexit.register(self.exporter.shutdown)
+        else:
+            self.exporter = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def begin(self, name: str, kind: str = 'internal', attributes: Optional[Dict[str, Any]] = None,
+              parent: Optional[Tuple[str, str, bool]] = None):
+        """Abre um span filho do atual (ou de `parent`) e o torna o atual; fechar com finish()"""
+        current = _current_span.get()
+        if parent is not None:
+            trace_id, parent_id, sampled = parent
+        elif current is not None:
+            trace_id, parent_id, sampled = current.trace_id, current.span_id, current.sampled
+        else:
+            trace_id, parent_id = secrets.token_hex(16), None
+            sampled = self.sample_rate >= 1 or random.random() < self.sample_rate
+        span = Span(name, kind, trace_id, parent_id, sampled, attributes)
+        return span, _current_span.set(span)
+
+    def finish(self, span: Span, token, exception: Optional[BaseException] = None):
+        """Fecha o span, restaura o anterior e exporta se amostrado"""
+        if exception is not None:
+            span.record_exception(exception)
+        try:
+            _current_span.reset(token)
+        except ValueError:
+            # Respostas em streaming fecham fora do contexto em que o span abriu
+            _current_span.set(None)
+        span.end()
+        if span.sampled:
+            self.exporter.export(span.to_dict(self.resource))
+            spans_exported.inc(exporter=self.exporter.name)
+
+    @contextmanager
+    def start_span(self, name: str, kind: str = 'internal', **attributes) -> Iterator[Any]:
+        """Span em volta do bloco; exceções ficam registradas no span e são relançadas"""
+        if self.exporter is None:
+            yield NOOP_SPAN
+            return
+        span, token = self.begin(name, kind, attributes)
+        try:
+            yield span
+        except BaseException as e:
+            self.finish(span, token, e)
+            raise
+        self.finish(span, token)
+
+    def traced(self, name: str, kind: str = 'internal'):
+        """Decorator: a chamada inteira em um span"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.start_span(name, kind):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def inject(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """Cópia dos headers com o traceparent do span atual (chamadas de saída)"""
+        span = _current_span.get()
+        if span is None:
+            return headers
+        return {**headers, TRACEPARENT_HEADER: span.traceparent}
+
+    def init_app(self, app):
+        """Registra o span raiz das requisições (nada é registrado com o tracing desligado)"""
+        if not self.enabled:
+            return
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        target = getattr(self.exporter, 'path', 'memória')
+        logger.info(f"Tracing: exportador={self.exporter.name} ({target}) amostragem={self.sample_rate}")
+
+    def _before_request(self):
+        if not request.path.startswith(self.path_prefix):
+            return
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        span, token = self.begin(
+            f"{request.method} {route}",
+            kind='server',
+            attributes={'http.method': request.method, 'http.route': route, 'http.target': request.path},
+            parent=parse_traceparent(request.headers.get(TRACEPARENT_HEADER))
+        )
+        g.trace_span = (span, token)
+
+    def _after_request(self, response):
+        current = g.get('trace_span')
+        if current is not None:
+            span = current[0]
+            span.set_attribute('http.status_code', response.status_code)
+            if response.status_code >= 500:
+                span.set_error(f"HTTP {response.status_code}")
+            response.headers[TRACE_ID_HEADER] = span.trace_id
+        return response
+
+    def _teardown_request(self, exception):
+        current = g.pop('trace_span', None)
+        if current is not None:
+            self.finish(*current, exception)
+
+
+tracer = Tracer()
+
+
+def init_tracing(app):
+    """Ativa o tracing das requisições se TRACE_EXPORTER for memory ou file"""
+    tracer.init_app(app)
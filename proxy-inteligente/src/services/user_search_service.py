@@ -0,0 +1,119 @@
+import os
+import logging
+from typing import Any, Dict, List, Optional
+from sqlalchemy import case, func, literal, or_, text
+from src.models.token_control import db, UserAccount
+
+logger = logging.getLogger(__name__)
+
+# Filtros de status do painel de usuários
+STATUS_FILTERS = {
+    'all': (),
+    'active': (UserAccount.is_active.is_(True), UserAccount.is_blocked.is_(False)),
+    'blocked': (UserAccount.is_blocked.is_(True),),
+    'inactive': (UserAccount.is_active.is_(False),),
+}
+
+# Abaixo de 3 caracteres não há trigramas: só busca por prefixo
+TRIGRAM_MIN_LENGTH = 3
+
+
+def escape_like(term: str) -> str:
+    """Escapa os curingas do LIKE (%, _ e a própria barra)"""
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class UserSearchService:
+    """Busca de usuários por email/nome: prefixo, substring e similaridade (pg_trgm)"""
+
+    def __init__(self):
+        self.min_length = int(os.getenv('USER_SEARCH_MIN_LENGTH', '2'))
+        self.default_limit = int(os.getenv('USER_SEARCH_LIMIT', '20'))
+        self.max_limit = int(os.getenv('USER_SEARCH_MAX_LIMIT', '100'))
+        self.similarity_threshold = float(os.getenv('USER_SEARCH_SIMILARITY', '0.5'))
+        self._trigram = None
+
+    def search(self, term: str, limit: Optional[int] = None, status: str = 'all') -> List[Dict[str, Any]]:
+        """Usuários ordenados por relevância: prefixo, depois substring; parecidos se nada bater"""
+        term = (term or '').strip()
+        if len(term) < self.min_length:
+            raise ValueError(f"Busca precisa de pelo menos {self.min_length} caracteres")
+        if status not in STATUS_FILTERS:
+            raise ValueError(f"Status inválido: {status}")
+        limit = max(1, min(limit or self.default_limit, self.max_limit))
+
+        trigram = self.trigram_enabled()
+        lowered = term.lower()
+        pattern = escape_like(lowered)
+        email, name = func.lower(UserAccount.email), func.lower(UserAccount.name)
+        # Prefixo: lower(coluna) LIKE 'termo%' (B-tree text_pattern_ops no Postgres)
+        email_prefix = email.like(f"{pattern}%", escape='\\')
+        name_prefix = name.like(f"{pattern}%", escape='\\')
+        tiers = [('prefix', or_(email_prefix, name_prefix), self._ranking(lowered, email_prefix, name_prefix))]
+        if len(term) >= TRIGRAM_MIN_LENGTH or not trigram:
+            # Substring: ILIKE '%termo%' (GIN trigram no Postgres)
+            email_substring = UserAccount.email.ilike(f"%{pattern}%", escape='\\')
+            name_substring = UserAccount.name.ilike(f"%{pattern}%", escape='\\')
+            tiers.append(('substring', or_(email_substring, name_substring),
+                          self._ranking(lowered, email_substring, name_substring, by_position=True)))
+
+        # Faixas em ordem de relevância; cada uma só roda se a anterior não encheu o limite.
+        # A ordem dentro da faixa é do SQL, antes do LIMIT: um email/nome exato nunca fica de fora
+        results = []
+        seen = set()
+        for match, condition, ranking in tiers:
+            if len(results) >= limit:
+                break
+            query = UserAccount.query.filter(condition, *STATUS_FILTERS[status])
+            if seen:
+                query = query.filter(UserAccount.id.notin_(seen))
+            users = query.order_by(*ranking).limit(limit - len(results)).all()
+            results.extend((user, match) for user in users)
+            seen.update(user.id for user in users)
+
+        # Sem nenhum resultado exato, provável erro de digitação: operador <% do pg_trgm
+        # (termo parecido com algum trecho do email/nome), mais parecidos primeiro
+        if trigram and not results and len(term) >= TRIGRAM_MIN_LENGTH:
+            db.session.execute(
+                func.set_config('pg_trgm.word_similarity_threshold', str(self.similarity_threshold), True).select()
+            )
+            score = func.greatest(func.word_similarity(term, UserAccount.email),
+                                  func.word_similarity(term, func.coalesce(UserAccount.name, '')))
+            query = UserAccount.query.filter(
+                or_(literal(term).op('<%')(UserAccount.email), literal(term).op('<%')(UserAccount.name)),
+                *STATUS_FILTERS[status]
+            )
+            users = query.order_by(score.desc(), UserAccount.email).limit(limit).all()
+            results.extend((user, 'similar') for user in users)
+
+        return [dict(user.to_dict(), match=match) for user, match in results]
+
+    def trigram_enabled(self) -> bool:
+        """pg_trgm instalado no banco (verificado uma vez por processo)"""
+        if self._trigram is None:
+            self._trigram = db.engine.dialect.name == 'postgresql' and db.session.execute(
+                text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            ).first() is not None
+            if not self._trigram:
+                logger.info("Busca de usuários sem pg_trgm: apenas LIKE (sem índice trigram nem similaridade)")
+        return self._trigram
+
+    def _ranking(self, term: str, email_matches, name_matches, by_position: bool = False) -> list:
+        """ORDER BY dentro da faixa: igual ao termo, termo mais cedo no texto, texto mais curto, id"""
+        email, name = func.lower(UserAccount.email), func.lower(func.coalesce(UserAccount.name, ''))
+        email_length, name_length = func.length(UserAccount.email), func.length(func.coalesce(UserAccount.name, ''))
+
+        def closest(email_value, name_value):
+            # Menor valor entre as colunas que bateram (LEAST/MIN tratam NULL diferente em cada banco)
+            return case(
+                (email_matches & name_matches, case((email_value <= name_value, email_value), else_=name_value)),
+                (email_matches, email_value),
+                else_=name_value
+            )
+
+        ranking = [or_(email == term, name == term).desc()]
+        if by_position:
+            position = func.strpos if db.engine.dialect.name == 'postgresql' else func.instr
+            ranking.append(closest(position(email, term), position(name, term)))
+        ranking += [closest(email_length, name_length), UserAccount.id]
+        return ranking
@@ -0,0 +1,23 @@
+"""Configuração comum dos testes (python -m pytest, a partir de proxy-inteligente/)"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Banco descartável: src.main lê DATABASE_URL no import
+os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}")
+os.environ.setdefault('LOG_LEVEL', 'ERROR')
+
+
+@pytest.fixture(scope='session')
+def app():
+    """Aplicação com o schema criado no banco descartável"""
+    from src.main import app
+    from src.models.database import initialize_database
+
+    with app.app_context():
+        initialize_database()
+    return app
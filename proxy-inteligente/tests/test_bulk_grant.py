@@ -0,0 +1,82 @@
+"""Concessão de tokens em lote (/v1/admin/tokens/bulk-grant)"""
+import uuid
+
+import pytest
+
+from src.models.token_control import db, UserAccount, TokenTransaction
+from src.routes.proxy_routes import grant_service
+
+
+@pytest.fixture
+def accounts(app):
+    """Três contas novas (ids devolvidos na ordem)"""
+    with app.app_context():
+        created = []
+        for _ in range(3):
+            suffix = uuid.uuid4().hex[:8]
+            account = UserAccount(librechat_user_id=f"lc-{suffix}", email=f"{suffix}@example.com", total_tokens=1000)
+            db.session.add(account)
+            created.append(account)
+        db.session.commit()
+        return [account.id for account in created]
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    """Um lote por linha: cada linha é confirmada antes da próxima ser lida"""
+    monkeypatch.setattr(grant_service.get(), 'chunk_size', 1)
+
+
+def post_csv(app, body):
+    return app.test_client().post('/v1/admin/tokens/bulk-grant?send_emails=false',
+                                  data=body, content_type='text/csv')
+
+
+def credits(app, account_id):
+    with app.app_context():
+        return db.session.query(TokenTransaction).filter_by(user_account_id=account_id, model_used='credit').count()
+
+
+def test_csv_grants_every_row(app, accounts):
+    body = 'user_id,tokens,reason\n' + ''.join(f"{account_id},100,teste\n" for account_id in accounts)
+
+    response = post_csv(app, body.encode())
+
+    assert response.status_code == 200
+    assert response.get_json()['summary']['granted'] == 3
+    with app.app_context():
+        assert db.session.get(UserAccount, accounts[0]).total_tokens == 1100
+
+
+def test_undecodable_row_is_reported_and_the_rest_granted(app, accounts):
+    first, second, third = accounts
+    body = (f"user_id,tokens,reason\n{first},100,ok\n".encode()
+            + f"{second},100,".encode() + b'\xff\xfe\n'
+            + f"{third},100,ok\n".encode())
+
+    response = post_csv(app, body)
+
+    assert response.status_code == 200
+    results = sorted(response.get_json()['results'], key=lambda row: row['line'])
+    assert [(row['line'], row['status']) for row in results] == [(1, 'granted'), (2, 'error'), (3, 'granted')]
+    assert results[1]['error'] == 'invalid_row'
+    assert credits(app, second) == 0
+
+
+def test_unparseable_input_stops_with_partial_report(app, accounts, small_chunks):
+    first, second, third = accounts
+    body = (f"user_id,tokens,reason\n{first},100,ok\n{second},100,ok\n"
+            f"{third},100,{'x' * 200_000}\n"  # Campo acima do limite do módulo csv
+            f"{third},100,ok\n").encode()
+
+    response = post_csv(app, body)
+
+    assert response.status_code == 400
+    data = response.get_json()
+    assert data['error'] == 'unreadable_input'
+    assert data['resume_from_line'] == 3
+    assert [row['status'] for row in data['results']] == ['granted', 'granted', 'error']
+    assert data['summary']['granted'] == 2
+    # Já confirmadas ficam; nada depois da linha ilegível é aplicado
+    assert credits(app, first) == 1 and credits(app, second) == 1
+    assert credits(app, third) == 0
@@ -0,0 +1,235 @@
+"""Limite adaptativo por modelo contra um upstream falso com latência injetada"""
+import json
+import time
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.services.litellm_service import LiteLLMService
+
+MODEL = 'gpt-4o'
+# Configuração do limite e da admissão: cada teste parte dos padrões
+SETTINGS = ('UPSTREAM_ADAPTIVE_LIMIT', 'UPSTREAM_LIMIT_INITIAL', 'UPSTREAM_LIMIT_MIN', 'UPSTREAM_LIMIT_MAX',
+            'UPSTREAM_LIMIT_BACKOFF', 'UPSTREAM_LATENCY_TOLERANCE', 'UPSTREAM_MAX_CONCURRENCY',
+            'GUNICORN_THREADS', 'UPSTREAM_TIMEOUT_SECONDS')
+REQUEST = {'model': MODEL, 'messages': [{'role': 'user', 'content': 'oi'}]}
+
+
+class FakeUpstream:
+    """LiteLLM falso: `respond()` devolve (segundos de espera, tokens de saída) de cada chamada"""
+
+    def __init__(self):
+        self.respond = lambda: (0.01, 10)
+        upstream = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                delay, tokens = upstream.respond()
+                time.sleep(delay)
+                body = json.dumps({
+                    'id': 'test', 'object': 'chat.completion', 'model': MODEL,
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': 'ok'}, 'finish_reason': 'stop'}],
+                    'usage': {'prompt_tokens': 10, 'completion_tokens': tokens, 'total_tokens': 10 + tokens}
+                }).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except OSError:
+                    pass  # Cliente desistiu (timeout)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+
+@pytest.fixture
+def upstream():
+    fake = FakeUpstream()
+    yield fake
+    fake.server.shutdown()
+
+
+@pytest.fixture
+def make_service(upstream, monkeypatch):
+    """LiteLLMService apontado para o upstream falso (sem fallback: sem OPENAI_API_KEY)"""
+    def make(**env):
+        monkeypatch.setenv('LITELLM_BASE_URL', upstream.url)
+        monkeypatch.delenv('OPENAI_API_KEY', raising=False)
+        for name in SETTINGS:
+            monkeypatch.delenv(name, raising=False)
+        for name, value in env.items():
+            monkeypatch.setenv(name, str(value))
+        return LiteLLMService()
+    return make
+
+
+def closed_loop(service, clients, seconds, pause=0.02):
+    """`clients` threads chamando em laço; devolve [(sucesso, resposta, segundos)]"""
+    results = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + seconds
+
+    def client():
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            success, response = service.make_request(REQUEST)
+            with lock:
+                results.append((success, response, time.monotonic() - started))
+            if not success:
+                time.sleep(pause)
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def open_loop(service, rate, seconds, seed=1):
+    """Chegadas de Poisson a `rate`/s, sem esperar as anteriores (tráfego real de usuários)"""
+    rng = random.Random(seed)
+    results = []
+    lock = threading.Lock()
+    threads = []
+
+    def call():
+        success, response = service.make_request(REQUEST)
+        with lock:
+            results.append((success, response))
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        thread = threading.Thread(target=call)
+        thread.start()
+        threads.append(thread)
+        time.sleep(rng.expovariate(rate))
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def shed(results):
+    return [result for result in results if not result[0] and result[1].get('error') == 'upstream_busy']
+
+
+def test_default_limit_is_the_process_capacity(make_service):
+    service = make_service()
+    assert service.concurrency.initial == service.concurrency.maximum == 6  # UPSTREAM_MAX_CONCURRENCY
+
+    service = make_service(UPSTREAM_MAX_CONCURRENCY=0, GUNICORN_THREADS=4, UPSTREAM_LIMIT_INITIAL=20)
+    assert service.concurrency.initial == service.concurrency.maximum == 4
+
+
+def test_slowdown_without_errors_sheds_with_default_settings(upstream, make_service):
+    """Padrões (timeout de 120s): o provedor fica 10x mais lento sem errar nenhuma chamada"""
+    service = make_service()
+    capacity = int(service.concurrency.maximum)
+    limiter = service.concurrency.for_model(MODEL)
+
+    upstream.respond = lambda: (0.02, 50)
+    closed_loop(service, clients=capacity, seconds=0.5)
+    assert limiter.limit == capacity
+
+    upstream.respond = lambda: (0.2, 50)
+    results = closed_loop(service, clients=capacity, seconds=1.5)
+
+    assert limiter.limit < capacity - 1
+    rejected = shed(results)
+    assert rejected, 'nenhuma chamada recusada com o provedor lento'
+    assert max(elapsed for _, _, elapsed in rejected) < 0.05
+    assert all(success for success, response, _ in results if response.get('error') != 'upstream_busy')
+
+
+def test_timeouts_cut_the_limit_and_excess_calls_are_shed_fast(upstream, make_service):
+    service = make_service(UPSTREAM_TIMEOUT_SECONDS=0.2)
+    capacity = int(service.concurrency.maximum)
+    upstream.respond = lambda: (1.0, 10)  # Provedor travado: toda chamada estoura o timeout
+
+    results = closed_loop(service, clients=capacity, seconds=1.5)
+
+    limiter = service.concurrency.for_model(MODEL)
+    assert limiter.limit < capacity
+    rejected = shed(results)
+    assert rejected, 'nenhuma chamada recusada com o limite reduzido'
+    assert max(elapsed for _, _, elapsed in rejected) < 0.05
+    for _, response, _ in rejected:
+        assert isinstance(response['retry_after'], int) and 1 <= response['retry_after'] <= 30
+
+
+def test_limit_recovers_when_upstream_heals(upstream, make_service):
+    service = make_service(UPSTREAM_TIMEOUT_SECONDS=0.2)
+    capacity = int(service.concurrency.maximum)
+    limiter = service.concurrency.for_model(MODEL)
+
+    upstream.respond = lambda: (1.0, 10)
+    closed_loop(service, clients=capacity, seconds=1.0)
+    degraded = limiter.limit
+
+    upstream.respond = lambda: (0.01, 10)
+    results = closed_loop(service, clients=capacity, seconds=1.5)
+
+    assert degraded < capacity / 2
+    assert limiter.limit >= capacity - 1
+    assert sum(1 for success, _, _ in results if success) > 100
+
+
+def test_upstream_5xx_cuts_the_limit(upstream, make_service, monkeypatch):
+    service = make_service()
+    monkeypatch.setattr(service, '_make_litellm_request',
+                        lambda request_data: (False, {'error': 'litellm_error', 'status_code': 503, 'message': 'busy'}))
+
+    closed_loop(service, clients=4, seconds=0.5)
+
+    assert service.concurrency.for_model(MODEL).limit < service.concurrency.maximum
+
+
+@pytest.mark.parametrize('tolerance', [0, 3])
+def test_healthy_upstream_with_mixed_latency_is_not_shed(upstream, make_service, tolerance):
+    """Capacidade de sobra, respostas de 2 a 240 tokens: 30ms fixos + 1ms por token (spread de 9x)"""
+    service = make_service(UPSTREAM_LATENCY_TOLERANCE=tolerance, UPSTREAM_MAX_CONCURRENCY=32, GUNICORN_THREADS=32)
+    rng = random.Random(7)
+    lock = threading.Lock()
+
+    def respond():
+        with lock:
+            tokens = rng.randint(2, 240)
+        return 0.03 + tokens / 1000, tokens
+    upstream.respond = respond
+
+    results = open_loop(service, rate=40, seconds=2.0)
+
+    limiter = service.concurrency.for_model(MODEL)
+    assert len(results) > 40
+    assert not shed(results)
+    assert all(success for success, _ in results)
+    assert limiter.limit >= service.concurrency.initial
+
+
+def test_chat_route_returns_503_with_retry_after_when_shed(app):
+    from src.routes.proxy_routes import proxy_service
+
+    limiter = proxy_service.litellm_service.concurrency.for_model('gpt-4')
+    limiter.limit, limiter.in_flight = 1, 1  # Limite ocupado por outra chamada
+    try:
+        response = app.test_client().post(
+            '/v1/chat/completions',
+            json={'model': 'gpt-4', 'messages': [{'role': 'user', 'content': 'oi'}]},
+            headers={'Authorization': 'Bearer test', 'X-User-ID': 'shed-test'}
+        )
+    finally:
+        limiter.in_flight = 0
+
+    assert response.status_code == 503
+    assert response.get_json()['error'] == 'upstream_busy'
+    assert int(response.headers['Retry-After']) >= 1
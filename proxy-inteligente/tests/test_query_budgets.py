@@ -0,0 +1,28 @@
+"""Orçamento de consultas SQL por endpoint (QUERY_BUDGETS): passar do máximo falha a suíte"""
+import pytest
+
+from src.models.token_control import SystemConfig
+from src.services.query_accounting import QUERY_BUDGETS, assert_max_queries
+
+
+@pytest.fixture(scope='module')
+def client(app):
+    client = app.test_client()
+    # Primeira requisição cria o usuário de desenvolvimento (fora da contagem)
+    client.get('/v1/user/info')
+    return client
+
+
+@pytest.mark.parametrize('path, max_queries', sorted(QUERY_BUDGETS.items()))
+def test_endpoint_stays_within_query_budget(client, path, max_queries):
+    with assert_max_queries(max_queries, label=f"GET {path}"):
+        response = client.get(path)
+    assert response.status_code < 500
+
+
+def test_assert_max_queries_fails_above_budget(app):
+    with app.app_context():
+        with pytest.raises(AssertionError, match='2 consultas'):
+            with assert_max_queries(1, label='Bloco'):
+                SystemConfig.query.all()
+                SystemConfig.query.all()
@@ -0,0 +1,57 @@
+"""Pool de sessões SMTP: envio em lote e falha rápida sem sessão"""
+import time
+import socket
+from email.message import EmailMessage
+
+from src.services.smtp_pool import SMTPConnectionPool
+from src.services.smtp_sink import SMTPSink
+
+
+def messages(count):
+    batch = []
+    for i in range(count):
+        message = EmailMessage()
+        message['From'] = 'noreply@example.com'
+        message['To'] = f"user{i}@example.com"
+        message['Subject'] = 'teste'
+        message.set_content('ok')
+        batch.append(message)
+    return batch
+
+
+def closed_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def test_batch_shares_one_session():
+    with SMTPSink() as sink:
+        pool = SMTPConnectionPool(sink.host, sink.port, starttls=False)
+        assert pool.send_many(messages(20)) == [True] * 20
+        pool.close_all()
+    assert sink.connections == 1
+    assert len(sink.messages) == 20
+
+
+def test_server_down_fails_the_batch_with_one_connect_attempt(monkeypatch):
+    pool = SMTPConnectionPool('127.0.0.1', closed_port(), starttls=False, timeout=0.5)
+    attempts = []
+    original = pool._open
+    monkeypatch.setattr(pool, '_open', lambda: attempts.append(1) or original())
+
+    assert pool.send_many(messages(200)) == [False] * 200
+    assert len(attempts) == 1
+
+
+def test_no_free_session_fails_the_batch_after_one_timeout():
+    with SMTPSink() as sink:
+        pool = SMTPConnectionPool(sink.host, sink.port, starttls=False, size=1, timeout=0.2)
+        held = pool._acquire()  # Outra thread ocupando a única sessão
+        try:
+            started = time.monotonic()
+            assert pool.send_many(messages(50)) == [False] * 50
+            assert time.monotonic() - started < 1
+        finally:
+            pool._release(held)
+        pool.close_all()
@@ -0,0 +1,42 @@
+"""Busca de usuários: ordem por relevância feita no SQL, antes do LIMIT"""
+import uuid
+
+import pytest
+
+from src.models.token_control import db, UserAccount
+from src.services.user_search_service import UserSearchService
+
+
+@pytest.fixture
+def term(app):
+    """Termo único por teste (o banco é compartilhado pela sessão de testes)"""
+    with app.app_context():
+        yield f"qz{uuid.uuid4().hex[:6]}"
+
+
+def add_users(*users):
+    for email, name in users:
+        db.session.add(UserAccount(librechat_user_id=f"lc-{uuid.uuid4().hex}", email=email, name=name))
+    db.session.commit()
+
+
+def test_exact_match_is_returned_even_when_the_tier_overflows_the_limit(term):
+    add_users(*[(f"{term}.{i:02d}@example.com", f"{term} Silva {i}") for i in range(30)])
+    add_users((f"outro-{term}@example.com", term.capitalize()))  # Nome exatamente igual ao termo, inserido por último
+
+    results = UserSearchService().search(term, limit=5)
+
+    assert len(results) == 5
+    assert results[0]['name'] == term.capitalize()
+    assert {result['match'] for result in results} == {'prefix'}
+
+
+def test_substring_tier_ranks_earlier_and_shorter_matches_first(term):
+    add_users((f"aaaaaaaa-{term}@example.com", None),
+              (f"a-{term}@example.com", None),
+              (f"a-{term}-longo@example.com", None))
+
+    results = UserSearchService().search(term, limit=2)
+
+    assert [result['email'] for result in results] == [f"a-{term}@example.com", f"a-{term}-longo@example.com"]
+    assert {result['match'] for result in results} == {'substring'}